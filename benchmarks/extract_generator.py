@@ -0,0 +1,166 @@
+import argparse
+import csv
+import random
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Union
+
+_SPEAKER_TAGS = ["<#spk_1>", "<#spk_2>", "<#spk_3>"]
+_WORDS = ["hello", "how", "are", "you", "<um>", "not", "good", "I", "was", "hit", "by", "a", "truck", "<unk>", "<interjection>ohh</interjection>", "yeah", "."]
+_PACKAGE_DATES = [f"202206{day:02d}" for day in range(1, 31)]
+
+
+@dataclass(frozen=True)
+class ExtractFixture:
+    cloud_uri: Path
+    extract_file: Path
+    qa_report_db_uri: Path
+    input_metadata_uri: Path
+    audio_files: List[str]
+    records: int
+
+
+def format_duration(milliseconds: int) -> str:
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def generate_audio_file(directory_index: int, file_index: int) -> str:
+    package_date = _PACKAGE_DATES[directory_index % len(_PACKAGE_DATES)]
+    return f"/audio-efs/Test_04803_MUL_MUL_{directory_index:04d}_{package_date}-192230_{file_index:04d}_solo2-17-A-{file_index}.wav"
+
+
+def generate_directory_name(directory_index: int) -> str:
+    package_date = _PACKAGE_DATES[directory_index % len(_PACKAGE_DATES)]
+    return f"Axel_04803_ENG_MUL_{directory_index:04d}_{package_date}-192230"
+
+
+def generate_transcription(rng: random.Random, speakers: int, no_speech_ratio: float, continuation: bool, continued: bool) -> str:
+    tokens = []
+    for i in range(speakers):
+        text = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 8)))
+        speaker_tag = "" if continued and i == 0 else f"{rng.choice(_SPEAKER_TAGS)} "
+        is_no_speech = speaker_tag and i < speakers - 1 and rng.random() < no_speech_ratio
+        token = "<#no-speech>" if is_no_speech else f"{speaker_tag}{text}"
+        tokens.append(token if i == speakers - 1 else f"{token} [{rng.randint(0, 9)}.{rng.randint(0, 999):03d}]")
+    return " ".join(tokens) + (" ~" if continuation else "")
+
+
+def generate_extract_file(
+    file: Union[str, Path],
+    records: int,
+    records_per_audio_file: int = 20,
+    files_per_directory: int = 50,
+    tilde_ratio: float = 0.1,
+    no_speech_ratio: float = 0.05,
+    multi_speaker_ratio: float = 0.3,
+    max_speakers: int = 4,
+    seed: int = 0,
+) -> List[str]:
+    rng = random.Random(seed)
+    audio_files = []
+    Path(file).parent.mkdir(parents=True, exist_ok=True)
+    with open(file, "w") as f:
+        continued = False
+        for record in range(records):
+            audio_file_index, position = divmod(record, records_per_audio_file)
+            if position == 0:
+                audio_files.append(generate_audio_file(directory_index=audio_file_index // files_per_directory, file_index=audio_file_index))
+                start_ms = rng.randint(0, 500)
+
+            is_last_of_audio_file = position == records_per_audio_file - 1 or record == records - 1
+            speakers = rng.randint(2, max_speakers) if rng.random() < multi_speaker_ratio else 1
+            continuation = not is_last_of_audio_file and not (continued and speakers == 1) and rng.random() < tilde_ratio
+            end_ms = start_ms + rng.randint(500, 10_000)
+            f.write(f"FILE: {audio_files[-1]}\n")
+            f.write(f"INTERVAL: {format_duration(start_ms)} {format_duration(end_ms)}\n")
+            f.write(f"TRANSCRIPTION: {generate_transcription(rng, speakers=speakers, no_speech_ratio=no_speech_ratio, continuation=continuation, continued=continued)}\n")
+            f.write("HYPOTHESIS: \nLABELS: \nUSER: User41\n\n")
+            start_ms, continued = end_ms, continuation
+    return audio_files
+
+
+def generate_metadata_fixtures(audio_files: List[str], qa_report_db_uri: Union[str, Path], input_metadata_uri: Union[str, Path], files_per_directory: int = 50, seed: int = 0):
+    rng = random.Random(seed)
+    directory_names = sorted({generate_directory_name(directory_index=i // files_per_directory) for i in range(len(audio_files))})
+    Path(input_metadata_uri).parent.mkdir(parents=True, exist_ok=True)
+    with open(input_metadata_uri, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["directory_name", "pin"])
+        writer.writerows([directory_name, f"P{rng.randint(0, 999999):06d}"] for directory_name in directory_names)
+
+    Path(qa_report_db_uri).unlink(missing_ok=True)
+    with closing(sqlite3.connect(qa_report_db_uri)) as con:
+        con.execute(
+            "CREATE TABLE qa_report (directory_name TEXT,corpus_code TEXT,file_path TEXT,audio_duration float,user_id TEXT,email TEXT,gender TEXT,age INTEGER, "
+            "ethnicity TEXT,native_language TEXT,dialect TEXT)"
+        )
+        con.executemany(
+            "INSERT INTO qa_report VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    generate_directory_name(directory_index=i // files_per_directory),
+                    f"solo2-17-A-{i}",
+                    audio_file,
+                    round(rng.uniform(5, 600), 2),
+                    str(rng.randint(10_000_000, 99_999_999)),
+                    f"user{i // files_per_directory}@example.com",
+                    rng.choice(["FEMALE", "MALE"]),
+                    rng.randint(18, 80),
+                    "Caucasian",
+                    rng.choice(["English", "French", "Spanish"]),
+                    "Southern",
+                )
+                for i, audio_file in enumerate(audio_files)
+            ),
+        )
+        con.commit()
+
+
+def generate_extract_fixture(cloud_uri: Union[str, Path], records: int, records_per_audio_file: int = 20, files_per_directory: int = 50, seed: int = 0, **kwargs) -> ExtractFixture:
+    cloud_uri = Path(cloud_uri)
+    extract_file = cloud_uri / "extract_files" / "extract.txt"
+    qa_report_db_uri = cloud_uri / "qa_report.db"
+    input_metadata_uri = cloud_uri / "input_metadata" / "input_file.csv"
+    audio_files = generate_extract_file(
+        file=extract_file, records=records, records_per_audio_file=records_per_audio_file, files_per_directory=files_per_directory, seed=seed, **kwargs
+    )
+    generate_metadata_fixtures(
+        audio_files=audio_files, qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, files_per_directory=files_per_directory, seed=seed
+    )
+    return ExtractFixture(
+        cloud_uri=cloud_uri, extract_file=extract_file, qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, audio_files=audio_files, records=records
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic extract file with its matching qa_report.db and input_file.csv fixtures.")
+    parser.add_argument("cloud_uri", type=Path)
+    parser.add_argument("--records", type=int, default=1_000)
+    parser.add_argument("--records-per-audio-file", type=int, default=20)
+    parser.add_argument("--files-per-directory", type=int, default=50)
+    parser.add_argument("--tilde-ratio", type=float, default=0.1)
+    parser.add_argument("--no-speech-ratio", type=float, default=0.05)
+    parser.add_argument("--multi-speaker-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixture = generate_extract_fixture(
+        cloud_uri=args.cloud_uri,
+        records=args.records,
+        records_per_audio_file=args.records_per_audio_file,
+        files_per_directory=args.files_per_directory,
+        tilde_ratio=args.tilde_ratio,
+        no_speech_ratio=args.no_speech_ratio,
+        multi_speaker_ratio=args.multi_speaker_ratio,
+        seed=args.seed,
+    )
+    print(f"records={fixture.records} audio_files={len(fixture.audio_files)} extract_file={fixture.extract_file} qa_report_db_uri={fixture.qa_report_db_uri}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import random
+import timeit
+
+import pandas as pd
+
+from transcribe_etl.load.s3_bucket import parse_package_date, parse_package_dates, remove_audio_file_prefix
+
+
+def generate_audio_files(rows: int, seed: int = 0) -> pd.Series:
+    rng = random.Random(seed)
+    package_dates = [f"202206{day:02d}" for day in range(1, 31)]
+    return pd.Series(
+        [f"/audio-efs/Test_04803_MUL_MUL_{rng.randint(0, 9999):04d}_{rng.choice(package_dates)}-192230_{rng.randint(0, 9999):04d}_solo2-17-A-{i}.wav" for i in range(rows)]
+    )
+
+
+def derive_columns_row_by_row(files: pd.Series):
+    return files.apply(parse_package_date), files.apply(lambda f: f.strip("/audio-efs/"))
+
+
+def derive_columns_vectorized(files: pd.Series):
+    return parse_package_dates(files=files), remove_audio_file_prefix(files=files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the package_date and filename derivation of lookup_transcript_metadata.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = generate_audio_files(rows=args.rows)
+    row_by_row = min(timeit.repeat(lambda: derive_columns_row_by_row(files=files), number=1, repeat=args.repeat))
+    vectorized = min(timeit.repeat(lambda: derive_columns_vectorized(files=files), number=1, repeat=args.repeat))
+    assert derive_columns_row_by_row(files=files)[0].equals(derive_columns_vectorized(files=files)[0])
+
+    print(f"rows={args.rows} row_by_row={row_by_row:.3f}s vectorized={vectorized:.3f}s speedup={row_by_row / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Union
+
+from dataclasses_json import DataClassJsonMixin
+
+from benchmarks.tokenizer_benchmark import generate_transcription_lines
+from transcribe_etl.transform.model import Transcription, Segment, TxData
+from transcribe_etl.transform.tokenizer import tokenize_transcription
+
+
+@dataclass(frozen=True)
+class LegacyTranscription(DataClassJsonMixin):
+    speaker_tag: str
+    text: str
+    eol: str
+    size: int
+
+
+@dataclass(frozen=True)
+class LegacySegment(DataClassJsonMixin):
+    file: str
+    speaker_tag: str
+    text: str
+    eol: Union[str, int]
+    size: int
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class LegacyTxData(DataClassJsonMixin):
+    speaker_tag: str
+    text: str
+    start: int
+    end: int
+
+
+def build_legacy_records(transcriptions: List[Transcription]) -> List[dict]:
+    records = []
+    for t in transcriptions:
+        transcription = LegacyTranscription.from_dict(t._asdict())
+        s = LegacySegment(**transcription.to_dict(), start=0, end=1000, file="file.wav")
+        records.append(LegacyTxData(speaker_tag=s.speaker_tag, text=s.text, start=s.start, end=s.end))
+    return [x.to_dict() for x in records]
+
+
+def build_records(transcriptions: List[Transcription]) -> List[dict]:
+    records = []
+    for t in transcriptions:
+        s = Segment(file="file.wav", speaker_tag=t.speaker_tag, text=t.text, eol=t.eol, size=t.size, start=0, end=1000)
+        records.append(TxData(speaker_tag=s.speaker_tag, text=s.text, start=s.start, end=s.end))
+    return [x._asdict() for x in records]
+
+
+def measure_peak_memory(func: Callable[[], List]) -> int:
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-segment allocation and time of the transform record types.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    transcriptions = [t for line in generate_transcription_lines(rows=args.rows) for t in tokenize_transcription(text=line)]
+    size = len(transcriptions)
+    assert build_legacy_records(transcriptions=transcriptions) == build_records(transcriptions=transcriptions)
+
+    for name, func in [("legacy", build_legacy_records), ("records", build_records)]:
+        elapsed = min(timeit.repeat(lambda: func(transcriptions=transcriptions), number=1, repeat=args.repeat))
+        peak = measure_peak_memory(lambda: func(transcriptions=transcriptions))
+        print(f"{name}: segments={size} time={elapsed:.3f}s per_segment={elapsed / size * 1e6:.2f}us peak={peak / 1024 / 1024:.1f}MiB per_segment={peak / size:.0f}B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import collections
+import json
+import os
+import platform
+import re
+import subprocess  # nosec B404
+import tempfile
+import timeit
+import uuid
+from datetime import datetime, timezone
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from unittest import mock
+
+import pandas as pd
+from loguru import logger
+
+from benchmarks.extract_generator import ExtractFixture, generate_extract_fixture
+from transcribe_etl.extract.metadata import MetadataIndex
+from transcribe_etl.extract.model import StageFolder
+from transcribe_etl.load import s3_bucket
+from transcribe_etl.runner import extract_data, transcribe_from_txt, stream_from_txt, load_data, data_pipeline
+from transcribe_etl.transform.text_extract import TextExtractParser, SegmentProcessor
+
+_RESULTS_URI = Path(__file__).parent / "results" / "results.jsonl"
+_DEFAULT_SIZES = [1_000, 100_000]
+_SHARD_SIZE = 1024 * 1024
+
+
+def consume(iterable: Iterable):
+    collections.deque(iterable, maxlen=0)
+
+
+class BenchmarkContext:
+    def __init__(self, fixture: ExtractFixture, output_folder: Path):
+        self.fixture = fixture
+        self.output_folder = output_folder
+        self.parser = TextExtractParser(segment_processor=SegmentProcessor())
+
+    @cached_property
+    def stage_folder(self) -> StageFolder:
+        return StageFolder(extract_files=[self.fixture.extract_file])
+
+    # Every artefact is built on first use and dropped by release() after each benchmark, so only the inputs of the running benchmark are held in memory.
+    def release(self):
+        for name, value in vars(type(self)).items():
+            if isinstance(value, cached_property):
+                self.__dict__.pop(name, None)
+
+    def iter_lines(self) -> Iterator[str]:
+        with open(self.fixture.extract_file) as f:
+            yield from f
+
+    def iter_segments(self) -> Iterator:
+        return self.parser.iter_segments(extracted_transcriptions=self.parser.iter_timed_transcriptions(lines=self.iter_lines()))
+
+    @cached_property
+    def text(self) -> str:
+        with open(self.fixture.extract_file) as f:
+            return f.read()
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return list(self.iter_lines())
+
+    @cached_property
+    def extracted_transcriptions(self) -> list:
+        return list(self.parser.iter_timed_transcriptions(lines=self.iter_lines()))
+
+    @cached_property
+    def transcriptions(self) -> list:
+        return [self.parser.parse_and_process_transcriptions(text=x.transcription) for x in self.extracted_transcriptions]
+
+    @cached_property
+    def eols(self) -> List[str]:
+        return [eol for line in self.iter_lines() for eol in re.findall(r"\[\d+\.\d+\]|~", line)]
+
+    @cached_property
+    def segments(self) -> list:
+        return list(self.iter_segments())
+
+    @cached_property
+    def combined_segments(self) -> list:
+        return list(self.parser.segment_processor.iter_combined_segments(segments=self.iter_segments()))
+
+    @cached_property
+    def tx_data_groups(self) -> list:
+        return self.parser.segment_processor.aggregate_segments(segments=self.parser.segment_processor.iter_combined_segments(segments=self.iter_segments()))
+
+    @cached_property
+    def shards(self) -> list:
+        return TextExtractParser.split_into_shards(file=self.fixture.extract_file, shard_size=_SHARD_SIZE)
+
+    @cached_property
+    def files(self) -> List[str]:
+        return [group.file for group in self.tx_data_groups]
+
+    @cached_property
+    def metadata_index(self) -> MetadataIndex:
+        return s3_bucket.get_metadata_index(uri=self.output_folder / "metadata_index.db")
+
+    @cached_property
+    def transcription_lookup_df(self) -> pd.DataFrame:
+        return s3_bucket.lookup_transcript_metadata(tx_data_groups=self.tx_data_groups, metadata_index=self.metadata_index)
+
+    @cached_property
+    def transcript_outputs(self) -> list:
+        return list(s3_bucket.iter_transcript_outputs(tx_data_groups=self.tx_data_groups, metadata_index=self.metadata_index))
+
+
+# The inputs a benchmark needs are bound as default arguments, so they are built once before it is timed instead of inside its first repeat.
+BENCHMARKS: Dict[str, Callable[[BenchmarkContext], Callable[[], Any]]] = {
+    # transform/text_extract.py
+    "text_extract.TextExtractParser.execute": lambda ctx: lambda: ctx.parser.execute(file=ctx.fixture.extract_file),
+    "text_extract.TextExtractParser.stream": lambda ctx: lambda: consume(ctx.parser.stream(file=ctx.fixture.extract_file)),
+    "text_extract.TextExtractParser.split_into_shards": lambda ctx: lambda: TextExtractParser.split_into_shards(file=ctx.fixture.extract_file, shard_size=_SHARD_SIZE),
+    "text_extract.TextExtractParser.execute_shard": lambda ctx: lambda shards=ctx.shards: [ctx.parser.execute_shard(shard=shard) for shard in shards],
+    "text_extract.TextExtractParser.parse_timed_transcriptions": lambda ctx: lambda text=ctx.text: ctx.parser.parse_timed_transcriptions(text=text),
+    "text_extract.TextExtractParser.iter_timed_transcriptions": lambda ctx: lambda lines=ctx.lines: consume(ctx.parser.iter_timed_transcriptions(lines=lines)),
+    "text_extract.TextExtractParser.convert_to_segments": lambda ctx: lambda xs=ctx.extracted_transcriptions: ctx.parser.convert_to_segments(extracted_transcriptions=xs),
+    "text_extract.TextExtractParser.iter_segments": lambda ctx: lambda xs=ctx.extracted_transcriptions: consume(ctx.parser.iter_segments(extracted_transcriptions=xs)),
+    "text_extract.TextExtractParser.parse_and_process_transcriptions": lambda ctx: lambda xs=ctx.extracted_transcriptions: [
+        ctx.parser.parse_and_process_transcriptions(text=x.transcription) for x in xs
+    ],
+    "text_extract.TextExtractParser.parse_and_convert_eol": lambda ctx: lambda eols=ctx.eols: [TextExtractParser.parse_and_convert_eol(duration=eol) for eol in eols],
+    "text_extract.TextExtractParser.create_segments": lambda ctx: lambda xs=ctx.extracted_transcriptions, ts=ctx.transcriptions: [
+        ctx.parser.create_segments(extracted_transcription=x, segments=t) for x, t in zip(xs, ts)
+    ],
+    "text_extract.SegmentProcessor.combine_and_measure_segments": lambda ctx: lambda segments=ctx.segments: ctx.parser.segment_processor.combine_and_measure_segments(
+        segments=segments
+    ),
+    "text_extract.SegmentProcessor.iter_combined_segments": lambda ctx: lambda segments=ctx.segments: consume(
+        ctx.parser.segment_processor.iter_combined_segments(segments=segments)
+    ),
+    "text_extract.SegmentProcessor.aggregate_segments": lambda ctx: lambda segments=ctx.combined_segments: ctx.parser.segment_processor.aggregate_segments(segments=segments),
+    "text_extract.SegmentProcessor.iter_aggregated_segments": lambda ctx: lambda segments=ctx.combined_segments: consume(
+        ctx.parser.segment_processor.iter_aggregated_segments(segments=segments)
+    ),
+    "text_extract.SegmentProcessor.merge_tx_data_groups": lambda ctx: lambda groups=ctx.tx_data_groups: SegmentProcessor.merge_tx_data_groups(tx_data_groups=groups),
+    # load/s3_bucket.py
+    "s3_bucket.load_data_to_s3_bucket": lambda ctx: lambda groups=ctx.tx_data_groups: [
+        s3_bucket.load_data_to_s3_bucket(save_folder=ctx.output_folder / "load_data_to_s3_bucket", file_name=f"{i}_tx.json", data=[x.to_dict() for x in group.tx_data])
+        for i, group in enumerate(groups)
+    ],
+    "s3_bucket.parse_package_date": lambda ctx: lambda files=ctx.files: [s3_bucket.parse_package_date(filename=f) for f in files],
+    "s3_bucket.parse_package_dates": lambda ctx: lambda files=pd.Series(ctx.files): s3_bucket.parse_package_dates(files=files),
+    "s3_bucket.remove_audio_file_prefix": lambda ctx: lambda files=pd.Series(ctx.files): s3_bucket.remove_audio_file_prefix(files=files),
+    "s3_bucket.get_metadata_index": lambda ctx: lambda: s3_bucket.get_metadata_index(uri=ctx.output_folder / "metadata_index.db"),
+    "s3_bucket.lookup_transcript_metadata": lambda ctx: lambda groups=ctx.tx_data_groups, metadata_index=ctx.metadata_index: s3_bucket.lookup_transcript_metadata(
+        tx_data_groups=groups, metadata_index=metadata_index
+    ),
+    "s3_bucket.generate_tx_metadata_records": lambda ctx: lambda df=ctx.transcription_lookup_df: s3_bucket.generate_tx_metadata_records(transcription_lookup_df=df),
+    "s3_bucket.generate_output_paths": lambda ctx: lambda df=ctx.transcription_lookup_df: s3_bucket.generate_output_paths(transcription_lookup_df=df),
+    "s3_bucket.iter_transcript_outputs": lambda ctx: lambda groups=ctx.tx_data_groups, metadata_index=ctx.metadata_index: consume(
+        s3_bucket.iter_transcript_outputs(tx_data_groups=groups, metadata_index=metadata_index)
+    ),
+    "s3_bucket.generate_transcription_lookup_df": lambda ctx: lambda outputs=ctx.transcript_outputs: s3_bucket.generate_transcription_lookup_df(transcript_outputs=outputs),
+    # runner.py
+    "runner.extract_data": lambda ctx: lambda: extract_data(execution_id=uuid.uuid4(), container_name="extract_files", file_type="txt"),
+    "runner.transcribe_from_txt": lambda ctx: lambda: transcribe_from_txt(stage_folder=ctx.stage_folder),
+    "runner.transcribe_from_txt[parallel]": lambda ctx: lambda: transcribe_from_txt(stage_folder=ctx.stage_folder, workers=os.cpu_count(), shard_size=_SHARD_SIZE),
+    "runner.stream_from_txt": lambda ctx: lambda: consume(stream_from_txt(stage_folder=ctx.stage_folder)),
+    "runner.load_data": lambda ctx: lambda groups=ctx.tx_data_groups: load_data(data=groups),
+    "runner.data_pipeline": lambda ctx: lambda: data_pipeline(),
+    "runner.data_pipeline[streaming]": lambda ctx: lambda: data_pipeline(streaming=True),
+    "runner.data_pipeline[async]": lambda ctx: lambda: data_pipeline(asynchronous=True),
+}
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()  # nosec B603 B607
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(results_uri: Path) -> List[dict]:
+    if not results_uri.exists():
+        return []
+    with open(results_uri) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_result(results_uri: Path, result: dict):
+    results_uri.parent.mkdir(parents=True, exist_ok=True)
+    with open(results_uri, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def find_previous_result(results: List[dict], benchmark: str, records: int) -> Optional[dict]:
+    return next((r for r in reversed(results) if r["benchmark"] == benchmark and r["records"] == records), None)
+
+
+def run_benchmarks(sizes: List[int], pattern: str, repeat: int, results_uri: Path, seed: int):
+    previous_results = load_results(results_uri=results_uri)
+    run = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": get_commit(), "python": platform.python_version(), "host": platform.node()}
+    benchmarks = {name: build for name, build in BENCHMARKS.items() if re.search(pattern, name)}
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="transcribe_etl_benchmark_") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            fixture = generate_extract_fixture(cloud_uri=tmp_dir / "cloud", records=size, seed=seed)
+            env = {"CLOUD_URI": str(fixture.cloud_uri), "QA_REPORT_DB_URI": str(fixture.qa_report_db_uri), "S3_BUCKET_URI": str(tmp_dir / "s3_bucket")}
+            with mock.patch.dict(os.environ, env), mock.patch("transcribe_etl.extract.datasynchronizer._IMAGINARY_STAGING_URI", tmp_dir / "stage"), mock.patch(
+                "transcribe_etl.runner._ROOT_FOLDER", tmp_dir
+            ):
+                context = BenchmarkContext(fixture=fixture, output_folder=tmp_dir / "output")
+                for name, build in benchmarks.items():
+                    func = build(context)
+                    elapsed = min(timeit.repeat(func, number=1, repeat=repeat))
+                    context.release()
+                    result = {**run, "benchmark": name, "records": size, "seconds": round(elapsed, 6), "records_per_second": round(size / elapsed, 1)}
+                    previous_result = find_previous_result(results=previous_results, benchmark=name, records=size)
+                    change = f" ({elapsed / previous_result['seconds']:.2f}x of {previous_result['commit']})" if previous_result else ""
+                    print(f"{name} records={size} time={elapsed:.3f}s records/s={size / elapsed:.0f}{change}")
+                    save_result(results_uri=results_uri, result=result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the public functions of text_extract.py, s3_bucket.py and runner.py on synthetic extract files.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=_DEFAULT_SIZES, help="Number of extract records, ie. 1000 100000 10000000")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name matches this regex")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--results", type=Path, default=_RESULTS_URI, help="JSON lines file the results are appended to and compared against")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.remove()
+    run_benchmarks(sizes=args.sizes, pattern=args.filter, repeat=args.repeat, results_uri=args.results, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
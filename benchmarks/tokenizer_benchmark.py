@@ -0,0 +1,53 @@
+import argparse
+import random
+import re
+import timeit
+from typing import List, Union
+
+from transcribe_etl.transform.model import Transcription
+from transcribe_etl.transform.tokenizer import tokenize_transcription
+
+_SPEAKER_TAGS = ["TRANSCRIPTION: ", "<#Bodyguard>", "<#Mom>", "<#no-speech>"]
+
+
+def generate_transcription_lines(rows: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(rows):
+        tokens = [f"{rng.choice(_SPEAKER_TAGS[1:])}hello <#pause> there {rng.randint(0, 99)}[{rng.randint(0, 9)}.{rng.randint(0, 999):03d}]" for _ in range(rng.randint(1, 4))]
+        lines.append(f"TRANSCRIPTION: {''.join(tokens)}{rng.choice(['~', ''])}\n")
+    return lines
+
+
+def legacy_parse_and_convert_eol(duration: str) -> Union[int, str]:
+    match = re.match(r"\[(\d+\.\d+)\]", duration)
+    return int(float(match.groups()[0]) * 1000) if match else duration
+
+
+def legacy_tokenize_transcription(text: str) -> List[Transcription]:
+    pattern = r"(?P<speaker_tag>TRANSCRIPTION: (?!<\#.+>)|\<\#.+?\>)(?P<text>.+?)(?P<eol>\[\d+\.\d+\]|~|\n)"
+    transcriptions = [x.groupdict() for x in re.finditer(pattern, text)]
+    new_transcriptions = []
+    for x in transcriptions:
+        x["eol"] = legacy_parse_and_convert_eol(duration=x["eol"])
+        x["size"] = len(transcriptions)
+        new_transcriptions.append(Transcription(**x))
+    return new_transcriptions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TRANSCRIPTION line tokenizer against the legacy regex + float implementation.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = generate_transcription_lines(rows=args.rows)
+    legacy = min(timeit.repeat(lambda: [legacy_tokenize_transcription(text=line) for line in lines], number=1, repeat=args.repeat))
+    tokenizer = min(timeit.repeat(lambda: [tokenize_transcription(text=line) for line in lines], number=1, repeat=args.repeat))
+    mismatches = sum(legacy_tokenize_transcription(text=line) != tokenize_transcription(text=line) for line in lines)
+
+    print(f"rows={args.rows} legacy={legacy:.3f}s tokenizer={tokenizer:.3f}s speedup={legacy / tokenizer:.1f}x float_truncation_fixes={mismatches}")
+
+
+if __name__ == "__main__":
+    main()
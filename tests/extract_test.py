@@ -1,11 +1,16 @@
 import os
+import shutil
+import sqlite3
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 from pathlib import Path
 
 import pytest
 
-from transcribe_etl.runner import extract_data
+from transcribe_etl.extract.metadata import MetadataIndex
+from transcribe_etl.extract.model import StagingStrategy
+from transcribe_etl.runner import extract_data, transcribe_from_txt
 
 
 @mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
@@ -20,3 +25,95 @@ def test_extract_will_find_file_based_on_extension(file_type: str, exist: bool,
 def test_extract_will_sync_data_from_cloud_container_to_staging(execution_id: uuid.UUID):
     staging_folder = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id)
     assert all([f.exists() for f in staging_folder.extract_files])
+
+
+def test_extract_incremental_sync_will_skip_files_that_are_unchanged_since_the_last_committed_run(tmp_path, execution_id: uuid.UUID):
+    shutil.copytree(Path(__file__).parent / "data" / "extract_files", tmp_path / "cloud" / "extract_files")
+    with mock.patch.dict(os.environ, {"CLOUD_URI": str(tmp_path / "cloud")}):
+        first_run = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, incremental=True)
+        uncommitted_run = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, incremental=True)
+        uncommitted_run.manifest.commit()
+        committed_run = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, incremental=True)
+
+        with open(tmp_path / "cloud" / "extract_files" / "extract.txt", "a") as f:
+            f.write("\n")
+        changed_run = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, incremental=True)
+
+    assert [f.name for f in first_run.extract_files] == ["extract.txt"]
+    assert [f.name for f in uncommitted_run.extract_files] == ["extract.txt"]
+    assert committed_run.extract_files == []
+    assert [f.name for f in changed_run.extract_files] == ["extract.txt"]
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@pytest.mark.parametrize("staging_strategy", list(StagingStrategy))
+def test_extract_will_stage_files_with_every_staging_strategy(staging_strategy: StagingStrategy, execution_id: uuid.UUID):
+    staging_folder = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, staging_strategy=staging_strategy, staging_workers=2)
+    source_file = Path(__file__).parent / "data" / "extract_files" / "extract.txt"
+    assert [f.read_bytes() for f in staging_folder.extract_files] == [source_file.read_bytes()]
+    assert staging_folder.memory_map == (staging_strategy == StagingStrategy.NO_STAGE)
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+def test_extract_without_staging_will_let_the_parser_memory_map_the_source_files(execution_id: uuid.UUID):
+    memory_mapped_folder = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id, staging_strategy=StagingStrategy.NO_STAGE)
+    staging_folder = extract_data(container_name="extract_files", file_type="txt", execution_id=execution_id)
+    assert transcribe_from_txt(stage_folder=memory_mapped_folder) == transcribe_from_txt(stage_folder=staging_folder)
+
+
+def test_metadata_index_will_only_be_rebuilt_when_its_sources_change(tmp_path):
+    qa_report_db_uri = tmp_path / "qa_report_test.db"
+    shutil.copy(Path(__file__).parent / "data" / "qa_report_test.db", qa_report_db_uri)
+    input_metadata_uri = Path(__file__).parent / "data" / "input_metadata" / "input_file.csv"
+    file = "/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav"
+    metadata_index = MetadataIndex(qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, uri=tmp_path / "metadata_index.db")
+    metadata_index.refresh()
+    assert [row[2] for row in metadata_index.probe(file=file)] == ["solo2-17-A-1"]
+    assert metadata_index.probe(file="/audio-efs/TEST_NOT_IN_DB.wav") == []
+    metadata_index.close()
+
+    reopened_index = MetadataIndex(qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, uri=tmp_path / "metadata_index.db")
+    with mock.patch.object(MetadataIndex, "_build") as build:
+        reopened_index.refresh()
+        build.assert_not_called()
+
+    with sqlite3.connect(qa_report_db_uri) as con:
+        con.execute("UPDATE qa_report SET corpus_code = 'solo2-17-A-2' WHERE file_path = ?", (file,))
+    os.utime(qa_report_db_uri, ns=(0, 0))
+    reopened_index.refresh()
+    assert [row[2] for row in reopened_index.probe(file=file)] == ["solo2-17-A-2"]
+
+
+def test_metadata_index_will_look_up_a_batch_of_files_like_it_probes_them(tmp_path):
+    qa_report_db_uri = Path(__file__).parent / "data" / "qa_report_test.db"
+    input_metadata_uri = Path(__file__).parent / "data" / "input_metadata" / "input_file.csv"
+    files = ["/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav", "/audio-efs/TEST_NOT_IN_DB.wav"]
+    metadata_index = MetadataIndex(qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, uri=tmp_path / "metadata_index.db")
+    metadata_index.refresh()
+
+    metadata_df = metadata_index.lookup(files=files + files)
+
+    assert list(metadata_df.itertuples(index=False, name=None)) == [row for file in files for row in metadata_index.probe(file=file)]
+    assert metadata_index.lookup(files=[]).empty
+    metadata_index.close()
+
+
+def test_metadata_index_will_be_built_once_when_refreshed_concurrently(tmp_path):
+    qa_report_db_uri = Path(__file__).parent / "data" / "qa_report_test.db"
+    input_metadata_uri = Path(__file__).parent / "data" / "input_metadata" / "input_file.csv"
+    file = "/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav"
+    build = MetadataIndex._build
+
+    def refresh_and_probe(_) -> list:
+        metadata_index = MetadataIndex(qa_report_db_uri=qa_report_db_uri, input_metadata_uri=input_metadata_uri, uri=tmp_path / "metadata_index.db")
+        try:
+            metadata_index.refresh()
+            return metadata_index.probe(file=file)
+        finally:
+            metadata_index.close()
+
+    with mock.patch.object(MetadataIndex, "_build", autospec=True, side_effect=build) as mock_build, ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(refresh_and_probe, range(8)))
+
+    assert mock_build.call_count == 1
+    assert all(len(result) == 1 and result == results[0] for result in results)
@@ -1,10 +1,31 @@
 import json
 import os
+import sqlite3
 from pathlib import Path
 from unittest import mock
 
+import pandas as pd
+import pytest
+
+from benchmarks.extract_generator import generate_extract_fixture
+from transcribe_etl.load.backend import S3Backend, create_storage_backend, LocalFileSystemBackend
+from transcribe_etl.load.fingerprint import FingerprintIndex, compute_fingerprint
+from transcribe_etl.extract.helper import get_transcription_metadata
+from transcribe_etl.load.s3_bucket import (
+    generate_output_paths,
+    generate_tx_metadata_records,
+    get_metadata_index,
+    iter_transcript_outputs,
+    parse_package_date,
+    parse_package_dates,
+    remove_audio_file_prefix,
+)
+from transcribe_etl.load.serializer import StdlibJsonSerializer, create_serializer
+from transcribe_etl.load.writer import S3BucketWriter
 from transcribe_etl.runner import load_data
+from transcribe_etl.telemetry import Telemetry
 from transcribe_etl.transform.model import TxDataGroup, TxData
+from transcribe_etl.transform.text_extract import TextExtractParser, SegmentProcessor
 
 
 @mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
@@ -101,6 +122,29 @@ def test_load_data_will_store_all_json_into_no_pin_folder_if_pin_not_found_in_me
     assert meta_json.exists()
 
 
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_create_the_sub_folders_of_nested_audio_files(tmp_path):
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/sub-folder/efs_20220628_TEST_NOT_IN_DB.wav",
+            tx_data=[TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045)],
+        )
+    ]
+
+    tx_package_folder = tmp_path / "s3_bucket_test" / "2022-06-28" / "no-pin" / "sub-folder"
+    tx_json = tx_package_folder / "efs_20220628_TEST_NOT_IN_DB_tx.json"
+    meta_json = tx_package_folder / "efs_20220628_TEST_NOT_IN_DB_meta.json"
+
+    assert not tx_package_folder.exists()
+
+    load_data(data=tx_data)
+
+    assert tx_json.exists()
+    assert meta_json.exists()
+
+
 @mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
 @mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
 @mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
@@ -123,3 +167,385 @@ def test_load_data_will_use_the_audio_filename_to_store_it_into_json(tmp_path):
 
     assert not incorrect_audio_filename.exists()
     assert correct_audio_filename.exists()
+
+
+def test_s3_bucket_writer_will_save_json_files_concurrently_and_count_the_throughput(tmp_path):
+    package_folder = tmp_path / "s3_bucket_test" / "2022-06-05"
+    with S3BucketWriter(max_workers=2, max_pending=1) as writer:
+        writer.make_folders(folders=[package_folder / "P998123", package_folder / "no-pin"])
+        writer.write(save_folder=package_folder / "P998123", file_name="a_tx.json", data=[{"speaker_tag": "<#spk_2>"}])
+        writer.write(save_folder=package_folder / "P998123", file_name="a_meta.json", data={"corpus_code": "solo2-17-A-1"})
+        writer.write(save_folder=package_folder / "no-pin", file_name="b_tx.json", data=[])
+
+    assert writer.files_written == 3
+    assert writer.bytes_written == sum(f.stat().st_size for f in package_folder.glob("*/*.json"))
+    with open(package_folder / "P998123" / "a_meta.json", "r") as f:
+        assert json.loads(f.read()) == {"corpus_code": "solo2-17-A-1"}
+
+
+def test_s3_bucket_writer_will_default_the_number_of_workers(tmp_path):
+    with S3BucketWriter(max_workers=None) as writer:
+        writer.write(save_folder=tmp_path, file_name="a_tx.json", data=[])
+
+    assert writer.files_written == 1
+
+
+def test_s3_bucket_writer_will_raise_failed_writes_on_flush(tmp_path):
+    (tmp_path / "not-a-folder").touch()
+    writer = S3BucketWriter(max_workers=1)
+    writer.write(save_folder=tmp_path, file_name="not-a-folder/a_tx.json", data=[])
+    with pytest.raises(FileExistsError):
+        writer.flush()
+    writer.close()
+
+
+class _FlakyS3Client:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.objects = {}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Connection reset by peer")
+        self.objects[(Bucket, Key)] = Body
+
+
+def test_s3_backend_will_retry_failed_uploads_with_backoff():
+    client = _FlakyS3Client(failures=2)
+    backend = S3Backend(bucket="transcripts", prefix="s3_bucket_test", client=client, backoff=0)
+    with S3BucketWriter(backend=backend, max_workers=2) as writer:
+        writer.write(save_folder="2022-06-05/P998123", file_name="a_tx.json", data=[])
+
+    assert client.objects == {("transcripts", "s3_bucket_test/2022-06-05/P998123/a_tx.json"): b"[]"}
+
+
+def test_s3_backend_will_only_retry_transient_errors():
+    exceptions = pytest.importorskip("botocore.exceptions")
+
+    assert S3Backend._is_retryable(error=exceptions.EndpointConnectionError(endpoint_url="https://s3.amazonaws.com"))
+    assert S3Backend._is_retryable(error=exceptions.ReadTimeoutError(endpoint_url="https://s3.amazonaws.com"))
+    assert S3Backend._is_retryable(error=exceptions.ClientError(error_response={"Error": {"Code": "SlowDown"}}, operation_name="PutObject"))
+    assert not S3Backend._is_retryable(error=exceptions.NoCredentialsError())
+    assert not S3Backend._is_retryable(error=exceptions.ParamValidationError(report="Invalid bucket name"))
+    assert not S3Backend._is_retryable(error=exceptions.ClientError(error_response={"Error": {"Code": "AccessDenied"}}, operation_name="PutObject"))
+
+
+class _ETagS3Client(_FlakyS3Client):
+    def __init__(self):
+        super().__init__(failures=0)
+        self.puts = 0
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes):
+        self.puts += 1
+        super().put_object(Bucket=Bucket, Key=Key, Body=Body)
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        body = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(body), "ETag": f'"{compute_fingerprint(payload=body)}"'}
+
+
+def test_s3_bucket_writer_will_skip_unchanged_objects_by_etag():
+    client = _ETagS3Client()
+    for data in [[], [], [{"speaker_tag": "<#spk_2>"}]]:
+        with S3BucketWriter(backend=S3Backend(bucket="transcripts", client=client), max_workers=2, skip_unchanged=True) as writer:
+            writer.write(save_folder="2022-06-05/P998123", file_name="a_tx.json", data=data)
+
+    assert client.puts == 2
+    assert (writer.files_written, writer.files_skipped) == (1, 0)
+
+
+def test_s3_bucket_writer_will_skip_unchanged_objects_from_the_fingerprint_index(tmp_path):
+    client = _ETagS3Client()
+    client.head_object = mock.Mock(side_effect=AssertionError("the fingerprint index should avoid the HEAD requests"))
+    writers = []
+    for _ in range(2):
+        fingerprint_index = FingerprintIndex(uri=tmp_path / "output_fingerprints.db", destination="s3://transcripts")
+        fingerprint_index.record(key="2022-06-05/P998123/a_meta.json", fingerprint=compute_fingerprint(payload=b"{}"), size=2)
+        with S3BucketWriter(backend=S3Backend(bucket="transcripts", client=client), skip_unchanged=True, fingerprint_index=fingerprint_index) as writer:
+            writer.write(save_folder="2022-06-05/P998123", file_name="a_tx.json", data=[])
+            writer.write(save_folder="2022-06-05/P998123", file_name="a_meta.json", data={})
+        fingerprint_index.close()
+        writers.append(writer)
+
+    assert [(w.files_written, w.files_skipped) for w in writers] == [(1, 1), (0, 2)]
+    assert client.puts == 1
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test", "SKIP_UNCHANGED_OUTPUTS": "true", "OUTPUT_FINGERPRINT_INDEX_URI": "stage/output_fingerprints.db"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_trust_the_fingerprint_index_until_it_is_reset(tmp_path):
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            tx_data=[TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045)],
+        )
+    ]
+    load_data(data=tx_data)
+    outputs = list((tmp_path / "s3_bucket_test" / "2022-06-05" / "P998123").glob("*.json"))
+    for output in outputs:
+        output.unlink()
+
+    load_data(data=tx_data)
+    assert not any(output.exists() for output in outputs)
+
+    with mock.patch.dict(os.environ, {"OUTPUT_FINGERPRINT_INDEX_RESET": "true"}):
+        load_data(data=tx_data)
+    assert len(outputs) == 2 and all(output.exists() for output in outputs)
+    with sqlite3.connect(tmp_path / "stage" / "output_fingerprints.db") as con:
+        assert con.execute("SELECT DISTINCT destination FROM fingerprints").fetchall() == [((tmp_path / "s3_bucket_test").resolve().as_uri(),)]
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test", "SKIP_UNCHANGED_OUTPUTS": "true"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_count_the_written_and_skipped_outputs_in_the_run_report(tmp_path):
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            tx_data=[TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045)],
+        )
+    ]
+    telemetry = Telemetry(execution_id="test")
+    with telemetry.activate():
+        load_data(data=tx_data)
+        (tmp_path / "s3_bucket_test" / "2022-06-05" / "P998123" / "Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1_tx.json").write_bytes(b"[]")
+        load_data(data=tx_data)
+
+    assert telemetry.spans["load_data"].records_out == 3
+    assert telemetry.spans["load_data"].records_skipped == 1
+    assert "transcribe_etl_span_records_skipped_total{" in telemetry.to_prometheus()
+
+
+def test_iter_transcript_outputs_will_probe_the_same_metadata_as_the_dataframe_merge(tmp_path):
+    fixture = generate_extract_fixture(cloud_uri=tmp_path / "cloud", records=400, records_per_audio_file=4, files_per_directory=10)
+    tx_data_groups = TextExtractParser(segment_processor=SegmentProcessor()).execute(file=fixture.extract_file)
+    with mock.patch.dict(os.environ, {"CLOUD_URI": str(fixture.cloud_uri), "QA_REPORT_DB_URI": str(fixture.qa_report_db_uri)}):
+        transcript_outputs = list(iter_transcript_outputs(tx_data_groups=tx_data_groups, metadata_index=get_metadata_index(uri=tmp_path / "metadata_index.db")))
+
+    metadata_df = get_transcription_metadata(qa_report_db_uri=fixture.qa_report_db_uri, input_metadata_uri=fixture.input_metadata_uri)
+    metadata_rows = {row.file_path: row for row in metadata_df.itertuples()}
+    assert [x.file for x in transcript_outputs] == [group.file for group in tx_data_groups]
+    for x in transcript_outputs:
+        row = metadata_rows[x.file]
+        assert x.save_folder == f"{parse_package_date(filename=x.file)}/{row.pin}"
+        assert x.tx_metadata == {
+            "audio_file_name": x.file,
+            "audio_duration": row.audio_duration,
+            "corpus_code": row.corpus_code,
+            "speaker_id": {"email": row.email, "gender": row.gender, "native_language": row.native_language},
+        }
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_iter_transcript_outputs_will_save_the_files_without_metadata_into_the_no_pin_folder(tmp_path):
+    tx_data_groups = [
+        TxDataGroup(file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav", tx_data=[]),
+        TxDataGroup(file="/audio-efs/sub-folder/efs_20220628_TEST_NOT_IN_DB.wav", tx_data=[]),
+    ]
+
+    transcript_outputs = list(iter_transcript_outputs(tx_data_groups=tx_data_groups, metadata_index=get_metadata_index(uri=tmp_path / "metadata_index.db")))
+
+    assert [(x.save_folder, x.tx_file_name, x.meta_file_name) for x in transcript_outputs] == [
+        ("2022-06-05/P998123", "Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1_tx.json", "Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1_meta.json"),
+        ("2022-06-28/no-pin", "sub-folder/efs_20220628_TEST_NOT_IN_DB_tx.json", "sub-folder/efs_20220628_TEST_NOT_IN_DB_meta.json"),
+    ]
+    assert transcript_outputs[1].tx_metadata == {
+        "audio_file_name": "/audio-efs/sub-folder/efs_20220628_TEST_NOT_IN_DB.wav",
+        "audio_duration": None,
+        "corpus_code": None,
+        "speaker_id": {"email": None, "gender": None, "native_language": None},
+    }
+
+
+def test_parse_package_date_will_reject_files_without_a_package_date():
+    assert parse_package_date(filename="/audio-efs/Test_04803_MUL_MUL_0006_20220628-181850_0019_solo2-D-14.wav") == "2022-06-28"
+    with pytest.raises(ValueError):
+        parse_package_date(filename="/audio-efs/audio_without_package_date.wav")
+
+
+def test_generate_tx_metadata_records_and_output_paths_will_normalise_the_missing_metadata():
+    transcription_lookup_df = pd.DataFrame(
+        {
+            "file": ["/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav", "/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_TEST_NOT_IN_DB.wav"],
+            "package_date": ["2022-06-05", "2022-06-05"],
+            "pin": ["P998123", float("nan")],
+            "audio_duration": [19.12, float("nan")],
+            "corpus_code": ["solo2-17-A-1", None],
+            "email": ["xxx123xxx@hotmail.com", None],
+            "gender": ["FEMALE", None],
+            "native_language": ["Franch", None],
+        }
+    )
+
+    tx_metadata_records = generate_tx_metadata_records(transcription_lookup_df=transcription_lookup_df)
+    output_paths_df = generate_output_paths(transcription_lookup_df=transcription_lookup_df)
+
+    assert tx_metadata_records == [
+        {
+            "audio_file_name": "/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            "audio_duration": 19.12,
+            "corpus_code": "solo2-17-A-1",
+            "speaker_id": {"email": "xxx123xxx@hotmail.com", "gender": "FEMALE", "native_language": "Franch"},
+        },
+        {
+            "audio_file_name": "/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_TEST_NOT_IN_DB.wav",
+            "audio_duration": None,
+            "corpus_code": None,
+            "speaker_id": {"email": None, "gender": None, "native_language": None},
+        },
+    ]
+    assert output_paths_df["save_folder"].tolist() == ["2022-06-05/P998123", "2022-06-05/no-pin"]
+    assert output_paths_df["meta_file_name"].tolist()[0] == "Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1_meta.json"
+
+
+def test_parse_package_dates_will_match_the_row_by_row_parser():
+    files = pd.Series(["/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav", "/audio-efs/Test_04803_MUL_MUL_0006_20220628-181850_0019_solo2-D-14.wav"])
+    assert parse_package_dates(files=files).tolist() == files.apply(parse_package_date).tolist() == ["2022-06-05", "2022-06-28"]
+
+    with pytest.raises(ValueError):
+        parse_package_dates(files=pd.Series(["/audio-efs/audio_without_package_date.wav"]))
+
+
+def test_remove_audio_file_prefix_will_only_remove_the_leading_audio_folder():
+    files = pd.Series(["/audio-efs/audio_20220605_solo2-17-A-1.wav", "/audio-efs/sub-folder/efs_20220605.wav", "fused_20220605.wav"])
+    assert remove_audio_file_prefix(files=files).tolist() == ["audio_20220605_solo2-17-A-1.wav", "sub-folder/efs_20220605.wav", "fused_20220605.wav"]
+
+
+def test_create_storage_backend_will_pick_the_backend_from_the_uri(tmp_path):
+    local_backend = create_storage_backend(uri="s3_bucket_test", root_folder=tmp_path)
+    assert isinstance(local_backend, LocalFileSystemBackend)
+    assert local_backend.root == tmp_path / "s3_bucket_test"
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgspec"])
+def test_json_serializers_will_encode_transcripts_and_metadata_to_the_same_bytes(name):
+    if name != "json":
+        pytest.importorskip(name)
+    serializer = create_serializer(name=name)
+    tx_data = [TxData(speaker_tag="<#spk_2>", text="héllo, how are you", start=45, end=5045), TxData(speaker_tag="", text="<#no-speech>", start=5045, end=6446)]
+    metadata = {"audio_file_name": "a.wav", "audio_duration": 19.12, "corpus_code": None, "speaker_id": {"email": None, "gender": "FEMALE", "native_language": "Franch"}}
+
+    assert serializer.encode_records(records=tx_data) == StdlibJsonSerializer().encode([x.to_dict() for x in tx_data])
+    assert (
+        serializer.encode_records(records=tx_data)
+        == '[{"speaker_tag":"<#spk_2>","text":"héllo, how are you","start":45,"end":5045},{"speaker_tag":"","text":"<#no-speech>","start":5045,"end":6446}]'.encode()
+    )
+    assert serializer.encode(metadata) == StdlibJsonSerializer().encode(metadata)
+
+
+@pytest.mark.parametrize("name", ["orjson", "msgspec"])
+def test_json_serializers_will_encode_every_value_to_the_same_bytes_as_the_stdlib(name):
+    pytest.importorskip(name)
+    serializer = create_serializer(name=name)
+    data = {"text": 'say "hi"\\n\u2028\x00é😀 1e5', "start": 2**63 - 1, "end": -(2**63), "audio_duration": 0.1, "score": 1.0, "corpus_code": None, "is_valid": False}
+    floats = [1e16, 1.5e-7, 1e-5, 1e22, 123456789012345678.0, 5e-324, 1.7976931348623157e308, 1e15, 1e-4, -0.0]
+
+    assert serializer.encode(data) == StdlibJsonSerializer().encode(data)
+    for value in floats:
+        assert serializer.encode({"audio_duration": value}) == StdlibJsonSerializer().encode({"audio_duration": value})
+
+
+def test_create_serializer_will_reject_unknown_serializers():
+    with pytest.raises(ValueError):
+        create_serializer(name="yaml")
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3://transcripts/s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+@mock.patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_DEFAULT_REGION": "us-east-1"})
+def test_load_data_will_upload_json_to_an_s3_compatible_bucket():
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            tx_data=[TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045)],
+        )
+    ]
+
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="transcripts")
+        load_data(data=tx_data)
+        tx_json = client.get_object(Bucket="transcripts", Key="s3_bucket_test/2022-06-05/P998123/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1_tx.json")
+
+    assert json.loads(tx_json["Body"].read()) == [{"speaker_tag": "<#spk_2>", "text": "hello, how are you", "start": 45, "end": 5045}]
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"PARQUET_URI": "parquet_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_store_one_parquet_row_per_segment_partitioned_by_package_date_and_pin(tmp_path):
+    pytest.importorskip("pyarrow")
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            tx_data=[
+                TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045),
+                TxData(speaker_tag="<#spk_3>", text="<um> not good.", start=5045, end=6446),
+            ],
+        ),
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_TEST_NOT_IN_DB.wav",
+            tx_data=[TxData(speaker_tag="", text="<#no-speech>", start=6446, end=8678)],
+        ),
+    ]
+
+    load_data(data=tx_data)
+
+    parquet_folder = tmp_path / "parquet_bucket_test"
+    assert sorted(str(p.parent.relative_to(parquet_folder)) for p in parquet_folder.glob("*/*/*.parquet")) == [
+        "package_date=2022-06-05/pin=P998123",
+        "package_date=2022-06-05/pin=no-pin",
+    ]
+    segments_df = pd.read_parquet(parquet_folder / "package_date=2022-06-05" / "pin=P998123")
+    assert segments_df[["segment_index", "speaker_tag", "text", "start", "end"]].values.tolist() == [
+        [0, "<#spk_2>", "hello, how are you", 45, 5045],
+        [1, "<#spk_3>", "<um> not good.", 5045, 6446],
+    ]
+    assert segments_df["corpus_code"].tolist() == ["solo2-17-A-1", "solo2-17-A-1"]
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"PARQUET_URI": "parquet_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_overwrite_the_parquet_files_of_reloaded_transcriptions(tmp_path):
+    pytest.importorskip("pyarrow")
+    tx_data = [
+        TxDataGroup(
+            file="/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_solo2-17-A-1.wav",
+            tx_data=[TxData(speaker_tag="<#spk_2>", text="hello, how are you", start=45, end=5045)],
+        )
+    ]
+
+    load_data(data=tx_data)
+    parquet_files = sorted((tmp_path / "parquet_bucket_test").glob("*/*/*.parquet"))
+    load_data(data=tx_data)
+
+    assert sorted((tmp_path / "parquet_bucket_test").glob("*/*/*.parquet")) == parquet_files
+    assert len(pd.read_parquet(tmp_path / "parquet_bucket_test")) == 1
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"PARQUET_URI": "parquet_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_load_data_will_compact_a_partition_into_one_parquet_file_whatever_the_batches(tmp_path):
+    pytest.importorskip("pyarrow")
+    first, second = [
+        TxDataGroup(file=f"/audio-efs/Test_04803_MUL_MUL_0002_20220605-192230_0038_TEST_NOT_IN_DB_{i}.wav", tx_data=[TxData(speaker_tag="", text=f"take {i}", start=0, end=100)])
+        for i in range(2)
+    ]
+
+    for batch in [[first], [first, second], [second]]:
+        load_data(data=batch)
+
+    partition_folder = tmp_path / "parquet_bucket_test" / "package_date=2022-06-05" / "pin=no-pin"
+    assert [p.name for p in partition_folder.iterdir()] == ["part-0.parquet"]
+    assert sorted(pd.read_parquet(partition_folder)["text"].tolist()) == ["take 0", "take 1"]
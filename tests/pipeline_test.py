@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from loguru import logger
+
+from transcribe_etl.extract.journal import RunJournal
+from transcribe_etl.load.backend import create_storage_backend
+from transcribe_etl.load.fingerprint import FingerprintIndex
+from transcribe_etl.runner import data_pipeline
+from transcribe_etl.streaming import iter_in_thread, iter_micro_batches
+from transcribe_etl.telemetry import Telemetry
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+@mock.patch.dict(os.environ, {"RUN_REPORT_URI": "reports/run_report.json", "PROMETHEUS_METRICS_URI": "reports/metrics.prom"})
+def test_data_pipeline_will_report_the_timings_and_throughput_of_each_stage(tmp_path):
+    telemetry = data_pipeline()
+
+    with open(tmp_path / "reports" / "run_report.json") as f:
+        run_report = json.load(f)
+    spans = {span["name"]: span for span in run_report["spans"]}
+
+    assert run_report["execution_id"] == telemetry.execution_id
+    assert {"extract_data", "transcribe_from_txt", "load_data", "parse_timed_transcriptions", "aggregate_segments", "lookup_transcript_metadata", "write_outputs"} <= set(spans)
+    assert spans["extract_data"]["records_out"] == spans["transcribe_from_txt"]["records_in"] == 1
+    assert spans["transcribe_from_txt"]["records_out"] == spans["aggregate_segments"]["records_in"]
+    assert spans["load_data"]["records_out"] == 2 * spans["load_data"]["records_in"]
+    assert spans["load_data"]["bytes"] == sum(f.stat().st_size for f in (tmp_path / "s3_bucket_test").glob("*/*/*.json"))
+    assert all(span["wall_seconds"] >= 0 and span["rss_bytes"] > 0 for span in spans.values())
+
+    with open(tmp_path / "reports" / "metrics.prom") as f:
+        metrics = f.read()
+    assert "# TYPE transcribe_etl_span_wall_seconds_total counter" in metrics
+    assert f'transcribe_etl_span_records_in_total{{span="load_data"}} {spans["load_data"]["records_in"]}' in metrics
+    assert f"# execution_id {telemetry.execution_id}\n" in metrics
+    assert "execution_id=" not in metrics
+
+
+def test_telemetry_will_report_the_peak_rss_of_a_span_instead_of_its_rss_at_the_end():
+    telemetry = Telemetry(execution_id="test")
+    with telemetry.span(name="allocate"):
+        buffer = bytearray(256 * 1024 * 1024)
+        time.sleep(0.3)
+        del buffer
+    with telemetry.span(name="idle"):
+        time.sleep(0.3)
+
+    assert telemetry.spans["allocate"].rss_growth_bytes >= 200 * 1024 * 1024
+    assert telemetry.spans["idle"].rss_growth_bytes < 200 * 1024 * 1024
+
+
+def _read_outputs(folder: Path) -> dict:
+    return {f.relative_to(folder): f.read_bytes() for f in folder.glob("*/*/*.json")}
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_streaming_data_pipeline_will_load_micro_batches_with_the_same_outputs_as_the_batch_pipeline(tmp_path):
+    data_pipeline()
+    batch_outputs = _read_outputs(folder=tmp_path / "s3_bucket_test")
+    for f in (tmp_path / "s3_bucket_test").glob("*/*/*.json"):
+        f.unlink()
+
+    telemetry = data_pipeline(streaming=True, stream_batch_size=1, stream_queue_size=1)
+
+    assert _read_outputs(folder=tmp_path / "s3_bucket_test") == batch_outputs
+    assert telemetry.spans["load_data"].calls == telemetry.spans["load_data"].records_in == len(batch_outputs) // 2
+    assert telemetry.spans["extract_data"].records_out == telemetry.spans["transcribe_from_txt"].records_in == 1
+    assert telemetry.spans["aggregate_segments"].records_out == len(batch_outputs) // 2
+    assert telemetry.spans["combine_and_measure_segments"].records_out == telemetry.spans["transcribe_from_txt"].records_out
+    assert sum(telemetry.spans[name].wall_seconds for name in ["parse_timed_transcriptions", "convert_to_segments", "aggregate_segments"]) <= (
+        telemetry.spans["transcribe_from_txt"].wall_seconds
+    )
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test", "SKIP_UNCHANGED_OUTPUTS": "true", "OUTPUT_FINGERPRINT_INDEX_URI": "stage/output_fingerprints.db"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_streaming_data_pipeline_will_share_the_output_writer_of_the_run_between_its_micro_batches(tmp_path):
+    with mock.patch("transcribe_etl.runner.create_storage_backend", wraps=create_storage_backend) as storage_backend_factory:
+        with mock.patch("transcribe_etl.runner.FingerprintIndex", wraps=FingerprintIndex) as fingerprint_index_factory:
+            telemetry = data_pipeline(streaming=True, stream_batch_size=1, stream_queue_size=1)
+
+    assert telemetry.spans["load_data"].calls > 1
+    assert storage_backend_factory.call_count == fingerprint_index_factory.call_count == 1
+    assert telemetry.spans["load_data"].records_out == 2 * telemetry.spans["load_data"].records_in
+
+
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_streaming_data_pipeline_will_merge_the_interleaved_records_of_an_audio_file(tmp_path):
+    cloud_uri = tmp_path / "cloud"
+    shutil.copytree(Path(__file__).parent / "data" / "input_metadata", cloud_uri / "input_metadata")
+    records = (Path(__file__).parent / "data" / "extract_files" / "extract.txt").read_text().strip().split("\n\n")
+    (cloud_uri / "extract_files").mkdir()
+    (cloud_uri / "extract_files" / "extract.txt").write_text("\n\n".join([records[0], records[-1], *records[1:-1]]) + "\n")
+
+    with mock.patch.dict(os.environ, {"CLOUD_URI": str(cloud_uri)}):
+        data_pipeline()
+        batch_outputs = _read_outputs(folder=tmp_path / "s3_bucket_test")
+        for f in (tmp_path / "s3_bucket_test").glob("*/*/*.json"):
+            f.unlink()
+
+        telemetry = data_pipeline(streaming=True, stream_batch_size=1, stream_queue_size=1)
+
+    assert _read_outputs(folder=tmp_path / "s3_bucket_test") == batch_outputs
+    assert telemetry.spans["load_data"].records_in == len(batch_outputs) // 2 == len({record.split("\n", 1)[0] for record in records})
+
+
+def test_iter_in_thread_will_block_the_producer_when_the_queue_is_full():
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    items = iter_in_thread(iterable=produce(), maxsize=2)
+    assert next(items) == 0
+    time.sleep(0.3)
+
+    assert len(produced) <= 4
+    assert list(items) == list(range(1, 10))
+
+
+def test_iter_in_thread_will_raise_the_producer_exception():
+    def produce():
+        yield from iter_micro_batches(iterable=range(3), size=2)
+        raise ValueError("broken extract file")
+
+    items = iter_in_thread(iterable=produce(), maxsize=1)
+
+    assert next(items) == [0, 1]
+    assert next(items) == [2]
+    with pytest.raises(ValueError, match="broken extract file"):
+        next(items)
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_async_data_pipeline_will_overlap_the_stages_with_the_same_outputs_as_the_batch_pipeline(tmp_path):
+    data_pipeline()
+    batch_outputs = _read_outputs(folder=tmp_path / "s3_bucket_test")
+    for f in (tmp_path / "s3_bucket_test").glob("*/*/*.json"):
+        f.unlink()
+
+    telemetry = data_pipeline(asynchronous=True, transform_workers=2, staging_workers=2, load_concurrency=2)
+
+    assert _read_outputs(folder=tmp_path / "s3_bucket_test") == batch_outputs
+    assert telemetry.spans["extract_data"].records_out == telemetry.spans["transcribe_from_txt"].records_in == telemetry.spans["load_data"].calls == 1
+    assert telemetry.spans["load_data"].records_out == len(batch_outputs)
+    assert telemetry.spans["aggregate_segments"].records_out == len(batch_outputs) // 2
+    assert telemetry.spans["parse_timed_transcriptions"].records_out > 0
+
+
+@mock.patch.dict(os.environ, {"ASYNC_PIPELINE": "true"})
+def test_data_pipeline_will_reject_an_asynchronous_streaming_run():
+    with pytest.raises(ValueError, match="cannot be combined"):
+        data_pipeline(streaming=True)
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+@mock.patch("transcribe_etl.runner._JOURNAL_CHECKPOINT_SIZE", 1)
+def test_data_pipeline_will_resume_a_crashed_run_from_its_journal(tmp_path):
+    data_pipeline()
+    batch_outputs = _read_outputs(folder=tmp_path / "s3_bucket_test")
+    for f in (tmp_path / "s3_bucket_test").glob("*/*/*.json"):
+        f.unlink()
+
+    record_outputs = RunJournal.record_outputs
+
+    def crash_after_the_first_output(journal: RunJournal, audio_files):
+        record_outputs(journal, audio_files=audio_files)
+        raise KeyboardInterrupt
+
+    with mock.patch.object(RunJournal, "record_outputs", crash_after_the_first_output), pytest.raises(KeyboardInterrupt):
+        data_pipeline(resume="6e2b0b5c-8e1f-4d3a-9a57-2f0c1d4e5b6a")
+    assert len(_read_outputs(folder=tmp_path / "s3_bucket_test")) == 2
+
+    telemetry = data_pipeline(resume="6e2b0b5c-8e1f-4d3a-9a57-2f0c1d4e5b6a")
+    assert _read_outputs(folder=tmp_path / "s3_bucket_test") == batch_outputs
+    assert telemetry.spans["load_data"].records_out == len(batch_outputs) - 2
+
+    telemetry = data_pipeline(resume="6e2b0b5c-8e1f-4d3a-9a57-2f0c1d4e5b6a")
+    assert telemetry.spans["extract_data"].records_out == 0
+    assert "load_data" not in telemetry.spans
+
+
+@mock.patch.dict(os.environ, {"CLOUD_URI": str(Path(__file__).parent / "data")})
+@mock.patch.dict(os.environ, {"S3_BUCKET_URI": "s3_bucket_test"})
+@mock.patch.dict(os.environ, {"QA_REPORT_DB_URI": str(Path(__file__).parent / "data" / "qa_report_test.db")})
+def test_data_pipeline_will_only_journal_the_runs_that_ask_for_it(tmp_path):
+    data_pipeline()
+    assert not (tmp_path / "stage" / "run_journal.db").exists()
+
+    messages = []
+    handler_id = logger.add(messages.append, level="WARNING", format="{message}")
+    try:
+        data_pipeline(resume="0b6a1c2e-3d4f-4a5b-8c6d-7e8f9a0b1c2d")
+    finally:
+        logger.remove(handler_id)
+
+    assert messages == ["Found no run journal entries of execution 0b6a1c2e-3d4f-4a5b-8c6d-7e8f9a0b1c2d, starting it as a new journaled run.\n"]
+    assert RunJournal(uri=tmp_path / "stage" / "run_journal.db", execution_id="0b6a1c2e-3d4f-4a5b-8c6d-7e8f9a0b1c2d").has_entries()
@@ -1,8 +1,22 @@
+import os
+import pickle
+import time
 from pathlib import Path
+from typing import Iterator, List
+from unittest import mock
 
+import numpy as np
+import pytest
+from loguru import logger
+
+from benchmarks.extract_generator import generate_extract_fixture
 from transcribe_etl.extract.model import StageFolder
-from transcribe_etl.runner import transcribe_from_txt
-from transcribe_etl.transform.model import TxDataGroup, TxData
+from transcribe_etl.runner import transcribe_from_txt, stream_from_txt
+from transcribe_etl.transform.audio import AudioAnnotator, annotate_multiple_audio_files, iter_annotated_audio_files
+from transcribe_etl.transform.audio_models import AudioDecoder, SpeakerDiarizer, SpeechRecognizer, get_cached_model, clear_model_cache
+from transcribe_etl.transform.model import TxDataGroup, TxData, Segment
+from transcribe_etl.transform.result_cache import TranscriptResultCache
+from transcribe_etl.transform.text_extract import TextExtractParser, SegmentProcessor
 
 _TEST_DATA_DIR = Path(__file__).parent / "data" / "scenario_txt_files"
 
@@ -305,3 +319,405 @@ def test_transcribe_can_parse_text_with_optional_labels_field():
             ],
         )
     ]
+
+
+@pytest.mark.parametrize(
+    "file_name",
+    ["segments_with_tilde_at_eol.txt", "segments_aggregated_based_on_filename.txt", "segment_with_the_no_speech_tags.txt", "segments_with_noise_tags.txt"],
+)
+def test_transcribe_stream_will_yield_the_same_groups_as_batch_parsing(file_name: str):
+    stage_folder = StageFolder(extract_files=[Path(_TEST_DATA_DIR) / file_name])
+    tx_data_groups = stream_from_txt(stage_folder=stage_folder)
+    assert isinstance(tx_data_groups, Iterator)
+    assert list(tx_data_groups) == transcribe_from_txt(stage_folder=stage_folder)
+
+
+def test_iter_regrouped_segments_will_group_interleaved_segments_in_the_order_of_their_first_appearance():
+    segments = [Segment(file=file, speaker_tag="<#spk_1>", text=text, eol="\n", size=1, start=0, end=10) for file, text in [("a.wav", "1"), ("b.wav", "2"), ("a.wav", "3")]]
+    assert list(SegmentProcessor.iter_regrouped_segments(segments=segments)) == SegmentProcessor.aggregate_segments(segments=segments)
+
+
+def test_iter_aggregated_segments_will_reject_segments_of_an_audio_file_that_are_not_contiguous():
+    segments = [Segment(file=file, speaker_tag="<#spk_1>", text="hello", eol="\n", size=1, start=0, end=10) for file in ["a.wav", "b.wav", "a.wav"]]
+    with pytest.raises(ValueError, match="a.wav are not contiguous"):
+        list(SegmentProcessor.iter_aggregated_segments(segments=segments))
+
+
+@pytest.mark.parametrize("memory_map", [False, True])
+def test_transcribe_in_parallel_will_keep_the_serial_order_and_tilde_continuations(memory_map: bool):
+    stage_folder = StageFolder(
+        extract_files=[
+            Path(_TEST_DATA_DIR) / "segments_with_tilde_at_eol.txt",
+            Path(_TEST_DATA_DIR) / "segments_aggregated_based_on_filename.txt",
+            Path(_TEST_DATA_DIR) / "segments_with_noise_tags.txt",
+        ],
+        memory_map=memory_map,
+    )
+    tx_data_groups = transcribe_from_txt(stage_folder=stage_folder, workers=2, shard_size=1)
+    assert tx_data_groups == transcribe_from_txt(stage_folder=stage_folder)
+
+
+def test_transcribe_shard_will_read_the_same_lines_with_and_without_memory_mapping():
+    file = Path(_TEST_DATA_DIR) / "segments_aggregated_based_on_filename.txt"
+    shards = TextExtractParser.split_into_shards(file=file, shard_size=1)
+    text_annotator = TextExtractParser(segment_processor=SegmentProcessor())
+    memory_mapped_text_annotator = TextExtractParser(segment_processor=SegmentProcessor(), memory_map=True)
+
+    assert len(shards) > 1
+    for shard in shards:
+        lines = list(text_annotator._iter_shard_lines_to_process(shard=shard))
+        assert lines == list(memory_mapped_text_annotator._iter_shard_lines_to_process(shard=shard))
+        assert "".join(lines).encode() == file.read_bytes()[slice(shard.start, shard.end)].replace(b"\r\n", b"\n")
+
+
+@pytest.mark.parametrize("duration, expected", [("[1.005]", 1005), ("[0.29]", 290), ("[2.5]", 2500), ("[12.3456]", 12345), ("~", "~")])
+def test_transcribe_will_convert_eol_to_milliseconds_without_float_truncation(duration: str, expected):
+    assert TextExtractParser.parse_and_convert_eol(duration=duration) == expected
+
+
+def test_transcribe_will_gate_the_segment_debug_logs_with_verbose_and_sample_them():
+    file = Path(_TEST_DATA_DIR) / "segments_with_noise_tags.txt"
+    messages = []
+    handler_id = logger.add(messages.append, level="DEBUG", format="{name}: {message}")
+    try:
+        verbose_parser = TextExtractParser(segment_processor=SegmentProcessor(verbose=True, log_every=2), verbose=True, log_every=2)
+        TextExtractParser(segment_processor=SegmentProcessor(), verbose=False).execute(file=file)
+        assert messages == []
+
+        tx_data_groups = verbose_parser.execute(file=file)
+    finally:
+        logger.remove(handler_id)
+
+    aggregated_segment_logs = [m for m in messages if m.startswith("transcribe_etl.transform.text_extract: Aggregated Segment: ")]
+    assert len(aggregated_segment_logs) == (sum(len(g.tx_data) for g in tx_data_groups) + 1) // 2
+
+
+def test_transcribe_segment_helpers_can_still_be_called_on_the_classes():
+    text = (Path(_TEST_DATA_DIR) / "segments_with_noise_tags.txt").read_text()
+    extracted_transcriptions = TextExtractParser.parse_timed_transcriptions(text=text)
+    segments = TextExtractParser.convert_to_segments(extracted_transcriptions=extracted_transcriptions)
+    tx_data_groups = SegmentProcessor.aggregate_segments(segments=SegmentProcessor().combine_and_measure_segments(segments=segments))
+
+    assert tx_data_groups == transcribe_from_txt(stage_folder=StageFolder(extract_files=[Path(_TEST_DATA_DIR) / "segments_with_noise_tags.txt"]))
+
+
+def test_transcribe_will_parse_every_audio_file_of_a_synthetic_extract(tmp_path):
+    fixture = generate_extract_fixture(cloud_uri=tmp_path, records=500, records_per_audio_file=10, tilde_ratio=0.5, no_speech_ratio=0.3, multi_speaker_ratio=0.5)
+    tx_data_groups = transcribe_from_txt(stage_folder=StageFolder(extract_files=[fixture.extract_file]))
+
+    assert [group.file for group in tx_data_groups] == fixture.audio_files
+    assert {tx_data.speaker_tag for group in tx_data_groups for tx_data in group.tx_data} == {"", "<#spk_1>", "<#spk_2>", "<#spk_3>"}
+
+
+class _StubSegment:
+    def __init__(self, start: float, end: float):
+        self.start, self.end = start, end
+
+    def __str__(self) -> str:
+        return f"[ {self._format(self.start)} -->  {self._format(self.end)}]"
+
+    @staticmethod
+    def _format(seconds: float) -> str:
+        return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+
+class _StubAudioDecoder(AudioDecoder):
+    sample_rate = 10
+
+    def __init__(self):
+        self.decoded_files = []
+
+    def decode(self, file) -> np.ndarray:
+        self.decoded_files.append(file)
+        return np.arange(100, dtype=np.float32)
+
+
+class _StubSpeakerDiarizer(SpeakerDiarizer):
+    def diarize(self, waveform: np.ndarray, sample_rate: int):
+        return [(_StubSegment(0.5, 2.0), "SPEAKER_00"), (_StubSegment(2.0, 3.25), "SPEAKER_01"), (_StubSegment(3.25, 9.9), "SPEAKER_00")]
+
+
+class _StubSpeechRecognizer(SpeechRecognizer):
+    def __init__(self):
+        self.batches = []
+
+    def transcribe(self, waveforms: List[np.ndarray]) -> List[str]:
+        self.batches.append(waveforms)
+        return [f"{int(w[0])}-{int(w[-1])}" for w in waveforms]
+
+
+def test_audio_annotator_will_decode_once_and_transcribe_the_diarized_segments_in_a_batch(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    audio_decoder, speech_recognizer = _StubAudioDecoder(), _StubSpeechRecognizer()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=speech_recognizer, diarizer=_StubSpeakerDiarizer(), audio_decoder=audio_decoder)
+
+    tx_data = annotate_multiple_audio_files(audio_files=[audio_file, audio_file], audio_annotator=audio_annotator)
+
+    assert audio_decoder.decoded_files == [audio_file, audio_file]
+    assert [len(batch) for batch in speech_recognizer.batches] == [3, 3]
+    assert tx_data[:3] == [
+        TxData(speaker_tag="<#SPEAKER_00>", text="5-19", start=500, end=2000),
+        TxData(speaker_tag="<#SPEAKER_01>", text="20-31", start=2000, end=3250),
+        TxData(speaker_tag="<#SPEAKER_00>", text="32-98", start=3250, end=9900),
+    ]
+
+
+def test_audio_annotator_will_load_each_model_once_per_process():
+    loaded = []
+    clear_model_cache()
+    try:
+        for _ in range(3):
+            get_cached_model(key=("whisper", "small", 8), loader=lambda: loaded.append("whisper") or _StubSpeechRecognizer())
+            get_cached_model(key=("pyannote", "token"), loader=lambda: loaded.append("pyannote") or _StubSpeakerDiarizer())
+            audio_annotator = AudioAnnotator(token="token", audio_decoder=_StubAudioDecoder())
+            assert isinstance(audio_annotator.speech_recognizer, _StubSpeechRecognizer)
+            assert isinstance(audio_annotator.diarizer, _StubSpeakerDiarizer)
+    finally:
+        clear_model_cache()
+
+    assert loaded == ["whisper", "pyannote"]
+
+
+def test_audio_annotator_will_reuse_the_cached_transcript_of_unchanged_audio_files(tmp_path):
+    audio_file, copied_audio_file = tmp_path / "audio.wav", tmp_path / "copied_audio.wav"
+    audio_file.write_bytes(b"RIFF")
+    copied_audio_file.write_bytes(b"RIFF")
+    result_cache = TranscriptResultCache(uri=tmp_path / "cache" / "transcripts.db")
+    audio_decoder = _StubAudioDecoder()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=_StubSpeakerDiarizer(), audio_decoder=audio_decoder, result_cache=result_cache)
+
+    tx_data = audio_annotator.execute(file=audio_file)
+
+    assert audio_annotator.execute(file=copied_audio_file) == tx_data
+    assert audio_decoder.decoded_files == [audio_file]
+    assert len(result_cache) == 1
+
+
+def test_audio_annotator_will_keep_the_cached_transcripts_of_every_model_version(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.write_bytes(b"RIFF")
+    result_cache = TranscriptResultCache(uri=tmp_path / "transcripts.db")
+
+    class _UpgradedSpeechRecognizer(_StubSpeechRecognizer):
+        version = "upgraded"
+
+    decoded_files = []
+    for speech_recognizer in [_StubSpeechRecognizer(), _UpgradedSpeechRecognizer(), _StubSpeechRecognizer(), _UpgradedSpeechRecognizer()]:
+        audio_decoder = _StubAudioDecoder()
+        AudioAnnotator(token=None, speech_recognizer=speech_recognizer, diarizer=_StubSpeakerDiarizer(), audio_decoder=audio_decoder, result_cache=result_cache).execute(
+            file=audio_file
+        )
+        decoded_files.append(audio_decoder.decoded_files)
+
+    assert decoded_files == [[audio_file], [audio_file], [], []]
+    assert len(result_cache) == 2
+
+
+def test_transcript_result_cache_will_reconnect_after_being_pickled(tmp_path):
+    result_cache = TranscriptResultCache(uri=tmp_path / "transcripts.db")
+    tx_data = [TxData(speaker_tag="<#spk_1>", text="hello, how are you", start=45, end=5045)]
+    result_cache.put(content_hash="a", model_version="v1", tx_data=tx_data)
+
+    unpickled_result_cache = pickle.loads(pickle.dumps(result_cache))
+
+    assert unpickled_result_cache.get(content_hash="a", model_version="v1") == tx_data
+    unpickled_result_cache.close()
+    result_cache.close()
+
+
+def test_transcript_result_cache_will_evict_the_least_recently_used_transcripts(tmp_path):
+    result_cache = TranscriptResultCache(uri=tmp_path / "transcripts.db", max_bytes=100)
+    tx_data = [TxData(speaker_tag="<#spk_1>", text="hello, how are you", start=45, end=5045)]
+    for content_hash in ["a", "b", "c"]:
+        result_cache.put(content_hash=content_hash, model_version="v1", tx_data=tx_data)
+        time.sleep(0.01)
+        result_cache.get(content_hash="a", model_version="v1")
+
+    assert result_cache.get(content_hash="a", model_version="v1") == tx_data
+    assert result_cache.get(content_hash="b", model_version="v1") is None
+    assert result_cache.get(content_hash="c", model_version="v1") == tx_data
+
+
+class _TimelineAudioDecoder(AudioDecoder):
+    sample_rate = 10
+
+    def __init__(self, duration: float):
+        self.duration = duration
+        self.decoded_lengths = []
+
+    def decode(self, file) -> np.ndarray:
+        return self.decode_window(file=file, start=0, end=self.duration)
+
+    def get_duration(self, file) -> float:
+        return self.duration
+
+    def decode_window(self, file, start: float, end: float) -> np.ndarray:
+        waveform = np.arange(round(start * self.sample_rate), round(end * self.sample_rate), dtype=np.float32)
+        self.decoded_lengths.append(len(waveform))
+        return waveform
+
+
+class _TimelineSpeakerDiarizer(SpeakerDiarizer):
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def diarize(self, waveform: np.ndarray, sample_rate: int):
+        offset, end = waveform[0] / sample_rate, (waveform[-1] + 1) / sample_rate
+        return [(_StubSegment(max(s, offset) - offset, min(e, end) - offset), speaker) for s, e, speaker in self.tracks if s < end and e > offset]
+
+
+def test_audio_annotator_will_decode_long_recordings_in_overlapping_windows_with_the_same_timestamps(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    diarizer = _TimelineSpeakerDiarizer(tracks=[(0.5, 2.0, "SPEAKER_00"), (2.7, 3.6, "SPEAKER_01"), (5.9, 6.3, "SPEAKER_00"), (8.1, 9.9, "SPEAKER_01")])
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10))
+    audio_decoder = _TimelineAudioDecoder(duration=10)
+    windowed_audio_annotator = AudioAnnotator(
+        token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=audio_decoder, window_seconds=3, window_overlap_seconds=1
+    )
+
+    tx_data = windowed_audio_annotator.execute(file=audio_file)
+
+    assert [(tx.text, tx.start, tx.end) for tx in tx_data] == [(tx.text, tx.start, tx.end) for tx in audio_annotator.execute(file=audio_file)]
+    assert [(tx.start, tx.end) for tx in tx_data] == [(500, 2000), (2700, 3600), (5900, 6300), (8100, 9900)]
+    assert max(audio_decoder.decoded_lengths) == (3 + 2 * 1) * audio_decoder.sample_rate
+
+
+def test_audio_annotator_will_not_cut_the_segments_running_past_the_edge_of_their_window(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    diarizer = _TimelineSpeakerDiarizer(tracks=[(0.5, 2.0, "SPEAKER_00"), (2.5, 5.5, "SPEAKER_01"), (5.7, 8.9, "SPEAKER_00"), (9.2, 9.8, "SPEAKER_01")])
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10))
+    windowed_audio_annotator = AudioAnnotator(
+        token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10), window_seconds=3, window_overlap_seconds=1
+    )
+
+    tx_data = windowed_audio_annotator.execute(file=audio_file)
+
+    assert [(tx.start, tx.end) for tx in tx_data] == [(500, 2000), (2500, 5500), (5700, 8900), (9200, 9800)]
+    assert tx_data == audio_annotator.execute(file=audio_file)
+
+
+class _AppearanceOrderSpeakerDiarizer(_TimelineSpeakerDiarizer):
+    def diarize(self, waveform: np.ndarray, sample_rate: int):
+        tracks = super().diarize(waveform=waveform, sample_rate=sample_rate)
+        labels = {speaker: f"SPEAKER_{i:02d}" for i, speaker in enumerate(dict.fromkeys(speaker for _, speaker in tracks))}
+        return [(segment, labels[speaker]) for segment, speaker in tracks]
+
+
+def test_audio_annotator_will_match_the_speakers_of_overlapping_windows(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    diarizer = _AppearanceOrderSpeakerDiarizer(tracks=[(0.5, 1.5, "alice"), (1.8, 2.9, "bob"), (3.0, 3.3, "alice"), (4.0, 5.8, "bob"), (6.2, 7.5, "alice"), (8.0, 9.5, "bob")])
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10))
+    windowed_audio_annotator = AudioAnnotator(
+        token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10), window_seconds=3, window_overlap_seconds=1
+    )
+
+    tx_data = windowed_audio_annotator.execute(file=audio_file)
+
+    assert [tx.speaker_tag for tx in tx_data] == ["<#SPEAKER_00>", "<#SPEAKER_01>", "<#SPEAKER_00>", "<#SPEAKER_01>", "<#SPEAKER_00>", "<#SPEAKER_01>"]
+    assert tx_data == audio_annotator.execute(file=audio_file)
+
+
+def test_audio_annotator_will_not_conflate_speakers_that_cannot_be_matched_across_windows(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    diarizer = _AppearanceOrderSpeakerDiarizer(tracks=[(0.5, 1.5, "alice"), (6.2, 7.5, "bob")])
+    audio_annotator = AudioAnnotator(
+        token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=_TimelineAudioDecoder(duration=10), window_seconds=3, window_overlap_seconds=1
+    )
+
+    tx_data = audio_annotator.execute(file=audio_file)
+
+    assert [tx.speaker_tag for tx in tx_data] == ["<#SPEAKER_00>", "<#SPEAKER_01>"]
+
+
+class _CountingAudioDecoder(AudioDecoder):
+    sample_rate = 10
+
+    def __init__(self):
+        self.decode_calls = 0
+
+    def decode(self, file) -> np.ndarray:
+        self.decode_calls += 1
+        return np.arange(100, dtype=np.float32)
+
+
+def test_audio_decoder_will_decode_a_file_once_for_all_of_its_windows(tmp_path):
+    audio_file = tmp_path / "audio.wav"
+    audio_file.touch()
+    audio_decoder = _CountingAudioDecoder()
+    diarizer = _TimelineSpeakerDiarizer(tracks=[(0.5, 2.0, "SPEAKER_00"), (8.1, 9.9, "SPEAKER_01")])
+    audio_annotator = AudioAnnotator(
+        token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=diarizer, audio_decoder=audio_decoder, window_seconds=3, window_overlap_seconds=1
+    )
+
+    tx_data = audio_annotator.execute(file=audio_file)
+
+    assert [(tx.start, tx.end) for tx in tx_data] == [(500, 2000), (8100, 9900)]
+    assert audio_decoder.decode_calls == 1
+
+
+class _SlowOrCrashingAudioDecoder(_StubAudioDecoder):
+    def decode(self, file) -> np.ndarray:
+        if Path(file).stem == "slow":
+            time.sleep(60)
+        if Path(file).stem == "crash":
+            os._exit(1)
+        return super().decode(file=file)
+
+
+def test_annotate_multiple_audio_files_in_parallel_will_keep_the_serial_order(tmp_path):
+    audio_files = [tmp_path / f"audio_{i}.wav" for i in range(4)]
+    for audio_file in audio_files:
+        audio_file.touch()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=_StubSpeakerDiarizer(), audio_decoder=_StubAudioDecoder())
+
+    tx_data = annotate_multiple_audio_files(audio_files=audio_files, audio_annotator=audio_annotator, workers=2, torch_threads=1)
+
+    assert tx_data == annotate_multiple_audio_files(audio_files=audio_files, audio_annotator=audio_annotator)
+
+
+def test_annotate_audio_files_in_parallel_will_skip_timed_out_and_crashed_files_and_stream_the_rest(tmp_path):
+    audio_files = [tmp_path / name for name in ["slow.wav", "crash.wav", "a.wav", "b.wav"]]
+    for audio_file in audio_files:
+        audio_file.touch()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=_StubSpeakerDiarizer(), audio_decoder=_SlowOrCrashingAudioDecoder())
+
+    annotated_audio_files = dict(iter_annotated_audio_files(audio_files=audio_files, audio_annotator=audio_annotator, workers=2, timeout=2))
+
+    assert annotated_audio_files.keys() == set(audio_files)
+    assert annotated_audio_files[tmp_path / "slow.wav"] == annotated_audio_files[tmp_path / "crash.wav"] == []
+    assert len(annotated_audio_files[tmp_path / "a.wav"]) == len(annotated_audio_files[tmp_path / "b.wav"]) == 3
+
+
+def _annotate_one_audio_file_and_exit(audio_annotator: AudioAnnotator, torch_threads, connection):
+    index, file = connection.recv()
+    connection.send(("started", time.time()))
+    connection.send(("done", audio_annotator.execute(file=file)))
+    os._exit(1)
+
+
+def test_annotate_audio_files_in_parallel_will_keep_the_results_sent_before_a_worker_exits(tmp_path):
+    audio_files = [tmp_path / f"audio_{i}.wav" for i in range(4)]
+    for audio_file in audio_files:
+        audio_file.touch()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=_StubSpeakerDiarizer(), audio_decoder=_StubAudioDecoder())
+
+    with mock.patch("transcribe_etl.transform.audio._annotate_audio_files_from_connection", _annotate_one_audio_file_and_exit):
+        annotated_audio_files = dict(iter_annotated_audio_files(audio_files=audio_files, audio_annotator=audio_annotator, workers=2, start_method="fork"))
+
+    assert [len(annotated_audio_files[audio_file]) for audio_file in audio_files] == [3, 3, 3, 3]
+
+
+def test_annotate_multiple_audio_files_will_honor_the_timeout_without_workers(tmp_path):
+    audio_files = [tmp_path / name for name in ["slow.wav", "a.wav"]]
+    for audio_file in audio_files:
+        audio_file.touch()
+    audio_annotator = AudioAnnotator(token=None, speech_recognizer=_StubSpeechRecognizer(), diarizer=_StubSpeakerDiarizer(), audio_decoder=_SlowOrCrashingAudioDecoder())
+
+    tx_data = annotate_multiple_audio_files(audio_files=audio_files, audio_annotator=audio_annotator, timeout=1)
+
+    assert len(tx_data) == 3
@@ -1,34 +1,134 @@
+import os
 import shutil
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Union, Optional, List
+from typing import Union, Optional, List, Dict, Iterator
 
 from loguru import logger
 
+from transcribe_etl.extract.journal import RunJournal
+from transcribe_etl.extract.manifest import SyncManifest, ManifestEntry
+from transcribe_etl.extract.model import StagingStrategy
+
 _IMAGINARY_STAGING_URI = Path(__file__).parent.parent.parent / "stage"
+_FICLONE = 0x40049409
+
+
+def get_run_journal_uri() -> Path:
+    return _IMAGINARY_STAGING_URI / "run_journal.db"
 
 
 class DataSynchronizer:
-    def __init__(self, execution_id: Optional[uuid.UUID] = uuid.uuid4()):
+    def __init__(
+        self,
+        execution_id: Optional[uuid.UUID] = uuid.uuid4(),
+        incremental: Optional[bool] = False,
+        manifest_uri: Optional[Union[str, Path]] = None,
+        staging_strategy: Optional[StagingStrategy] = StagingStrategy.COPY,
+        staging_workers: Optional[int] = 1,
+        journal: Optional[bool] = False,
+        journal_uri: Optional[Union[str, Path]] = None,
+    ):
         self.execution_id = execution_id
         _now = datetime.now()
         self._package_hierarchy = f"{_now.year}{_now.month}{_now.day}{_now.hour}-{execution_id}"
+        self.manifest = SyncManifest(uri=manifest_uri or _IMAGINARY_STAGING_URI / "sync_manifest.json") if incremental else None
+        self.journal = RunJournal(uri=journal_uri or get_run_journal_uri(), execution_id=str(execution_id)) if journal else None
+        self.staging_strategy = StagingStrategy(staging_strategy)
+        self.staging_workers = staging_workers
+        self._manifest_entries: Dict[Path, ManifestEntry] = {}
 
     def sync_files_from_blob(self, uri: Union[str, Path], container_name: str, file_type: str) -> List[Path]:
-        logger.info(f"Synchronizing {file_type} files from {uri}/{container_name} store.")
-        files = Path(Path(uri) / container_name).glob(f"*.{file_type}")
-        destination_folder = _IMAGINARY_STAGING_URI / f"{self._package_hierarchy}" / container_name
-        destination_folder.mkdir(parents=True, exist_ok=True)
-        sync_files = []
+        return list(self.iter_files_from_blob(uri=uri, container_name=container_name, file_type=file_type))
+
+    def iter_files_from_blob(self, uri: Union[str, Path], container_name: str, file_type: str) -> Iterator[Path]:
+        logger.info(f"Synchronizing {file_type} files from {uri}/{container_name} store using the {self.staging_strategy.value} strategy.")
+        started_at = time.perf_counter()
+        files = self.list_files_to_sync(uri=uri, container_name=container_name, file_type=file_type)
+
+        with ThreadPoolExecutor(max_workers=self.staging_workers) as executor:
+            for sync_file in executor.map(lambda f: self.stage_file(file=f, container_name=container_name), files):
+                yield sync_file
+
+        logger.success(f"Synchronization of {len(files)} files Finished in {time.perf_counter() - started_at:.3f}s.")
+
+    def list_files_to_sync(self, uri: Union[str, Path], container_name: str, file_type: str) -> List[Path]:
+        files = []
+        for f in Path(Path(uri) / container_name).glob(f"*.{file_type}"):
+            manifest_entry = None
+            if self.manifest is not None:
+                manifest_entry = self.manifest.get_changed_entry(file=f)
+                if manifest_entry is None:
+                    logger.debug(f"Skipping {f.name}, it is unchanged since the last synchronization.")
+                    continue
+
+            if self.journal is not None and self.journal.is_loaded(source=f):
+                logger.debug(f"Skipping {f.name}, it was already loaded by execution {self.execution_id}.")
+                if manifest_entry is not None:
+                    self.manifest.record(entry=manifest_entry)
+                continue
+
+            if manifest_entry is not None:
+                self._manifest_entries[f] = manifest_entry
+            files.append(f)
+        return files
+
+    def get_destination_folder(self, container_name: str) -> Path:
+        return _IMAGINARY_STAGING_URI / f"{self._package_hierarchy}" / container_name
+
+    def stage_file(self, file: Path, container_name: str) -> Path:
+        started_at = time.perf_counter()
+        staged_file = self.journal.get_staged_file(source=file) if self.journal is not None else None
+        if staged_file is not None and staged_file.exists():
+            file_destination, method = staged_file, "the run journal"
+        elif self.staging_strategy == StagingStrategy.NO_STAGE:
+            file_destination, method = file, "no-stage"
+        else:
+            destination_folder = self.get_destination_folder(container_name=container_name)
+            destination_folder.mkdir(parents=True, exist_ok=True)
+            file_destination = destination_folder / file.name
+            method = self._stage_file(source=file, destination=file_destination)
+
+        logger.debug(f"Staged {file.name} to {file_destination} using {method} in {(time.perf_counter() - started_at) * 1000:.2f}ms.")
+        if self.journal is not None and staged_file != file_destination:
+            self.journal.record_staged(source=file, staged_file=file_destination)
+        if file in self._manifest_entries:
+            self.manifest.record(entry=self._manifest_entries.pop(file))
+        return file_destination
+
+    def _stage_file(self, source: Path, destination: Path) -> str:
+        if destination.exists() or destination.is_symlink():
+            destination.unlink()
+
+        is_same_filesystem = os.stat(source).st_dev == os.stat(destination.parent).st_dev
+        if self.staging_strategy in (StagingStrategy.REFLINK, StagingStrategy.AUTO) and is_same_filesystem and self._reflink(source, destination):
+            return "reflink"
+
+        if self.staging_strategy in (StagingStrategy.HARDLINK, StagingStrategy.AUTO) and is_same_filesystem and self._hardlink(source, destination):
+            return "hardlink"
 
-        for f in files:
-            file_destination = destination_folder / f.name
-            logger.debug(f"Copying {f.name} to {file_destination}")
+        shutil.copy(source, destination)
+        return "copy"
 
-            sync_files.append(file_destination)
-            shutil.copy(f, file_destination)
+    @staticmethod
+    def _reflink(source: Path, destination: Path) -> bool:
+        try:
+            import fcntl
 
-        logger.success(f"Synchronization of {len(sync_files)} files Finished.")
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except (ImportError, OSError):
+            destination.unlink(missing_ok=True)
+            return False
 
-        return sync_files
+    @staticmethod
+    def _hardlink(source: Path, destination: Path) -> bool:
+        try:
+            os.link(source, destination)
+            return True
+        except OSError:
+            return False
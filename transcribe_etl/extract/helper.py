@@ -1,15 +1,18 @@
+import hashlib
 import sqlite3
 from pathlib import Path
 from typing import Union
 
 import pandas as pd
 
+UNMAPPED_PIN = "unmapped-pin"
+
 
 def get_transcription_metadata(qa_report_db_uri: Union[Path, str], input_metadata_uri: Union[Path, str]) -> pd.DataFrame:
     qa_report_df = get_qa_report_metadata(qa_report_db_uri=qa_report_db_uri)
     input_metadata_df = get_input_metadata(input_metadata_uri=input_metadata_uri)
     metadata_df = pd.merge(left=qa_report_df, right=input_metadata_df, on="directory_name", how="left")
-    metadata_df["pin"] = metadata_df["pin"].fillna("unmapped-pin")
+    metadata_df["pin"] = metadata_df["pin"].fillna(UNMAPPED_PIN)
     return metadata_df
 
 
@@ -25,3 +28,11 @@ def get_qa_report_metadata(qa_report_db_uri: Union[Path, str]) -> pd.DataFrame:
         con=con,
     )
     return df
+
+
+def compute_file_hash(file: Union[Path, str], chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
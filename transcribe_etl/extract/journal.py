@@ -0,0 +1,74 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Optional, Set, Union
+
+from loguru import logger
+
+_STAGED = "staged"
+_PARSED = "parsed"
+_LOADED = "loaded"
+
+
+class RunJournal:
+    def __init__(self, uri: Union[str, Path], execution_id: str):
+        self.uri = Path(uri)
+        self.execution_id = execution_id
+        self._committed_outputs: Optional[Set[str]] = None
+        self.uri.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS extract_files (execution_id TEXT, source TEXT, staged_file TEXT, status TEXT, PRIMARY KEY (execution_id, source))")
+            con.execute("CREATE TABLE IF NOT EXISTS outputs (execution_id TEXT, audio_file TEXT, PRIMARY KEY (execution_id, audio_file))")
+            con.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.uri, timeout=30)
+
+    def has_entries(self) -> bool:
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT 1 FROM extract_files WHERE execution_id = ? LIMIT 1", (self.execution_id,)).fetchone()
+        return row is not None
+
+    def record_staged(self, source: Path, staged_file: Path):
+        with closing(self._connect()) as con:
+            con.execute("INSERT OR REPLACE INTO extract_files VALUES (?, ?, ?, ?)", (self.execution_id, str(source), str(staged_file), _STAGED))
+            con.commit()
+
+    def get_staged_file(self, source: Path) -> Optional[Path]:
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT staged_file FROM extract_files WHERE execution_id = ? AND source = ?", (self.execution_id, str(source))).fetchone()
+        return Path(row[0]) if row else None
+
+    def is_loaded(self, source: Path) -> bool:
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT status FROM extract_files WHERE execution_id = ? AND source = ?", (self.execution_id, str(source))).fetchone()
+        return row is not None and row[0] == _LOADED
+
+    def record_parsed(self, staged_files: Iterable[Path]):
+        self._set_status(staged_files=staged_files, status=_PARSED)
+
+    def record_loaded(self, staged_files: Iterable[Path]):
+        self._set_status(staged_files=staged_files, status=_LOADED)
+
+    def record_parsed_files_loaded(self):
+        with closing(self._connect()) as con:
+            con.execute("UPDATE extract_files SET status = ? WHERE execution_id = ? AND status = ?", (_LOADED, self.execution_id, _PARSED))
+            con.commit()
+
+    def _set_status(self, staged_files: Iterable[Path], status: str):
+        with closing(self._connect()) as con:
+            con.executemany("UPDATE extract_files SET status = ? WHERE execution_id = ? AND staged_file = ?", ((status, self.execution_id, str(f)) for f in staged_files))
+            con.commit()
+
+    def record_outputs(self, audio_files: Iterable[str]):
+        with closing(self._connect()) as con:
+            con.executemany("INSERT OR IGNORE INTO outputs VALUES (?, ?)", ((self.execution_id, f) for f in audio_files))
+            con.commit()
+
+    def get_committed_outputs(self) -> Set[str]:
+        if self._committed_outputs is None:
+            with closing(self._connect()) as con:
+                self._committed_outputs = {row[0] for row in con.execute("SELECT audio_file FROM outputs WHERE execution_id = ?", (self.execution_id,))}
+            if self._committed_outputs:
+                logger.info(f"Found {len(self._committed_outputs)} committed outputs of execution {self.execution_id} in the run journal {self.uri}.")
+        return self._committed_outputs
@@ -0,0 +1,60 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from loguru import logger
+
+from transcribe_etl.extract.helper import compute_file_hash
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+
+
+class SyncManifest:
+    def __init__(self, uri: Union[str, Path]):
+        self.uri = Path(uri)
+        self._entries: Dict[str, ManifestEntry] = self._load()
+        self._pending: Dict[str, ManifestEntry] = {}
+
+    def _load(self) -> Dict[str, ManifestEntry]:
+        if not self.uri.exists():
+            return {}
+        with open(self.uri, "r") as f:
+            return {e["path"]: ManifestEntry(**e) for e in json.load(f)}
+
+    def get_changed_entry(self, file: Path) -> Optional[ManifestEntry]:
+        path = str(file.resolve())
+        stat = file.stat()
+        previous = self._pending.get(path) or self._entries.get(path)
+        if previous and previous.size == stat.st_size and previous.mtime_ns == stat.st_mtime_ns:
+            return None
+
+        entry = ManifestEntry(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns, content_hash=compute_file_hash(file=file))
+        if previous and previous.size == entry.size and previous.content_hash == entry.content_hash:
+            self._pending[path] = entry
+            return None
+
+        return entry
+
+    def record(self, entry: ManifestEntry):
+        self._pending[entry.path] = entry
+
+    def commit(self):
+        if not self._pending:
+            return
+
+        self._entries.update(self._pending)
+        self._pending = {}
+        self.uri.parent.mkdir(parents=True, exist_ok=True)
+        temporary_uri = self.uri.with_suffix(".tmp")
+        with open(temporary_uri, "w") as f:
+            json.dump([asdict(e) for e in self._entries.values()], fp=f)
+        os.replace(temporary_uri, self.uri)
+        logger.info(f"Committed {len(self._entries)} entries into the sync manifest {self.uri}.")
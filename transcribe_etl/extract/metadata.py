@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Union, List, Tuple, Optional, Iterable
+
+import pandas as pd
+
+from loguru import logger
+
+from transcribe_etl.extract.helper import get_input_metadata, UNMAPPED_PIN
+
+METADATA_INDEX_COLUMNS = ["file_path", "audio_duration", "corpus_code", "email", "gender", "native_language", "pin"]
+
+
+class MetadataIndex:
+    def __init__(self, qa_report_db_uri: Union[Path, str], input_metadata_uri: Union[Path, str], uri: Union[Path, str]):
+        self.qa_report_db_uri = Path(qa_report_db_uri)
+        self.input_metadata_uri = Path(input_metadata_uri)
+        self.uri = Path(uri)
+        self.uri.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.uri, timeout=30, check_same_thread=False)
+        self._con.execute("CREATE TABLE IF NOT EXISTS sources (qa_report_db_uri TEXT, qa_report_mtime INTEGER, input_metadata_uri TEXT, input_metadata_mtime INTEGER)")
+        self._con.commit()
+
+    def _get_source_versions(self) -> Tuple:
+        return str(self.qa_report_db_uri), os.stat(self.qa_report_db_uri).st_mtime_ns, str(self.input_metadata_uri), os.stat(self.input_metadata_uri).st_mtime_ns
+
+    def refresh(self):
+        source_versions = self._get_source_versions()
+        with self._lock:
+            if self._get_indexed_source_versions() == source_versions:
+                return
+
+            self._con.execute("ATTACH DATABASE ? AS qa", (str(self.qa_report_db_uri),))
+            try:
+                self._con.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._get_indexed_source_versions() != source_versions:
+                        self._build(source_versions=source_versions)
+                    self._con.commit()
+                except BaseException:
+                    self._con.rollback()
+                    raise
+            finally:
+                self._con.execute("DETACH DATABASE qa")
+
+    def _get_indexed_source_versions(self) -> Optional[Tuple]:
+        return self._con.execute("SELECT * FROM sources").fetchone()
+
+    def _build(self, source_versions: Tuple):
+        logger.info(f"Building the metadata index {self.uri} from {self.qa_report_db_uri} and {self.input_metadata_uri}.")
+        input_metadata_df = get_input_metadata(input_metadata_uri=self.input_metadata_uri)
+        con = self._con
+        con.execute("CREATE TEMP TABLE IF NOT EXISTS input_metadata (directory_name TEXT, pin)")
+        con.execute("DELETE FROM temp.input_metadata")
+        con.executemany("INSERT INTO temp.input_metadata VALUES (?, ?)", input_metadata_df[["directory_name", "pin"]].astype(object).itertuples(index=False, name=None))
+        con.execute("DROP TABLE IF EXISTS main.metadata_index_build")
+        con.execute(f"CREATE TABLE main.metadata_index_build ({', '.join(METADATA_INDEX_COLUMNS)})")
+        con.execute(
+            "INSERT INTO main.metadata_index_build SELECT q.file_path, q.audio_duration, q.corpus_code, q.email, q.gender, q.native_language, COALESCE(i.pin, ?) "
+            "FROM qa.qa_report q LEFT JOIN temp.input_metadata i ON q.directory_name = i.directory_name ORDER BY q.rowid, i.rowid",
+            (UNMAPPED_PIN,),
+        )
+        con.execute("DROP TABLE IF EXISTS main.metadata_index")
+        con.execute("ALTER TABLE main.metadata_index_build RENAME TO metadata_index")
+        con.execute("CREATE INDEX IF NOT EXISTS main.metadata_index_file_path_idx ON metadata_index (file_path)")
+        con.execute("DELETE FROM sources")
+        con.execute("INSERT INTO sources VALUES (?, ?, ?, ?)", source_versions)
+
+    def probe(self, file: str) -> List[Tuple]:
+        with self._lock:
+            return self._con.execute(f"SELECT {', '.join(METADATA_INDEX_COLUMNS)} FROM metadata_index WHERE file_path = ? ORDER BY rowid", (file,)).fetchall()
+
+    def lookup(self, files: Iterable[str]) -> pd.DataFrame:
+        with self._lock:
+            con = self._con
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_files (file_path TEXT PRIMARY KEY)")
+            try:
+                con.executemany("INSERT OR IGNORE INTO temp.lookup_files VALUES (?)", ((file,) for file in files))
+                columns = ", ".join(f"m.{column}" for column in METADATA_INDEX_COLUMNS)
+                rows = con.execute(f"SELECT {columns} FROM temp.lookup_files l JOIN main.metadata_index m ON m.file_path = l.file_path ORDER BY m.rowid").fetchall()
+            finally:
+                con.execute("DELETE FROM temp.lookup_files")
+                con.commit()
+        return pd.DataFrame(rows, columns=METADATA_INDEX_COLUMNS, dtype=object)
+
+    def close(self):
+        self._con.close()
@@ -1,8 +1,23 @@
 from dataclasses import dataclass
+from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from transcribe_etl.extract.journal import RunJournal
+from transcribe_etl.extract.manifest import SyncManifest
+
+
+class StagingStrategy(str, Enum):
+    COPY = "copy"
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+    AUTO = "auto"
+    NO_STAGE = "no_stage"
 
 
 @dataclass(frozen=True)
 class StageFolder:
     extract_files: List[Path]
+    manifest: Optional[SyncManifest] = None
+    memory_map: bool = False
+    journal: Optional[RunJournal] = None
@@ -0,0 +1,162 @@
+import io
+import os
+import random
+import threading
+import time
+from abc import ABC
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Optional, Set, Union, Any, Tuple
+
+from loguru import logger
+
+from transcribe_etl.load.fingerprint import compute_fingerprint
+
+_DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+_RETRYABLE_ERROR_CODES = {"RequestTimeout", "SlowDown", "Throttling", "ThrottlingException", "InternalError", "ServiceUnavailable"}
+
+
+class StorageBackend(ABC):
+    @property
+    def uri(self) -> str:
+        raise NotImplementedError
+
+    def make_folders(self, folders: Iterable[Union[str, Path]]):
+        pass
+
+    def put_object(self, key: str, body: bytes):
+        raise NotImplementedError
+
+    def is_unchanged(self, key: str, fingerprint: str, size: int) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def to_key(folder: Union[str, Path], file_name: str) -> str:
+        return str(PurePosixPath(folder) / file_name)
+
+
+class LocalFileSystemBackend(StorageBackend):
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self._created_folders: Set[Path] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def uri(self) -> str:
+        return self.root.resolve().as_uri()
+
+    def make_folders(self, folders: Iterable[Union[str, Path]]):
+        for folder in {self.root / folder for folder in folders} - self._created_folders:
+            folder.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                self._created_folders.add(folder)
+
+    def put_object(self, key: str, body: bytes):
+        self.make_folders(folders=[PurePosixPath(key).parent])
+        with open(self.root / key, "wb") as f:
+            f.write(body)
+
+    def is_unchanged(self, key: str, fingerprint: str, size: int) -> bool:
+        path = self.root / key
+        if not path.is_file() or path.stat().st_size != size:
+            return False
+        return compute_fingerprint(payload=path.read_bytes()) == fingerprint
+
+
+class S3Backend(StorageBackend):
+    def __init__(
+        self,
+        bucket: str,
+        prefix: Optional[str] = "",
+        client: Optional[Any] = None,
+        endpoint_url: Optional[str] = None,
+        max_pool_connections: Optional[int] = 16,
+        max_retries: Optional[int] = 5,
+        backoff: Optional[float] = 0.2,
+        multipart_threshold: Optional[int] = _DEFAULT_MULTIPART_THRESHOLD,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.multipart_threshold = multipart_threshold
+        self._max_pool_connections = max_pool_connections
+        self._owns_client = client is None
+        self._client = client or self._create_client(endpoint_url=endpoint_url, max_pool_connections=max_pool_connections)
+
+    @property
+    def uri(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}".rstrip("/")
+
+    @staticmethod
+    def _create_client(endpoint_url: Optional[str], max_pool_connections: int) -> Any:
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise ImportError("boto3 is required to use the S3Backend, install it with `pip install boto3`.")
+
+        config = Config(max_pool_connections=max_pool_connections, retries={"max_attempts": 1, "mode": "standard"}, tcp_keepalive=True)
+        return boto3.session.Session().client("s3", endpoint_url=endpoint_url, config=config)
+
+    def _to_object_key(self, key: str) -> str:
+        return str(PurePosixPath(self.prefix) / key) if self.prefix else key
+
+    def put_object(self, key: str, body: bytes):
+        object_key = self._to_object_key(key=key)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._upload(key=object_key, body=body)
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(error=e):
+                    raise
+                delay = self.backoff * (2**attempt) * (1 + random.random())  # nosec B311
+                logger.warning(f"Upload of s3://{self.bucket}/{object_key} failed ({e}), retrying in {delay:.2f}s...")
+                time.sleep(delay)
+
+    def _upload(self, key: str, body: bytes):
+        if len(body) < self.multipart_threshold:
+            self._client.put_object(Bucket=self.bucket, Key=key, Body=body)
+            return
+
+        from boto3.s3.transfer import TransferConfig
+
+        transfer_config = TransferConfig(multipart_threshold=self.multipart_threshold, max_concurrency=self._max_pool_connections)
+        self._client.upload_fileobj(io.BytesIO(body), self.bucket, key, Config=transfer_config)
+
+    def is_unchanged(self, key: str, fingerprint: str, size: int) -> bool:
+        try:
+            response = self._client.head_object(Bucket=self.bucket, Key=self._to_object_key(key=key))
+        except Exception:
+            return False
+        return response.get("ContentLength") == size and response.get("ETag", "").strip('"') == fingerprint
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        response = getattr(error, "response", None)
+        if isinstance(response, dict):
+            status_code = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+            return status_code >= 500 or response.get("Error", {}).get("Code") in _RETRYABLE_ERROR_CODES
+        try:
+            from botocore.exceptions import ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+        except ImportError:
+            return isinstance(error, (ConnectionError, TimeoutError))
+        return isinstance(error, (ConnectionError, TimeoutError, EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError))
+
+    def close(self):
+        if self._owns_client and hasattr(self._client, "close"):
+            self._client.close()
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    bucket, _, prefix = uri.split("://", 1)[1].partition("/")
+    return bucket, prefix
+
+
+def create_storage_backend(uri: str, root_folder: Union[str, Path], max_pool_connections: Optional[int] = 16) -> StorageBackend:
+    if uri.startswith("s3://"):
+        bucket, prefix = parse_s3_uri(uri=uri)
+        return S3Backend(bucket=bucket, prefix=prefix, endpoint_url=os.environ.get("S3_ENDPOINT_URL"), max_pool_connections=max_pool_connections)
+    return LocalFileSystemBackend(root=Path(root_folder) / uri)
@@ -0,0 +1,58 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from loguru import logger
+
+
+def compute_fingerprint(payload: bytes) -> str:
+    return hashlib.md5(payload, usedforsecurity=False).hexdigest()
+
+
+class FingerprintIndex:
+    def __init__(self, uri: Union[str, Path], destination: str):
+        if not destination:
+            raise ValueError("The destination of a fingerprint index is required.")
+        self.uri = Path(uri)
+        self.destination = str(destination).rstrip("/")
+        self.uri.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[str, int]] = {}
+        self._con = sqlite3.connect(self.uri, timeout=30, check_same_thread=False)
+        self._con.execute("CREATE TABLE IF NOT EXISTS fingerprints (destination TEXT, key TEXT, fingerprint TEXT, size INTEGER, PRIMARY KEY (destination, key))")
+        self._con.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            row = self._con.execute("SELECT fingerprint, size FROM fingerprints WHERE destination = ? AND key = ?", (self.destination, key)).fetchone()
+        return tuple(row) if row else None
+
+    def record(self, key: str, fingerprint: str, size: int):
+        with self._lock:
+            self._pending[key] = (fingerprint, size)
+
+    def commit(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            self._con.executemany(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)", ((self.destination, key, fingerprint, size) for key, (fingerprint, size) in pending.items())
+            )
+            self._con.commit()
+        logger.info(f"Committed {len(pending)} output fingerprints into {self.uri}.")
+
+    def invalidate(self):
+        with self._lock:
+            self._pending = {}
+            deleted = self._con.execute("DELETE FROM fingerprints WHERE destination = ?", (self.destination,)).rowcount
+            self._con.commit()
+        logger.info(f"Invalidated {deleted} output fingerprints of {self.destination} in {self.uri}.")
+
+    def close(self):
+        self.commit()
+        self._con.close()
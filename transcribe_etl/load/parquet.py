@@ -0,0 +1,77 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union, List
+
+import pandas as pd
+from loguru import logger
+
+from transcribe_etl.transform.model import TxData
+
+PARTITION_COLUMNS = ["package_date", "pin"]
+METADATA_COLUMNS = ["file", "audio_duration", "corpus_code", "email", "gender", "native_language"]
+SEGMENT_COLUMNS = ["segment_index", *TxData._fields]
+_PARTITION_FILE_NAME = "part-0.parquet"
+
+
+def generate_segment_records_df(transcription_lookup_df: pd.DataFrame) -> pd.DataFrame:
+    segments_df = transcription_lookup_df[["tx_data", *METADATA_COLUMNS, *PARTITION_COLUMNS]].explode("tx_data").dropna(subset=["tx_data"])
+    tx_data_df = pd.DataFrame(segments_df["tx_data"].tolist(), columns=list(TxData._fields), index=segments_df.index)
+    tx_data_df.insert(0, "segment_index", segments_df.groupby(level=0).cumcount())
+    records_df = pd.concat([segments_df[METADATA_COLUMNS + PARTITION_COLUMNS], tx_data_df], axis=1).reset_index(drop=True)
+    return records_df[PARTITION_COLUMNS + METADATA_COLUMNS + SEGMENT_COLUMNS]
+
+
+class ParquetSink:
+    _lock = threading.Lock()
+
+    def __init__(self, uri: str, root_folder: Union[str, Path], file_name: Optional[str] = None):
+        self.uri = uri if uri.startswith("s3://") else str(Path(root_folder) / uri)
+        self.file_name = file_name or _PARTITION_FILE_NAME
+        self.rows_written = 0
+
+    def write(self, transcription_lookup_df: pd.DataFrame) -> List[str]:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("pyarrow is required to use the ParquetSink, install it with `pip install pyarrow`.")
+
+        records_df = generate_segment_records_df(transcription_lookup_df=transcription_lookup_df)
+        paths = []
+        # Concurrent loads of the same partition would otherwise drop each other's rows while compacting it.
+        with self._lock:
+            for (package_date, pin), partition_df in records_df.groupby(PARTITION_COLUMNS, sort=True):
+                partition_path = self._to_partition_path(package_date=package_date, pin=pin, file_name=self.file_name)
+                self._write_partition(partition_path=partition_path, partition_df=partition_df.drop(columns=PARTITION_COLUMNS))
+                paths.append(partition_path)
+
+        self.rows_written += len(records_df)
+        logger.success(f"Saved {len(records_df)} segments into {len(paths)} parquet partitions under {self.uri}.")
+        return paths
+
+    @staticmethod
+    def _write_partition(partition_path: str, partition_df: pd.DataFrame):
+        # A partition holds one pin on one package date, so it is rewritten as a single file without the previous rows of the reloaded audio files,
+        # whatever the batches they are loaded in.
+        try:
+            existing_df = pd.read_parquet(partition_path, engine="pyarrow")
+            partition_df = pd.concat([existing_df[~existing_df["file"].isin(partition_df["file"])], partition_df], ignore_index=True)
+        except FileNotFoundError:
+            pass
+
+        if partition_path.startswith("s3://"):
+            partition_df.to_parquet(partition_path, engine="pyarrow", index=False)
+            return
+
+        temporary_path = f"{partition_path}.tmp"
+        partition_df.to_parquet(temporary_path, engine="pyarrow", index=False)
+        os.replace(temporary_path, partition_path)
+
+    def _to_partition_path(self, package_date: str, pin: str, file_name: str) -> str:
+        partition = f"package_date={package_date}/pin={pin}"
+        if self.uri.startswith("s3://"):
+            return f"{self.uri.rstrip('/')}/{partition}/{file_name}"
+
+        partition_folder = Path(self.uri) / partition
+        partition_folder.mkdir(parents=True, exist_ok=True)
+        return str(partition_folder / file_name)
@@ -1,64 +1,147 @@
-import json
 import os
 import re
+import threading
 import typing
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Iterable, Dict, Tuple, Iterator, NamedTuple, Optional, Union
 from dotenv import load_dotenv
 import pandas as pd
 from loguru import logger
 
-from transcribe_etl.extract.helper import get_transcription_metadata
-from transcribe_etl.transform.model import TxDataGroup, Metadata, Speaker
+from transcribe_etl.extract.metadata import MetadataIndex
+from transcribe_etl.load.serializer import JsonSerializer, create_serializer
+from transcribe_etl.streaming import iter_micro_batches
+from transcribe_etl.transform.model import TxDataGroup, TxData
 
 load_dotenv()
 
 _ROOT_FOLDER = Path(__file__).parent
+_AUDIO_FILE_PREFIX = "/audio-efs/"
+_METADATA_LOOKUP_BATCH_SIZE = 10_000
+_DEFAULT_SERIALIZER = create_serializer()
 
 
-def load_data_to_s3_bucket(save_folder: Path, file_name: str, data: typing.Union[List[dict], dict]):
-    logger.debug(f"Saving {data} into {save_folder}...")
+class TranscriptOutput(NamedTuple):
+    file: str
+    package_date: str
+    pin: str
+    save_folder: str
+    tx_file_name: str
+    meta_file_name: str
+    tx_data: List[TxData]
+    tx_metadata: dict
+
+
+def load_data_to_s3_bucket(save_folder: Path, file_name: str, data: typing.Union[List[dict], dict], serializer: Optional[JsonSerializer] = None):
+    logger.debug(f"Saving {file_name} into {save_folder}...")
     save_folder.mkdir(parents=True, exist_ok=True)
     save_file_path = f"{save_folder}/{file_name}"
-    with open(save_file_path, "w") as f:
-        f.seek(0)
-        json.dump(data, fp=f)
-        f.truncate()
+    with open(save_file_path, "wb") as f:
+        f.write((serializer or _DEFAULT_SERIALIZER).encode(data))
     logger.success("File successfully saved!")
 
 
 def parse_package_date(filename: str) -> str:
-    package_date = re.search(r"(\d{8})", filename).group()
-    return datetime.strptime(package_date, "%Y%m%d").strftime("%Y-%m-%d")
+    package_date = re.search(r"(\d{8})", filename)
+    if package_date is None:
+        raise ValueError(f"Unable to find the package date of {filename}")
+    return datetime.strptime(package_date.group(), "%Y%m%d").strftime("%Y-%m-%d")
+
+
+def parse_package_dates(files: pd.Series) -> pd.Series:
+    package_dates = files.str.extract(r"(\d{8})", expand=False)
+    if package_dates.isna().any():
+        raise ValueError(f"Unable to find the package date of {files[package_dates.isna()].tolist()}")
+
+    codes, unique_package_dates = pd.factorize(package_dates)
+    formatted_package_dates = pd.to_datetime(unique_package_dates, format="%Y%m%d").strftime("%Y-%m-%d")
+    return pd.Series(formatted_package_dates.take(codes), index=files.index, dtype=object)
+
+
+def remove_audio_file_prefix(files: pd.Series) -> pd.Series:
+    return files.str.removeprefix(_AUDIO_FILE_PREFIX)
 
 
-def get_metadata_df() -> pd.DataFrame:
+_METADATA_INDEXES: Dict[Tuple[str, str, str], MetadataIndex] = {}
+_METADATA_INDEXES_LOCK = threading.Lock()
+
+
+def get_metadata_index(uri: Union[str, Path]) -> MetadataIndex:
     _CLOUD_URI = Path(os.environ.get("CLOUD_URI"))
     _QA_REPORT_DB_URI = os.environ.get("QA_REPORT_DB_URI")
     input_metadata_uri = _CLOUD_URI / "input_metadata" / "input_file.csv"
-    metadata_df = get_transcription_metadata(qa_report_db_uri=_QA_REPORT_DB_URI, input_metadata_uri=input_metadata_uri)
-    return metadata_df
+    key = (str(_QA_REPORT_DB_URI), str(input_metadata_uri), str(uri))
+    with _METADATA_INDEXES_LOCK:
+        if key not in _METADATA_INDEXES:
+            _METADATA_INDEXES[key] = MetadataIndex(qa_report_db_uri=_QA_REPORT_DB_URI, input_metadata_uri=input_metadata_uri, uri=uri)
+        metadata_index = _METADATA_INDEXES[key]
+    metadata_index.refresh()
+    return metadata_index
 
 
-def lookup_transcript_metadata(extract_files: List[TxDataGroup]) -> pd.DataFrame:
-    logger.info("Loading Metadata Lookup Table into DataFrame...")
-    transcription_df = pd.DataFrame(data=extract_files)
-    metadata_df = get_metadata_df()
-    transcription_df["package_date"] = transcription_df["file"].apply(parse_package_date)
+def lookup_transcript_metadata(tx_data_groups: List[TxDataGroup], metadata_index: MetadataIndex) -> pd.DataFrame:
+    transcription_df = pd.DataFrame(data=tx_data_groups, columns=list(TxDataGroup._fields))
+    metadata_df = metadata_index.lookup(files=transcription_df["file"])
+    transcription_df["package_date"] = parse_package_dates(files=transcription_df["file"])
     transcription_lookup_df = pd.merge(left=transcription_df, right=metadata_df, left_on="file", right_on="file_path", how="left")
     logger.debug(f"Loaded Metadata Table of Size {transcription_lookup_df.shape}...")
     return transcription_lookup_df
 
 
-def to_py_none(data: typing.Union[typing.Optional[str], float, Speaker]) -> typing.Union[typing.Optional[str], float, Speaker]:
-    return None if pd.isna(data) else data
+def generate_tx_metadata_records(transcription_lookup_df: pd.DataFrame) -> List[dict]:
+    columns = ["file", "audio_duration", "corpus_code", "email", "gender", "native_language"]
+    values_df = transcription_lookup_df[columns].astype(object)
+    values_df = values_df.where(values_df.notna(), None)
+    return [
+        {
+            "audio_file_name": file,
+            "audio_duration": audio_duration,
+            "corpus_code": corpus_code,
+            "speaker_id": {"email": email, "gender": gender, "native_language": native_language},
+        }
+        for file, audio_duration, corpus_code, email, gender, native_language in zip(*(values_df[c].tolist() for c in columns))
+    ]
+
+
+def generate_output_paths(transcription_lookup_df: pd.DataFrame) -> pd.DataFrame:
+    pin = transcription_lookup_df["pin"].astype(object).where(transcription_lookup_df["pin"].notna(), "no-pin").astype(str)
+    filename = remove_audio_file_prefix(files=transcription_lookup_df["file"])
+    return pd.DataFrame(
+        {
+            "pin": pin,
+            "save_folder": transcription_lookup_df["package_date"] + "/" + pin,
+            "tx_file_name": filename.str.replace(".wav", "_tx.json", regex=False),
+            "meta_file_name": filename.str.replace(".wav", "_meta.json", regex=False),
+        }
+    )
+
+
+def iter_transcript_outputs(tx_data_groups: Iterable[TxDataGroup], metadata_index: MetadataIndex) -> Iterator[TranscriptOutput]:
+    for batch in iter_micro_batches(iterable=tx_data_groups, size=_METADATA_LOOKUP_BATCH_SIZE):
+        transcription_lookup_df = lookup_transcript_metadata(tx_data_groups=batch, metadata_index=metadata_index)
+        output_paths_df = generate_output_paths(transcription_lookup_df=transcription_lookup_df)
+        columns = [
+            transcription_lookup_df["file"],
+            transcription_lookup_df["package_date"],
+            output_paths_df["pin"],
+            output_paths_df["save_folder"],
+            output_paths_df["tx_file_name"],
+            output_paths_df["meta_file_name"],
+            transcription_lookup_df["tx_data"],
+        ]
+        yield from map(TranscriptOutput._make, zip(*(column.tolist() for column in columns), generate_tx_metadata_records(transcription_lookup_df=transcription_lookup_df)))
 
 
-def generate_tx_metadata(df_row: typing.Any) -> Metadata:
-    return Metadata(
-        audio_file_name=to_py_none(df_row.file),
-        audio_duration=to_py_none(df_row.audio_duration),
-        corpus_code=to_py_none(df_row.corpus_code),
-        speaker_id=Speaker(email=to_py_none(df_row.email), gender=to_py_none(df_row.gender), native_language=to_py_none(df_row.native_language)),
+def generate_transcription_lookup_df(transcript_outputs: List[TranscriptOutput]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "file": [x.file for x in transcript_outputs],
+            "tx_data": [x.tx_data for x in transcript_outputs],
+            "audio_duration": [x.tx_metadata["audio_duration"] for x in transcript_outputs],
+            "corpus_code": [x.tx_metadata["corpus_code"] for x in transcript_outputs],
+            **{k: [x.tx_metadata["speaker_id"][k] for x in transcript_outputs] for k in ["email", "gender", "native_language"]},
+            "package_date": [x.package_date for x in transcript_outputs],
+            "pin": [x.pin for x in transcript_outputs],
+        }
     )
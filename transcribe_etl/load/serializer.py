@@ -0,0 +1,88 @@
+import json
+import re
+from abc import ABC
+from typing import Any, Iterable, NamedTuple, Optional, Union, List
+
+
+class JsonSerializer(ABC):
+    name = ""
+
+    def encode(self, data: Union[List[Any], dict]) -> bytes:
+        raise NotImplementedError
+
+    def encode_records(self, records: Iterable[NamedTuple]) -> bytes:
+        # None of the backends encodes a NamedTuple as an object, and encoding each field on its own is slower than handing them a dict per record.
+        return self.encode([record._asdict() for record in records])
+
+
+# orjson and msgspec write floats outside [1e-4, 1e16) in another notation than the stdlib, e.g. 1e16 and 0.00001 for 1e+16 and 1e-05.
+_NON_STDLIB_FLOAT = re.compile(rb"\d[eE]|0\.0000")
+
+
+class StdlibJsonSerializer(JsonSerializer):
+    name = "json"
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def encode(self, data: Union[List[Any], dict]) -> bytes:
+        return self._encoder.encode(data).encode()
+
+
+class _NativeJsonSerializer(JsonSerializer):
+    def __init__(self):
+        self._fallback = StdlibJsonSerializer()
+
+    def _encode(self, data: Union[List[Any], dict]) -> bytes:
+        raise NotImplementedError
+
+    def encode(self, data: Union[List[Any], dict]) -> bytes:
+        # The fingerprints of the outputs are compared across hosts, so payloads with such floats are encoded by the stdlib to keep the same bytes whichever backend is installed.
+        payload = self._encode(data)
+        return payload if _NON_STDLIB_FLOAT.search(payload) is None else self._fallback.encode(data)
+
+
+class OrjsonSerializer(_NativeJsonSerializer):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        super().__init__()
+        self._dumps = orjson.dumps
+
+    def _encode(self, data: Union[List[Any], dict]) -> bytes:
+        return self._dumps(data)
+
+
+class MsgspecSerializer(_NativeJsonSerializer):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        super().__init__()
+        self._encoder = msgspec.json.Encoder()
+
+    def _encode(self, data: Union[List[Any], dict]) -> bytes:
+        return self._encoder.encode(data)
+
+
+_SERIALIZERS = {serializer.name: serializer for serializer in [OrjsonSerializer, MsgspecSerializer, StdlibJsonSerializer]}
+
+
+def create_serializer(name: Optional[str] = None) -> JsonSerializer:
+    if name and name != "auto":
+        if name not in _SERIALIZERS:
+            raise ValueError(f"Unknown json serializer {name}, choose one of: auto, {', '.join(_SERIALIZERS)}.")
+        try:
+            return _SERIALIZERS[name]()
+        except ImportError:
+            raise ImportError(f"{name} is required to use the {_SERIALIZERS[name].__name__}, install it with `pip install {name}`.")
+
+    for serializer in [OrjsonSerializer, MsgspecSerializer]:
+        try:
+            return serializer()
+        except ImportError:
+            continue
+    return StdlibJsonSerializer()
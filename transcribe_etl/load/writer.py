@@ -0,0 +1,104 @@
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import List, Optional, Iterable, Union
+
+from loguru import logger
+
+from transcribe_etl.load.backend import StorageBackend, LocalFileSystemBackend
+from transcribe_etl.load.fingerprint import FingerprintIndex, compute_fingerprint
+from transcribe_etl.load.serializer import JsonSerializer, create_serializer
+
+_DEFAULT_MAX_WORKERS = 8
+
+
+class S3BucketWriter:
+    def __init__(
+        self,
+        backend: Optional[StorageBackend] = None,
+        max_workers: Optional[int] = _DEFAULT_MAX_WORKERS,
+        max_pending: Optional[int] = None,
+        serializer: Optional[JsonSerializer] = None,
+        skip_unchanged: Optional[bool] = False,
+        fingerprint_index: Optional[FingerprintIndex] = None,
+    ):
+        self.backend = backend or LocalFileSystemBackend(root=Path())
+        self.serializer = serializer or create_serializer()
+        self.skip_unchanged = skip_unchanged
+        self.fingerprint_index = fingerprint_index
+        max_workers = max_workers or _DEFAULT_MAX_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-bucket-writer")
+        self._pending_slots = threading.BoundedSemaphore(value=max_pending or max_workers * 4)
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._started_at = time.perf_counter()
+        self._closed = False
+        self.files_written = 0
+        self.bytes_written = 0
+        self.files_skipped = 0
+
+    def __enter__(self) -> "S3BucketWriter":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def make_folders(self, folders: Iterable[Union[str, Path]]):
+        self.backend.make_folders(folders=folders)
+
+    def write(self, save_folder: Union[str, Path], file_name: str, data: typing.Union[List[dict], dict, bytes]):
+        self.make_folders(folders=[save_folder])
+        payload = data if isinstance(data, bytes) else self.serializer.encode(data)
+        self._pending_slots.acquire()
+        future = self._executor.submit(self._write_object, StorageBackend.to_key(folder=save_folder, file_name=file_name), payload)
+        future.add_done_callback(lambda _: self._pending_slots.release())
+        self._futures.append(future)
+
+    def _write_object(self, key: str, payload: bytes):
+        fingerprint = compute_fingerprint(payload=payload) if self.skip_unchanged else None
+        if fingerprint is not None and self._is_unchanged(key=key, fingerprint=fingerprint, size=len(payload)):
+            with self._lock:
+                self.files_skipped += 1
+            return
+
+        self.backend.put_object(key=key, body=payload)
+        with self._lock:
+            self.files_written += 1
+            self.bytes_written += len(payload)
+        if fingerprint is not None and self.fingerprint_index is not None:
+            self.fingerprint_index.record(key=key, fingerprint=fingerprint, size=len(payload))
+
+    def _is_unchanged(self, key: str, fingerprint: str, size: int) -> bool:
+        if self.fingerprint_index is not None and self.fingerprint_index.get(key=key) == (fingerprint, size):
+            return True
+        if not self.backend.is_unchanged(key=key, fingerprint=fingerprint, size=size):
+            return False
+        if self.fingerprint_index is not None:
+            self.fingerprint_index.record(key=key, fingerprint=fingerprint, size=size)
+        return True
+
+    def flush(self):
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        if self._closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.backend.close()
+            if self.fingerprint_index is not None:
+                self.fingerprint_index.commit()
+            self._closed = True
+
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        logger.success(
+            f"Saved {self.files_written} files ({self.bytes_written} bytes) and skipped {self.files_skipped} unchanged files in {elapsed:.2f}s: "
+            f"{self.files_written / elapsed:.1f} files/s, {self.bytes_written / elapsed:.1f} bytes/s."
+        )
@@ -0,0 +1,23 @@
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+
+class SampledDebugLog:
+    def __init__(self, enabled: Optional[bool] = False, every: Optional[int] = 1):
+        self.enabled = enabled
+        self.every = max(every or 1, 1)
+        self._counts: Dict[str, int] = {}
+
+    def log(self, message: str, *args: Any):
+        if not self.enabled:
+            return
+
+        count = self._counts.get(message, 0)
+        self._counts[message] = count + 1
+        if count % self.every == 0:
+            logger.opt(depth=1).debug(message, *args)
+
+    def info(self, message: str, *args: Any):
+        if self.enabled:
+            logger.opt(depth=1).info(message, *args)
@@ -1,50 +1,358 @@
+import asyncio
+import itertools
+import json
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import List, Any
+from typing import List, Iterable, Iterator, Optional, Tuple
 
-import pandas as pd
 from dotenv import load_dotenv
+from loguru import logger
 
-from transcribe_etl.extract.datasynchronizer import DataSynchronizer
-from transcribe_etl.extract.model import StageFolder
-from transcribe_etl.load.s3_bucket import load_data_to_s3_bucket, lookup_transcript_metadata, generate_tx_metadata
-from transcribe_etl.transform.model import TxDataGroup
+from transcribe_etl.extract.datasynchronizer import DataSynchronizer, get_run_journal_uri
+from transcribe_etl.extract.journal import RunJournal
+from transcribe_etl.extract.model import StageFolder, StagingStrategy
+from transcribe_etl.load.s3_bucket import get_metadata_index, iter_transcript_outputs, generate_transcription_lookup_df
+from transcribe_etl.load.backend import create_storage_backend
+from transcribe_etl.load.fingerprint import FingerprintIndex
+from transcribe_etl.load.parquet import ParquetSink
+from transcribe_etl.load.serializer import create_serializer
+from transcribe_etl.load.writer import S3BucketWriter
+from transcribe_etl.streaming import iter_in_thread, iter_micro_batches
+from transcribe_etl.telemetry import SpanMetrics, Telemetry, merge_spans, span
+from transcribe_etl.transform.model import TxDataGroup, ExtractShard
 from transcribe_etl.transform.text_extract import TextExtractParser, SegmentProcessor
 
 load_dotenv()
 
 _ROOT_FOLDER = Path(__file__).parent.parent
+_DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+_DEFAULT_LOAD_WORKERS = 8
+_DEFAULT_STREAM_BATCH_SIZE = 1000
+_DEFAULT_STREAM_QUEUE_SIZE = 4
+_DEFAULT_ASYNC_LOAD_CONCURRENCY = 2
+_JOURNAL_CHECKPOINT_SIZE = 1000
+_DEFAULT_METADATA_INDEX_URI = "stage/metadata_index.db"
 
 
-def extract_data(execution_id: uuid.UUID, container_name: str, file_type: str) -> StageFolder:
+def extract_data(
+    execution_id: uuid.UUID,
+    container_name: str,
+    file_type: str,
+    incremental: Optional[bool] = False,
+    staging_strategy: Optional[StagingStrategy] = StagingStrategy.COPY,
+    staging_workers: Optional[int] = 1,
+    journal: Optional[bool] = False,
+) -> StageFolder:
     cloud_uri = os.environ.get("CLOUD_URI")
-    data_syncer = DataSynchronizer(execution_id=execution_id)
-    extract_files = data_syncer.sync_files_from_blob(uri=cloud_uri, container_name=container_name, file_type=file_type)
-    return StageFolder(extract_files=extract_files)
+    data_syncer = DataSynchronizer(execution_id=execution_id, incremental=incremental, staging_strategy=staging_strategy, staging_workers=staging_workers, journal=journal)
+    with span(name="extract_data") as current_span:
+        extract_files = data_syncer.sync_files_from_blob(uri=cloud_uri, container_name=container_name, file_type=file_type)
+        current_span.records_out, current_span.bytes = len(extract_files), sum(os.path.getsize(f) for f in extract_files)
+    return StageFolder(extract_files=extract_files, manifest=data_syncer.manifest, memory_map=data_syncer.staging_strategy == StagingStrategy.NO_STAGE, journal=data_syncer.journal)
 
 
-def transcribe_from_txt(stage_folder: StageFolder) -> List[TxDataGroup]:
-    text_annotator = TextExtractParser(segment_processor=SegmentProcessor())
-    tx_data_groups = []
+def iter_extract_data(data_syncer: DataSynchronizer, container_name: str, file_type: str) -> Iterator[Path]:
+    cloud_uri = os.environ.get("CLOUD_URI")
+    with span(name="extract_data") as current_span:
+        for extract_file in data_syncer.iter_files_from_blob(uri=cloud_uri, container_name=container_name, file_type=file_type):
+            current_span.records_out += 1
+            current_span.bytes += os.path.getsize(extract_file)
+            yield extract_file
+
+
+def transcribe_from_txt(stage_folder: StageFolder, workers: Optional[int] = None, shard_size: int = _DEFAULT_SHARD_SIZE) -> List[TxDataGroup]:
+    with span(name="transcribe_from_txt") as current_span:
+        if workers is not None and workers > 1:
+            tx_data_groups = _transcribe_from_txt_in_parallel(stage_folder=stage_folder, workers=workers, shard_size=shard_size)
+        else:
+            text_annotator = _create_text_annotator(memory_map=stage_folder.memory_map)
+            tx_data_groups = []
+            for file in stage_folder.extract_files:
+                tx_data_groups.extend(text_annotator.execute(file=file))
+
+        current_span.records_in = len(stage_folder.extract_files)
+        current_span.records_out = sum(len(group.tx_data) for group in tx_data_groups)
+        current_span.bytes = sum(os.path.getsize(f) for f in stage_folder.extract_files)
+    if stage_folder.journal is not None:
+        stage_folder.journal.record_parsed(staged_files=stage_folder.extract_files)
+    return tx_data_groups
+
+
+def _transcribe_from_txt_in_parallel(stage_folder: StageFolder, workers: int, shard_size: int) -> List[TxDataGroup]:
+    file_shards = [TextExtractParser.split_into_shards(file=file, shard_size=shard_size) for file in stage_folder.extract_files]
+    logger.info(f"Transcribing {sum(map(len, file_shards))} shards from {len(file_shards)} files using {workers} workers.")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = [shard for shards in file_shards for shard in shards]
+        shard_results = [_merge_shard_spans(shard_result=shard_result) for shard_result in executor.map(_transcribe_shard, shards, itertools.repeat(stage_folder.memory_map))]
+
+    tx_data_groups, results = [], iter(shard_results)
+    for shards in file_shards:
+        file_results = [group for _ in shards for group in next(results)]
+        tx_data_groups.extend(SegmentProcessor.merge_tx_data_groups(tx_data_groups=file_results))
+    return tx_data_groups
+
+
+def _transcribe_shard(shard: ExtractShard, memory_map: Optional[bool] = False) -> Tuple[List[TxDataGroup], List[SpanMetrics]]:
+    # The telemetry of the run is not shared with the worker processes, so they collect their own spans for the run to merge.
+    with Telemetry(execution_id="").activate() as telemetry:
+        text_annotator = _create_text_annotator(memory_map=memory_map)
+        tx_data_groups = text_annotator.execute_shard(shard=shard)
+    return tx_data_groups, list(telemetry.spans.values())
+
+
+def _merge_shard_spans(shard_result: Tuple[List[TxDataGroup], List[SpanMetrics]]) -> List[TxDataGroup]:
+    tx_data_groups, spans = shard_result
+    merge_spans(spans=spans)
+    return tx_data_groups
+
+
+def _create_text_annotator(memory_map: Optional[bool] = False) -> TextExtractParser:
+    verbose, log_every = _get_bool_env(name="VERBOSE"), _get_int_env(name="DEBUG_LOG_EVERY")
+    segment_processor = SegmentProcessor(verbose=verbose, log_every=log_every)
+    return TextExtractParser(segment_processor=segment_processor, verbose=verbose, memory_map=memory_map, log_every=log_every)
+
+
+def stream_from_txt(stage_folder: StageFolder) -> Iterator[TxDataGroup]:
+    text_annotator = _create_text_annotator(memory_map=stage_folder.memory_map)
     for file in stage_folder.extract_files:
-        tx_data_groups.extend(text_annotator.execute(file=file))
+        yield from text_annotator.stream(file=file)
+
+
+def iter_transcribe_from_txt(extract_files: Iterable[Path], memory_map: Optional[bool] = False, journal: Optional[RunJournal] = None) -> Iterator[TxDataGroup]:
+    text_annotator = _create_text_annotator(memory_map=memory_map)
+    with span(name="transcribe_from_txt") as current_span:
+        for file in extract_files:
+            current_span.records_in += 1
+            current_span.bytes += os.path.getsize(file)
+            for tx_data_group in text_annotator.stream(file=file):
+                current_span.records_out += len(tx_data_group.tx_data)
+                yield tx_data_group
+            if journal is not None:
+                journal.record_parsed(staged_files=[file])
+
+
+def load_data(data: List[TxDataGroup], workers: Optional[int] = None, journal: Optional[RunJournal] = None, writer: Optional[S3BucketWriter] = None):
+    if journal is not None:
+        committed_outputs = journal.get_committed_outputs()
+        data = [group for group in data if group.file not in committed_outputs]
+
+    if not data:
+        logger.info("No transcriptions to load.")
+        return
+
+    with span(name="load_data") as current_span:
+        current_span.records_in = len(data)
+        with nullcontext(writer) if writer is not None else open_output_writer(workers=workers) as output_writer:
+            current_span.records_out, current_span.records_skipped, current_span.bytes = _write_outputs(data=data, writer=output_writer, journal=journal)
+
+
+@contextmanager
+def open_output_writer(workers: Optional[int] = None) -> Iterator[S3BucketWriter]:
+    workers = workers or _DEFAULT_LOAD_WORKERS
+    backend = create_storage_backend(uri=os.environ.get("S3_BUCKET_URI"), root_folder=_ROOT_FOLDER, max_pool_connections=workers)
+    skip_unchanged, fingerprint_index_uri = _get_bool_env(name="SKIP_UNCHANGED_OUTPUTS"), os.environ.get("OUTPUT_FINGERPRINT_INDEX_URI")
+    fingerprint_index = FingerprintIndex(uri=_ROOT_FOLDER / fingerprint_index_uri, destination=backend.uri) if skip_unchanged and fingerprint_index_uri else None
+    try:
+        if fingerprint_index is not None and _get_bool_env(name="OUTPUT_FINGERPRINT_INDEX_RESET"):
+            fingerprint_index.invalidate()
+        serializer = create_serializer(name=os.environ.get("JSON_SERIALIZER"))
+        with S3BucketWriter(backend=backend, max_workers=workers, serializer=serializer, skip_unchanged=skip_unchanged, fingerprint_index=fingerprint_index) as writer:
+            yield writer
+    finally:
+        if fingerprint_index is not None:
+            fingerprint_index.close()
+
+
+def _write_outputs(data: List[TxDataGroup], writer: S3BucketWriter, journal: Optional[RunJournal]) -> Tuple[int, int, int]:
+    with span(name="lookup_transcript_metadata") as current_span:
+        metadata_index = get_metadata_index(uri=_ROOT_FOLDER / (os.environ.get("METADATA_INDEX_URI") or _DEFAULT_METADATA_INDEX_URI))
+        transcript_outputs = list(iter_transcript_outputs(tx_data_groups=data, metadata_index=metadata_index))
+        current_span.records_in, current_span.records_out = len(data), len(transcript_outputs)
+
+    parquet_uri = os.environ.get("PARQUET_URI")
+    if parquet_uri:
+        with span(name="write_parquet") as current_span:
+            parquet_sink = ParquetSink(uri=parquet_uri, root_folder=_ROOT_FOLDER)
+            # Written in checkpoints to bound the size of the exploded segments, each one compacted into the partitions it touches.
+            for checkpoint in iter_micro_batches(iterable=transcript_outputs, size=_JOURNAL_CHECKPOINT_SIZE):
+                parquet_sink.write(transcription_lookup_df=generate_transcription_lookup_df(transcript_outputs=checkpoint))
+            current_span.records_out = parquet_sink.rows_written
+
+    with span(name="write_outputs") as current_span:
+        # The writer may be shared by the batches of a run, so only the files of this batch are counted.
+        files_written, files_skipped, bytes_written = writer.files_written, writer.files_skipped, writer.bytes_written
+        for checkpoint in iter_micro_batches(iterable=transcript_outputs, size=_JOURNAL_CHECKPOINT_SIZE):
+            for output in checkpoint:
+                writer.write(save_folder=output.save_folder, file_name=output.tx_file_name, data=writer.serializer.encode_records(records=output.tx_data))
+                writer.write(save_folder=output.save_folder, file_name=output.meta_file_name, data=output.tx_metadata)
+                current_span.records_in += 1
+            if journal is not None:
+                writer.flush()
+                journal.record_outputs(audio_files=[output.file for output in checkpoint])
+        writer.flush()
+        if writer.fingerprint_index is not None:
+            writer.fingerprint_index.commit()
+        current_span.records_out, current_span.records_skipped = writer.files_written - files_written, writer.files_skipped - files_skipped
+        current_span.bytes = writer.bytes_written - bytes_written
+    return current_span.records_out, current_span.records_skipped, current_span.bytes
+
+
+def data_pipeline(
+    transform_workers: Optional[int] = None,
+    load_workers: Optional[int] = None,
+    incremental_sync: Optional[bool] = None,
+    staging_strategy: Optional[StagingStrategy] = None,
+    staging_workers: Optional[int] = None,
+    streaming: Optional[bool] = None,
+    stream_batch_size: Optional[int] = None,
+    stream_queue_size: Optional[int] = None,
+    asynchronous: Optional[bool] = None,
+    load_concurrency: Optional[int] = None,
+    resume: Optional[str] = None,
+) -> Telemetry:
+    transform_workers = transform_workers or _get_int_env(name="TRANSFORM_WORKERS")
+    load_workers = load_workers or _get_int_env(name="LOAD_WORKERS")
+    incremental_sync = _get_bool_env(name="INCREMENTAL_SYNC") if incremental_sync is None else incremental_sync
+    staging_strategy = staging_strategy or os.environ.get("STAGING_STRATEGY") or StagingStrategy.COPY
+    staging_workers = staging_workers or _get_int_env(name="STAGING_WORKERS") or 1
+    streaming = _get_bool_env(name="STREAMING") if streaming is None else streaming
+    asynchronous = _get_bool_env(name="ASYNC_PIPELINE") if asynchronous is None else asynchronous
+    if asynchronous and streaming:
+        raise ValueError("The asynchronous and the streaming pipelines cannot be combined, enable only one of ASYNC_PIPELINE and STREAMING.")
+    resume = resume or os.environ.get("RESUME_EXECUTION_ID")
+    journal_enabled = bool(resume) or _get_bool_env(name="RUN_JOURNAL")
+    execution_id = uuid.UUID(resume) if resume else uuid.uuid4()
+    if resume and RunJournal(uri=get_run_journal_uri(), execution_id=str(execution_id)).has_entries():
+        logger.info(f"Resuming execution {execution_id} from its run journal.")
+    elif resume:
+        logger.warning(f"Found no run journal entries of execution {execution_id}, starting it as a new journaled run.")
+    telemetry = Telemetry(execution_id=str(execution_id))
+    with telemetry.activate():
+        if asynchronous:
+            data_syncer = DataSynchronizer(
+                execution_id=execution_id, incremental=incremental_sync, staging_strategy=staging_strategy, staging_workers=staging_workers, journal=journal_enabled
+            )
+            asyncio.run(
+                async_data_pipeline(
+                    data_syncer=data_syncer,
+                    transform_workers=transform_workers or os.cpu_count(),
+                    load_workers=load_workers,
+                    load_concurrency=load_concurrency or _get_int_env(name="ASYNC_LOAD_CONCURRENCY") or _DEFAULT_ASYNC_LOAD_CONCURRENCY,
+                )
+            )
+            manifest, journal = data_syncer.manifest, data_syncer.journal
+        elif streaming:
+            data_syncer = DataSynchronizer(
+                execution_id=execution_id, incremental=incremental_sync, staging_strategy=staging_strategy, staging_workers=staging_workers, journal=journal_enabled
+            )
+            stream_data_pipeline(
+                data_syncer=data_syncer,
+                load_workers=load_workers,
+                batch_size=stream_batch_size or _get_int_env(name="STREAM_BATCH_SIZE") or _DEFAULT_STREAM_BATCH_SIZE,
+                queue_size=stream_queue_size or _get_int_env(name="STREAM_QUEUE_SIZE") or _DEFAULT_STREAM_QUEUE_SIZE,
+            )
+            manifest, journal = data_syncer.manifest, data_syncer.journal
+        else:
+            stg_folder: StageFolder = extract_data(
+                container_name="extract_files",
+                file_type="txt",
+                execution_id=execution_id,
+                incremental=incremental_sync,
+                staging_strategy=staging_strategy,
+                staging_workers=staging_workers,
+                journal=journal_enabled,
+            )
+            tx_data: List[TxDataGroup] = transcribe_from_txt(stage_folder=stg_folder, workers=transform_workers)
+            load_data(data=tx_data, workers=load_workers, journal=stg_folder.journal)
+            manifest, journal = stg_folder.manifest, stg_folder.journal
+
+        if journal is not None:
+            journal.record_parsed_files_loaded()
+        if manifest is not None:
+            manifest.commit()
+
+    _emit_run_report(telemetry=telemetry)
+    return telemetry
+
+
+def stream_data_pipeline(data_syncer: DataSynchronizer, load_workers: Optional[int], batch_size: int, queue_size: int):
+    memory_map = data_syncer.staging_strategy == StagingStrategy.NO_STAGE
+    extract_files = iter_in_thread(iter_extract_data(data_syncer=data_syncer, container_name="extract_files", file_type="txt"), maxsize=queue_size)
+    tx_data_groups = iter_transcribe_from_txt(extract_files=extract_files, memory_map=memory_map, journal=data_syncer.journal)
+    logger.info(f"Streaming the pipeline in micro-batches of {batch_size} transcriptions with {queue_size} batches in flight.")
+    # The micro-batches are loaded one after the other, so they share the storage backend, fingerprint index and upload pool of the run.
+    with open_output_writer(workers=load_workers) as writer:
+        for batch in iter_in_thread(iter_micro_batches(iterable=tx_data_groups, size=batch_size), maxsize=queue_size):
+            load_data(data=batch, journal=data_syncer.journal, writer=writer)
+
+
+async def async_data_pipeline(data_syncer: DataSynchronizer, transform_workers: int, load_workers: Optional[int], load_concurrency: int, shard_size: int = _DEFAULT_SHARD_SIZE):
+    files = await asyncio.to_thread(data_syncer.list_files_to_sync, uri=os.environ.get("CLOUD_URI"), container_name="extract_files", file_type="txt")
+    logger.info(
+        f"Processing {len(files)} extract files asynchronously with {data_syncer.staging_workers} staging, {transform_workers} transform and {load_concurrency} load workers."
+    )
+    staging, loading = asyncio.Semaphore(data_syncer.staging_workers), asyncio.Semaphore(load_concurrency)
+    pending_files, memory_map = iter(files), data_syncer.staging_strategy == StagingStrategy.NO_STAGE
+    with ProcessPoolExecutor(max_workers=transform_workers) as executor:
+
+        async def process_extract_file(file: Path):
+            async with staging:
+                extract_file = await asyncio.to_thread(_stage_extract_file, data_syncer=data_syncer, file=file, container_name="extract_files")
+            tx_data_groups = await _transcribe_from_txt_in_executor(executor=executor, file=extract_file, shard_size=shard_size, memory_map=memory_map)
+            if data_syncer.journal is not None:
+                await asyncio.to_thread(data_syncer.journal.record_parsed, staged_files=[extract_file])
+            async with loading:
+                await asyncio.to_thread(load_data, data=tx_data_groups, workers=load_workers, journal=data_syncer.journal)
+            if data_syncer.journal is not None:
+                await asyncio.to_thread(data_syncer.journal.record_loaded, staged_files=[extract_file])
+
+        async def process_extract_files():
+            # A fixed set of workers pulls from the shared iterator, so only the files in flight have a coroutine instead of one per file up front.
+            for file in pending_files:
+                await process_extract_file(file=file)
+
+        await asyncio.gather(*(process_extract_files() for _ in range(min(transform_workers + load_concurrency, len(files)))))
+
+
+def _stage_extract_file(data_syncer: DataSynchronizer, file: Path, container_name: str) -> Path:
+    with span(name="extract_data") as current_span:
+        extract_file = data_syncer.stage_file(file=file, container_name=container_name)
+        current_span.records_out, current_span.bytes = 1, os.path.getsize(extract_file)
+    return extract_file
+
+
+async def _transcribe_from_txt_in_executor(executor: ProcessPoolExecutor, file: Path, shard_size: int, memory_map: Optional[bool] = False) -> List[TxDataGroup]:
+    loop = asyncio.get_running_loop()
+    with span(name="transcribe_from_txt") as current_span:
+        shards = await asyncio.to_thread(TextExtractParser.split_into_shards, file=file, shard_size=shard_size)
+        shard_results = [
+            _merge_shard_spans(shard_result=shard_result)
+            for shard_result in await asyncio.gather(*(loop.run_in_executor(executor, _transcribe_shard, shard, memory_map) for shard in shards))
+        ]
+        tx_data_groups = SegmentProcessor.merge_tx_data_groups(tx_data_groups=[group for groups in shard_results for group in groups])
+        current_span.records_in, current_span.bytes = 1, os.path.getsize(file)
+        current_span.records_out = sum(len(group.tx_data) for group in tx_data_groups)
     return tx_data_groups
 
 
-def load_data(data: List[TxDataGroup]):
-    s3_bucket_uri = _ROOT_FOLDER / os.environ.get("S3_BUCKET_URI")
-    transcription_lookup_df = lookup_transcript_metadata(extract_files=data)
-    for _df in transcription_lookup_df.itertuples():  # type: Any
-        package_date = s3_bucket_uri / Path(_df.package_date)
-        save_path = package_date / "no-pin" if pd.isna(_df.pin) else package_date / str(_df.pin)
-        filename = _df.file.strip("/audio-efs/")
-        tx_metadata = generate_tx_metadata(df_row=_df).to_dict()
-        load_data_to_s3_bucket(save_folder=save_path, file_name=filename.replace(".wav", "_tx.json"), data=_df.tx_data)
-        load_data_to_s3_bucket(save_folder=save_path, file_name=filename.replace(".wav", "_meta.json"), data=tx_metadata)
+def _emit_run_report(telemetry: Telemetry):
+    logger.info(f"Run report: {json.dumps(telemetry.to_report())}")
+    run_report_uri = os.environ.get("RUN_REPORT_URI")
+    if run_report_uri:
+        telemetry.write_report(path=_ROOT_FOLDER / run_report_uri)
+    prometheus_metrics_uri = os.environ.get("PROMETHEUS_METRICS_URI")
+    if prometheus_metrics_uri:
+        telemetry.write_prometheus(path=_ROOT_FOLDER / prometheus_metrics_uri)
+
+
+def _get_int_env(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
 
 
-def data_pipeline():
-    stg_folder: StageFolder = extract_data(container_name="extract_files", file_type="txt", execution_id=uuid.uuid4())
-    tx_data: List[TxDataGroup] = transcribe_from_txt(stage_folder=stg_folder)
-    load_data(data=tx_data)
+def _get_bool_env(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
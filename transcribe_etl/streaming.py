@@ -0,0 +1,56 @@
+import contextvars
+import itertools
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+_POLL_INTERVAL = 0.1
+_DONE = object()
+
+
+class _StageFailure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def iter_micro_batches(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    for batch in iter(lambda: list(itertools.islice(iterator, size)), []):
+        yield batch
+
+
+def iter_in_thread(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageFailure(exception=e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+    thread.start()
+    try:
+        for item in iter(items.get, _DONE):
+            if isinstance(item, _StageFailure):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
@@ -0,0 +1,251 @@
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+from loguru import logger
+
+T = TypeVar("T")
+
+_METRIC_PREFIX = "transcribe_etl_span"
+_PAGE_SIZE = resource.getpagesize()
+_RSS_SAMPLE_INTERVAL = 0.05
+_PROMETHEUS_METRICS = {
+    "calls": ("counter", "Number of times the span ran."),
+    "wall_seconds": ("counter", "Wall clock time spent in the span."),
+    "cpu_seconds": ("counter", "Process CPU time spent in the span."),
+    "rss_bytes": ("gauge", "Peak resident set size of the process sampled during the span."),
+    "rss_growth_bytes": ("gauge", "Largest growth of the peak resident set size of the process over its size at the start of the span."),
+    "records_in": ("counter", "Records consumed by the span."),
+    "records_out": ("counter", "Records produced by the span."),
+    "records_skipped": ("counter", "Records the span skipped, ie. unchanged outputs."),
+    "bytes": ("counter", "Bytes read or written by the span."),
+}
+
+
+@dataclass
+class SpanMetrics:
+    name: str
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rss_bytes: int = 0
+    rss_growth_bytes: int = 0
+    records_in: int = 0
+    records_out: int = 0
+    records_skipped: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class Span:
+    records_in: int = 0
+    records_out: int = 0
+    records_skipped: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class Telemetry:
+    execution_id: str
+    spans: Dict[str, SpanMetrics] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        current_span = Span()
+        started_at, cpu_started_at = time.perf_counter(), time.process_time()
+        sample, rss_started_at = _PEAK_RSS_SAMPLER.start()
+        try:
+            yield current_span
+        finally:
+            wall_seconds, cpu_seconds, rss_bytes = time.perf_counter() - started_at, time.process_time() - cpu_started_at, _PEAK_RSS_SAMPLER.stop(sample=sample)
+            self._record(
+                span_metrics=self._to_span_metrics(
+                    name=name, current_span=current_span, wall_seconds=wall_seconds, cpu_seconds=cpu_seconds, rss_bytes=rss_bytes, rss_started_at=rss_started_at
+                )
+            )
+
+    def iter_span(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        current_span, iterator, wall_seconds = Span(), iter(iterable), 0.0
+        started_at, cpu_started_at = time.perf_counter(), time.process_time()
+        sample, rss_started_at = _PEAK_RSS_SAMPLER.start()
+        try:
+            while True:
+                # The stages of a stream pull from each other, so the time spent in the stages nested in this one is excluded from it.
+                nested_seconds = _NESTED_ITER_SPANS.seconds
+                nested_seconds.append(0.0)
+                item_started_at = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    item_seconds = time.perf_counter() - item_started_at
+                    wall_seconds += item_seconds - nested_seconds.pop()
+                    if nested_seconds:
+                        nested_seconds[-1] += item_seconds
+                current_span.records_out += 1
+                yield item
+        finally:
+            # Reading the process CPU time per item would slow the stream down, so the span gets its share of the CPU time spent during its lifetime.
+            lifetime_seconds, cpu_seconds, rss_bytes = time.perf_counter() - started_at, time.process_time() - cpu_started_at, _PEAK_RSS_SAMPLER.stop(sample=sample)
+            cpu_seconds = cpu_seconds * wall_seconds / lifetime_seconds if lifetime_seconds > 0 else 0.0
+            self._record(
+                span_metrics=self._to_span_metrics(
+                    name=name, current_span=current_span, wall_seconds=wall_seconds, cpu_seconds=cpu_seconds, rss_bytes=rss_bytes, rss_started_at=rss_started_at
+                )
+            )
+
+    def merge(self, spans: Iterable[SpanMetrics]):
+        for span_metrics in spans:
+            self._record(span_metrics=span_metrics)
+
+    @staticmethod
+    def _to_span_metrics(name: str, current_span: Span, wall_seconds: float, cpu_seconds: float, rss_bytes: int, rss_started_at: int) -> SpanMetrics:
+        return SpanMetrics(
+            name=name, calls=1, wall_seconds=wall_seconds, cpu_seconds=cpu_seconds, rss_bytes=rss_bytes, rss_growth_bytes=rss_bytes - rss_started_at, **asdict(current_span)
+        )
+
+    def _record(self, span_metrics: SpanMetrics):
+        with self._lock:
+            metrics = self.spans.setdefault(span_metrics.name, SpanMetrics(name=span_metrics.name))
+            is_first_call = metrics.calls == 0
+            metrics.calls += span_metrics.calls
+            metrics.wall_seconds += span_metrics.wall_seconds
+            metrics.cpu_seconds += span_metrics.cpu_seconds
+            metrics.rss_bytes = max(metrics.rss_bytes, span_metrics.rss_bytes)
+            metrics.rss_growth_bytes = span_metrics.rss_growth_bytes if is_first_call else max(metrics.rss_growth_bytes, span_metrics.rss_growth_bytes)
+            metrics.records_in += span_metrics.records_in
+            metrics.records_out += span_metrics.records_out
+            metrics.records_skipped += span_metrics.records_skipped
+            metrics.bytes += span_metrics.bytes
+
+    @contextmanager
+    def activate(self) -> Iterator["Telemetry"]:
+        token = _ACTIVE_TELEMETRY.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE_TELEMETRY.reset(token)
+
+    def to_report(self) -> dict:
+        return {"execution_id": self.execution_id, "spans": [asdict(metrics) for metrics in self.spans.values()]}
+
+    def to_prometheus(self) -> str:
+        # A label per execution would create new series on every run, so the execution id is only written as a comment.
+        lines = [f"# execution_id {self.execution_id}"]
+        for metric, (metric_type, description) in _PROMETHEUS_METRICS.items():
+            metric_name = f"{_METRIC_PREFIX}_{metric}_total" if metric_type == "counter" else f"{_METRIC_PREFIX}_{metric}"
+            lines.append(f"# HELP {metric_name} {description}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for metrics in self.spans.values():
+                lines.append(f'{metric_name}{{span="{metrics.name}"}} {getattr(metrics, metric)}')
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: Union[str, Path]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_report(), fp=f, indent=2)
+        logger.info(f"Run report saved into {path}.")
+
+    def write_prometheus(self, path: Union[str, Path]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+        logger.info(f"Prometheus metrics saved into {path}.")
+
+
+_ACTIVE_TELEMETRY: ContextVar[Optional[Telemetry]] = ContextVar("active_telemetry", default=None)
+
+
+class _NestedIterSpans(threading.local):
+    def __init__(self):
+        self.seconds: List[float] = []
+
+
+_NESTED_ITER_SPANS = _NestedIterSpans()
+
+
+def get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class _PeakRssSampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._samples = itertools.count()
+        self._reset()
+        # A forked worker inherits neither the sampling thread nor a lock that is safe to take.
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._peaks: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> Tuple[int, int]:
+        rss_bytes = get_rss_bytes()
+        with self._lock:
+            sample = next(self._samples)
+            self._peaks[sample] = rss_bytes
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, daemon=True)
+                self._thread.start()
+        return sample, rss_bytes
+
+    def stop(self, sample: int) -> int:
+        rss_bytes = get_rss_bytes()
+        with self._lock:
+            return max(self._peaks.pop(sample), rss_bytes)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            rss_bytes = get_rss_bytes()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for sample, peak_rss_bytes in self._peaks.items():
+                    self._peaks[sample] = max(peak_rss_bytes, rss_bytes)
+
+
+_PEAK_RSS_SAMPLER = _PeakRssSampler(interval=_RSS_SAMPLE_INTERVAL)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    telemetry = _ACTIVE_TELEMETRY.get()
+    if telemetry is None:
+        yield Span()
+        return
+
+    with telemetry.span(name=name) as current_span:
+        yield current_span
+
+
+def iter_span(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    telemetry = _ACTIVE_TELEMETRY.get()
+    if telemetry is None:
+        return iter(iterable)
+    return telemetry.iter_span(name=name, iterable=iterable)
+
+
+def merge_spans(spans: Iterable[SpanMetrics]):
+    telemetry = _ACTIVE_TELEMETRY.get()
+    if telemetry is not None:
+        telemetry.merge(spans=spans)
@@ -1,44 +1,175 @@
+import collections
+import multiprocessing
+import multiprocessing.connection
 import os.path
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import Union, Optional, List, Tuple
+from typing import Union, Optional, List, Tuple, Any, Iterator, Set, Dict
 
-import whisper
 from loguru import logger
-from pyannote.audio import Audio, Pipeline
-from pyannote.core import Segment
-from whisper import Whisper
 
-from transcribe_etl.transform.helper import split_interval, convert_duration_to_millisecond
+from transcribe_etl.extract.helper import compute_file_hash
+from transcribe_etl.transform.audio_models import (
+    AudioDecoder,
+    PyannoteAudioDecoder,
+    PyannoteSpeakerDiarizer,
+    SpeakerDiarizer,
+    SpeechRecognizer,
+    WhisperSpeechRecognizer,
+    get_cached_model,
+)
+from transcribe_etl.transform.result_cache import TranscriptResultCache
+from transcribe_etl.transform.helper import split_interval, convert_duration_to_millisecond, split_into_windows
 from transcribe_etl.transform.base import Processor
 from transcribe_etl.transform.model import TxData
 
+_POLL_INTERVAL = 0.1
+_WINDOW_EDGE_TOLERANCE = 0.05
+
 
 class AudioAnnotator(Processor):
-    def __init__(self, token: str, verbose: Optional[bool] = False):
+    def __init__(
+        self,
+        token: str,
+        verbose: Optional[bool] = False,
+        speech_model_name: Optional[str] = "small",
+        batch_size: Optional[int] = 8,
+        speech_recognizer: Optional[SpeechRecognizer] = None,
+        diarizer: Optional[SpeakerDiarizer] = None,
+        audio_decoder: Optional[AudioDecoder] = None,
+        result_cache: Optional[TranscriptResultCache] = None,
+        window_seconds: Optional[float] = None,
+        window_overlap_seconds: Optional[float] = 5.0,
+    ):
         # TODO: NEED TO GET A TOKEN and access to speaker-diarization and segmentation
         #  https://huggingface.co/pyannote/speaker-diarization
         #  https://huggingface.co/pyannote/segmentation
         super().__init__(verbose=verbose)
         self._token = token
-        if not self.verbose:
-            logger.disable("transform.audio")
+        self.speech_model_name = speech_model_name
+        self.batch_size = batch_size
+        self._speech_recognizer = speech_recognizer
+        self._diarizer = diarizer
+        self._audio_decoder = audio_decoder
+        self.window_seconds = window_seconds
+        self.window_overlap_seconds = window_overlap_seconds
+        self.result_cache = result_cache
+
+    @property
+    def speech_recognizer(self) -> SpeechRecognizer:
+        if self._speech_recognizer is not None:
+            return self._speech_recognizer
+        key = ("whisper", self.speech_model_name, self.batch_size)
+        return get_cached_model(key=key, loader=lambda: WhisperSpeechRecognizer(name=self.speech_model_name, batch_size=self.batch_size))
+
+    @property
+    def diarizer(self) -> SpeakerDiarizer:
+        if self._diarizer is not None:
+            return self._diarizer
+        return get_cached_model(key=("pyannote", self._token), loader=lambda: PyannoteSpeakerDiarizer(token=self._token))
+
+    @property
+    def audio_decoder(self) -> AudioDecoder:
+        if self._audio_decoder is not None:
+            return self._audio_decoder
+        return get_cached_model(key=("pyannote-audio",), loader=PyannoteAudioDecoder)
+
+    @property
+    def model_version(self) -> str:
+        speech_recognizer = self._speech_recognizer.version if self._speech_recognizer is not None else WhisperSpeechRecognizer.describe_version(name=self.speech_model_name)
+        diarizer = self._diarizer.version if self._diarizer is not None else PyannoteSpeakerDiarizer.describe_version()
+        audio_decoder = self._audio_decoder.version if self._audio_decoder is not None else f"{PyannoteAudioDecoder.__name__}/{PyannoteAudioDecoder.sample_rate}"
+        window = f"+window-{self.window_seconds}/{self.window_overlap_seconds}" if self.window_seconds else ""
+        return f"{speech_recognizer}+{diarizer}+{audio_decoder}{window}"
 
     def execute(self, file: Union[str, Path]) -> List[TxData]:
-        logger.debug("Sample only AudioAnnotator")
+        self.debug_log.log("Sample only AudioAnnotator")
 
         if not os.path.exists(file):
             logger.error(f"File {file} does not exists")
             return []
 
-        audio = Audio(sample_rate=16000, mono=True)
-        speech_model = self._prepare_whisper_speech_recognition()
-        diarization = self._prepare_pyannote_diarization(file=file)
+        if self.result_cache is None:
+            return self.annotate(file=file)
+
+        content_hash, model_version = compute_file_hash(file=file), self.model_version
+        annotated_audios = self.result_cache.get(content_hash=content_hash, model_version=model_version)
+        if annotated_audios is not None:
+            self.debug_log.log("Reusing the cached transcript of {}.", file)
+            return annotated_audios
+
+        annotated_audios = self.annotate(file=file)
+        self.result_cache.put(content_hash=content_hash, model_version=model_version, tx_data=annotated_audios)
+        return annotated_audios
+
+    def annotate(self, file: Union[str, Path]) -> List[TxData]:
+        if self.window_seconds:
+            return [tx for window in self.iter_annotated_windows(file=file) for tx in window]
 
+        audio_decoder = self.audio_decoder
+        waveform = audio_decoder.decode(file=file)
+        tracks = list(self.diarizer.diarize(waveform=waveform, sample_rate=audio_decoder.sample_rate))
+        crops = [audio_decoder.crop(waveform=waveform, start=segment.start, end=segment.end) for segment, _ in tracks]
+        return self._create_tx_data(tracks=tracks, texts=self.speech_recognizer.transcribe(waveforms=crops))
+
+    def iter_annotated_windows(self, file: Union[str, Path]) -> Iterator[List[TxData]]:
+        audio_decoder = self.audio_decoder
+        duration = audio_decoder.get_duration(file=file)
+        previous_tracks, previous_window_end, speakers = [], 0.0, set()
+        for window_start, start, end, window_end in split_into_windows(duration=duration, window=self.window_seconds, overlap=self.window_overlap_seconds):
+            waveform, window_tracks = self._diarize_window(file=file, start=window_start, end=window_end)
+            # A segment still open at the edge of the window would be cut short, so extend the window until every segment kept from it has ended.
+            while window_end < duration and any(start <= segment.start < end and segment.end >= window_end - _WINDOW_EDGE_TOLERANCE for segment, _ in window_tracks):
+                window_end = min(window_end + self.window_seconds, duration)
+                waveform, window_tracks = self._diarize_window(file=file, start=window_start, end=window_end)
+            # Each window is diarized on its own, so its labels are only meaningful inside it: map them onto the speakers they overlap with in the previous window.
+            labels = self._match_speakers(tracks=window_tracks, previous_tracks=previous_tracks, overlap_start=window_start, overlap_end=previous_window_end, speakers=speakers)
+            window_tracks = [(segment, labels[speaker]) for segment, speaker in window_tracks]
+            tracks = [(segment, speaker) for segment, speaker in window_tracks if start <= segment.start < end]
+            crops = [audio_decoder.crop(waveform=waveform, start=segment.start - window_start, end=segment.end - window_start) for segment, _ in tracks]
+            texts = self.speech_recognizer.transcribe(waveforms=crops)
+            previous_tracks, previous_window_end = window_tracks, window_end
+            yield self._create_tx_data(tracks=tracks, texts=texts)
+
+    def _diarize_window(self, file: Union[str, Path], start: float, end: float) -> Tuple[Any, List[Tuple[Any, str]]]:
+        waveform = self.audio_decoder.decode_window(file=file, start=start, end=end)
+        tracks = [
+            (self._shift_segment(segment=segment, offset=start), speaker)
+            for segment, speaker in self.diarizer.diarize(waveform=waveform, sample_rate=self.audio_decoder.sample_rate)
+        ]
+        return waveform, tracks
+
+    @staticmethod
+    def _match_speakers(tracks: List[Tuple[Any, str]], previous_tracks: List[Tuple[Any, str]], overlap_start: float, overlap_end: float, speakers: Set[str]) -> Dict[str, str]:
+        overlaps = collections.Counter()
+        for segment, speaker in tracks:
+            for previous_segment, previous_speaker in previous_tracks:
+                overlap = min(segment.end, previous_segment.end, overlap_end) - max(segment.start, previous_segment.start, overlap_start)
+                if overlap > 0:
+                    overlaps[speaker, previous_speaker] += overlap
+
+        labels = {}
+        for (speaker, previous_speaker), _ in overlaps.most_common():
+            if speaker not in labels and previous_speaker not in labels.values():
+                labels[speaker] = previous_speaker
+
+        # Speakers that are not heard in the overlap cannot be matched, so they get a label no other window has used rather than being conflated with another speaker.
+        for speaker in dict.fromkeys(speaker for _, speaker in tracks):
+            if speaker in labels:
+                continue
+            label = speaker
+            if label in speakers:
+                label = next(f"SPEAKER_{i:02d}" for i in range(len(speakers), 2 * len(speakers) + 1) if f"SPEAKER_{i:02d}" not in speakers)
+            labels[speaker] = label
+            speakers.add(label)
+        return labels
+
+    def _create_tx_data(self, tracks: List[Tuple[Any, str]], texts: List[str]) -> List[TxData]:
         annotated_audios = []
 
-        for segment, _, speaker in diarization.itertracks(yield_label=True):
-            waveform, sample_rate = audio.crop(file=file, segment=segment)
-            text = speech_model.transcribe(waveform.squeeze().numpy())["text"]
+        for (segment, speaker), text in zip(tracks, texts):
             start, end = self._parse_interval_ms(segment=segment)
             tx_data = TxData(speaker_tag=f"<#{speaker}>", text=text, start=start, end=end)
             annotated_audios.append(tx_data)
@@ -46,19 +177,11 @@ class AudioAnnotator(Processor):
         return annotated_audios
 
     @staticmethod
-    def _prepare_whisper_speech_recognition(name: Optional[str] = "small") -> Whisper:
-        return whisper.load_model(name=name)
-
-    def _prepare_pyannote_diarization(self, file: Union[str, Path]) -> Pipeline:
-        if self._token is None:
-            raise Exception(
-                "Token not found! You need to provide the token to use the diarization model. " "Don't have one yet? Create a new one here: https://huggingface.co/settings/tokens"
-            )
-        pipeline = Pipeline.from_pretrained(checkpoint_path="pyannote/speaker-diarization", use_auth_token=self._token)
-        return pipeline(file)
+    def _shift_segment(segment: Any, offset: float) -> Any:
+        return segment if offset == 0 else type(segment)(segment.start + offset, segment.end + offset)
 
     @staticmethod
-    def _parse_interval_ms(segment: Segment) -> Tuple[int, int]:
+    def _parse_interval_ms(segment: Any) -> Tuple[int, int]:
         interval = str(segment).replace(r" --> ", "").strip(r"(\[\] )")
         duration = split_interval(interval=interval)
         start = convert_duration_to_millisecond(duration=duration[0])
@@ -66,5 +189,135 @@ class AudioAnnotator(Processor):
         return start, end
 
 
-def annotate_multiple_audio_files(audio_files: List[Path], audio_annotator: AudioAnnotator):
-    return [tx for file in audio_files for tx in audio_annotator.execute(file=file)]
+def annotate_multiple_audio_files(
+    audio_files: List[Path],
+    audio_annotator: AudioAnnotator,
+    workers: Optional[int] = None,
+    torch_threads: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[TxData]:
+    if (workers is None or workers <= 1) and timeout is None:
+        return [tx for file in audio_files for tx in audio_annotator.execute(file=file)]
+
+    annotated_audio_files = dict(
+        iter_annotated_audio_files(audio_files=audio_files, audio_annotator=audio_annotator, workers=max(workers or 1, 1), torch_threads=torch_threads, timeout=timeout)
+    )
+    return [tx for file in audio_files for tx in annotated_audio_files[file]]
+
+
+class _AudioAnnotationWorker:
+    def __init__(self, context: BaseContext, audio_annotator: AudioAnnotator, torch_threads: Optional[int]):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_annotate_audio_files_from_connection, args=(audio_annotator, torch_threads, worker_connection), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        self.task: Optional[int] = None
+        self.started_at: Optional[float] = None
+
+    def assign(self, index: int, file: Path):
+        self.task, self.started_at = index, None
+        try:
+            self.connection.send((index, file))
+        except OSError:
+            pass
+
+    def receive(self) -> Optional[Tuple[str, Any]]:
+        try:
+            while self.connection.poll():
+                status, payload = self.connection.recv()
+                if status == "started":
+                    self.started_at = payload
+                    continue
+                self.task, self.started_at = None, None
+                return status, payload
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+def iter_annotated_audio_files(
+    audio_files: List[Path],
+    audio_annotator: AudioAnnotator,
+    workers: int,
+    torch_threads: Optional[int] = None,
+    timeout: Optional[float] = None,
+    start_method: Optional[str] = "spawn",
+) -> Iterator[Tuple[Path, List[TxData]]]:
+    context = multiprocessing.get_context(start_method)
+    pending_tasks = collections.deque(enumerate(audio_files))
+    worker_slots = [_AudioAnnotationWorker(context=context, audio_annotator=audio_annotator, torch_threads=torch_threads) for _ in range(min(workers, len(audio_files)))]
+    logger.info(f"Annotating {len(audio_files)} audio files using {len(worker_slots)} workers.")
+    retried_tasks: Set[int] = set()
+    remaining_tasks = len(audio_files)
+    try:
+        while remaining_tasks:
+            for slot, worker in enumerate(worker_slots):
+                if worker.task is None and pending_tasks:
+                    if not worker.process.is_alive():
+                        worker.stop()
+                        worker = worker_slots[slot] = _AudioAnnotationWorker(context=context, audio_annotator=audio_annotator, torch_threads=torch_threads)
+                    worker.assign(*pending_tasks.popleft())
+
+            result = _receive_annotated_audio_file(worker_slots=worker_slots, timeout=timeout)
+            if result is None:
+                multiprocessing.connection.wait([worker.connection for worker in worker_slots if worker.task is not None], timeout=_POLL_INTERVAL)
+                continue
+
+            slot, index, status, payload = result
+            if status in ("crashed", "timed_out"):
+                is_started = worker_slots[slot].started_at is not None
+                worker_slots[slot].stop()
+                worker_slots[slot] = _AudioAnnotationWorker(context=context, audio_annotator=audio_annotator, torch_threads=torch_threads)
+                if not is_started and index not in retried_tasks:
+                    retried_tasks.add(index)
+                    pending_tasks.appendleft((index, audio_files[index]))
+                    continue
+
+            if status != "done":
+                logger.error(f"Failed to annotate {audio_files[index]}: {payload}")
+            remaining_tasks -= 1
+            yield audio_files[index], payload if status == "done" else []
+    finally:
+        for worker in worker_slots:
+            worker.stop()
+
+
+def _receive_annotated_audio_file(worker_slots: List[_AudioAnnotationWorker], timeout: Optional[float]) -> Optional[Tuple[int, int, str, Any]]:
+    for slot, worker in enumerate(worker_slots):
+        index = worker.task
+        if index is None:
+            continue
+
+        result = worker.receive()
+        if result is None and not worker.process.is_alive():
+            result = worker.receive() or ("crashed", f"worker exited with {worker.process.exitcode}.")
+        if result is None and timeout is not None and worker.started_at is not None and time.time() - worker.started_at > timeout:
+            result = "timed_out", f"timed out after {timeout}s."
+        if result is not None:
+            return (slot, index, *result)
+    return None
+
+
+def _annotate_audio_files_from_connection(audio_annotator: AudioAnnotator, torch_threads: Optional[int], connection: Connection):
+    if torch_threads:
+        _set_torch_threads(torch_threads=torch_threads)
+
+    for index, file in iter(connection.recv, None):
+        connection.send(("started", time.time()))
+        try:
+            connection.send(("done", audio_annotator.execute(file=file)))
+        except Exception as e:
+            connection.send(("failed", repr(e)))
+
+
+def _set_torch_threads(torch_threads: int):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(torch_threads)
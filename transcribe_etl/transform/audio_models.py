@@ -0,0 +1,166 @@
+import os
+import threading
+from abc import ABC
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+from loguru import logger
+
+_SAMPLE_RATE = 16000
+_DEFAULT_BATCH_SIZE = 8
+_MODEL_CACHE: Dict[Hashable, Any] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+T = TypeVar("T")
+
+
+def get_cached_model(key: Hashable, loader: Callable[[], T]) -> T:
+    with _MODEL_CACHE_LOCK:
+        if key not in _MODEL_CACHE:
+            logger.info(f"Loading {key} into the model cache...")
+            _MODEL_CACHE[key] = loader()
+        return _MODEL_CACHE[key]
+
+
+def clear_model_cache():
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE.clear()
+
+
+def get_package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class AudioDecoder(ABC):
+    sample_rate = _SAMPLE_RATE
+
+    @property
+    def version(self) -> str:
+        return f"{type(self).__name__}/{self.sample_rate}"
+
+    def decode(self, file: Union[str, Path]) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_duration(self, file: Union[str, Path]) -> float:
+        return len(self._decode_last_file(file=file)) / self.sample_rate
+
+    def decode_window(self, file: Union[str, Path], start: float, end: float) -> np.ndarray:
+        return self.crop(waveform=self._decode_last_file(file=file), start=start, end=end)
+
+    def _decode_last_file(self, file: Union[str, Path]) -> np.ndarray:
+        # Decoders that cannot seek decode a file once for all of its windows instead of once per window; PyannoteAudioDecoder seeks instead.
+        key = (str(file), os.stat(file).st_mtime_ns)
+        last_decoded = getattr(self, "_last_decoded", None)
+        if last_decoded is None or last_decoded[0] != key:
+            last_decoded = (key, self.decode(file=file))
+            self._last_decoded = last_decoded
+        return last_decoded[1]
+
+    def crop(self, waveform: np.ndarray, start: float, end: float) -> np.ndarray:
+        start_sample, end_sample = round(start * self.sample_rate), round(end * self.sample_rate)
+        return waveform[start_sample:end_sample]
+
+
+class PyannoteAudioDecoder(AudioDecoder):
+    def __init__(self, sample_rate: Optional[int] = _SAMPLE_RATE):
+        from pyannote.audio import Audio
+
+        self.sample_rate = sample_rate
+        self._audio = Audio(sample_rate=sample_rate, mono=True)
+
+    def decode(self, file: Union[str, Path]) -> np.ndarray:
+        waveform, _ = self._audio(file)
+        return waveform.squeeze(0).numpy()
+
+    def get_duration(self, file: Union[str, Path]) -> float:
+        return self._audio.get_duration(file)
+
+    def decode_window(self, file: Union[str, Path], start: float, end: float) -> np.ndarray:
+        from pyannote.core import Segment
+
+        waveform, _ = self._audio.crop(file, Segment(start, end))
+        return waveform.squeeze(0).numpy()
+
+
+class SpeakerDiarizer(ABC):
+    @property
+    def version(self) -> str:
+        return type(self).__name__
+
+    def diarize(self, waveform: np.ndarray, sample_rate: int) -> Iterable[Tuple[Any, str]]:
+        raise NotImplementedError
+
+
+class PyannoteSpeakerDiarizer(SpeakerDiarizer):
+    def __init__(self, token: str, checkpoint_path: Optional[str] = "pyannote/speaker-diarization"):
+        if token is None:
+            raise Exception(
+                "Token not found! You need to provide the token to use the diarization model. " "Don't have one yet? Create a new one here: https://huggingface.co/settings/tokens"
+            )
+        from pyannote.audio import Pipeline
+
+        self.checkpoint_path = checkpoint_path
+        self._pipeline = Pipeline.from_pretrained(checkpoint_path=checkpoint_path, use_auth_token=token)
+
+    @property
+    def version(self) -> str:
+        return self.describe_version(checkpoint_path=self.checkpoint_path)
+
+    @staticmethod
+    def describe_version(checkpoint_path: Optional[str] = "pyannote/speaker-diarization") -> str:
+        return f"pyannote.audio-{get_package_version('pyannote.audio')}/{checkpoint_path}"
+
+    def diarize(self, waveform: np.ndarray, sample_rate: int) -> Iterable[Tuple[Any, str]]:
+        import torch
+
+        diarization = self._pipeline({"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": sample_rate})
+        return [(segment, speaker) for segment, _, speaker in diarization.itertracks(yield_label=True)]
+
+
+class SpeechRecognizer(ABC):
+    @property
+    def version(self) -> str:
+        return type(self).__name__
+
+    def transcribe(self, waveforms: List[np.ndarray]) -> List[str]:
+        raise NotImplementedError
+
+
+class WhisperSpeechRecognizer(SpeechRecognizer):
+    def __init__(self, name: Optional[str] = "small", batch_size: Optional[int] = _DEFAULT_BATCH_SIZE):
+        import whisper
+
+        self.name = name
+        self.batch_size = batch_size
+        self._whisper = whisper
+        self._model = whisper.load_model(name=name)
+        self._options = whisper.DecodingOptions(fp16=self._model.device.type == "cuda")
+
+    @property
+    def version(self) -> str:
+        return self.describe_version(name=self.name)
+
+    @staticmethod
+    def describe_version(name: Optional[str] = "small") -> str:
+        return f"openai-whisper-{get_package_version('openai-whisper')}/{name}"
+
+    def transcribe(self, waveforms: List[np.ndarray]) -> List[str]:
+        import torch
+
+        texts = [""] * len(waveforms)
+        fits_in_a_window = [i for i, waveform in enumerate(waveforms) if len(waveform) <= self._whisper.audio.N_SAMPLES]
+        for batch_start in range(0, len(fits_in_a_window), self.batch_size):
+            batch_end = batch_start + self.batch_size
+            batch = fits_in_a_window[batch_start:batch_end]
+            mel = torch.stack([self._whisper.log_mel_spectrogram(self._whisper.pad_or_trim(torch.from_numpy(waveforms[i]))) for i in batch])
+            for i, result in zip(batch, self._whisper.decode(self._model, mel.to(self._model.device), self._options)):
+                texts[i] = result.text
+
+        for i in sorted(set(range(len(waveforms))) - set(fits_in_a_window)):
+            texts[i] = self._model.transcribe(waveforms[i])["text"]
+        return texts
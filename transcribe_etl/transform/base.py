@@ -2,12 +2,14 @@ from abc import ABC
 from pathlib import Path
 from typing import List, Optional, Union
 
+from transcribe_etl.log import SampledDebugLog
 from transcribe_etl.transform.model import TxData
 
 
 class Processor(ABC):
-    def __init__(self, verbose: Optional[bool] = False):
+    def __init__(self, verbose: Optional[bool] = False, log_every: Optional[int] = 1):
         self.verbose = verbose
+        self.debug_log = SampledDebugLog(enabled=verbose, every=log_every)
 
     def execute(self, file: Union[str, Path]) -> List[TxData]:
         raise NotImplementedError
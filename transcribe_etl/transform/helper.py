@@ -1,9 +1,13 @@
+import math
 import re
-from typing import Tuple
+from typing import Iterator, Tuple
+
+
+_INTERVAL_PATTERN = re.compile(r"(\d{2}:\d{2}:\d{1,2}\.*\d{0,3})\s(\d{2}:\d{2}:\d{1,2}\.*\d{0,3})")
 
 
 def split_interval(interval: str) -> Tuple[str, str]:
-    matched_groups = re.findall(r"(\d{2}:\d{2}:\d{1,2}\.*\d{0,3})\s(\d{2}:\d{2}:\d{1,2}\.*\d{0,3})", interval.strip())
+    matched_groups = _INTERVAL_PATTERN.findall(interval.strip())
     start, end = matched_groups[0] if len(matched_groups) > 0 else ("", "")
     return start, end
 
@@ -20,3 +24,13 @@ def convert_interval_to_milliseconds(interval: str) -> Tuple[int, int]:
     start_ms = convert_duration_to_millisecond(duration=start)
     end_ms = convert_duration_to_millisecond(duration=end)
     return start_ms, end_ms
+
+
+def convert_seconds_to_millisecond(seconds: str, fraction: str) -> int:
+    return int(seconds) * 1000 + int(fraction[:3].ljust(3, "0"))
+
+
+def split_into_windows(duration: float, window: float, overlap: float) -> Iterator[Tuple[float, float, float, float]]:
+    for i in range(math.ceil(duration / window)):
+        start, end = i * window, min((i + 1) * window, duration)
+        yield max(start - overlap, 0.0), start, end, min(end + overlap, duration)
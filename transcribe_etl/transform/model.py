@@ -1,16 +1,18 @@
 from dataclasses import dataclass
-from typing import Optional, List, Union
+from typing import Optional, List, Union, NamedTuple
 
 from dataclasses_json import DataClassJsonMixin
 
 
-@dataclass(frozen=True)
-class TxData(DataClassJsonMixin):
+class TxData(NamedTuple):
     speaker_tag: str
     text: str
     start: int
     end: int
 
+    def to_dict(self) -> dict:
+        return self._asdict()
+
 
 @dataclass(frozen=True)
 class Speaker:
@@ -27,8 +29,7 @@ class Metadata(DataClassJsonMixin):
     speaker_id: Speaker
 
 
-@dataclass(frozen=True)
-class ExtractedTranscription(DataClassJsonMixin):
+class ExtractedTranscription(NamedTuple):
     file: str
     interval: str
     transcription: str
@@ -37,16 +38,14 @@ class ExtractedTranscription(DataClassJsonMixin):
     labels: Optional[str] = None
 
 
-@dataclass(frozen=True)
-class Transcription(DataClassJsonMixin):
+class Transcription(NamedTuple):
     speaker_tag: str
     text: str
     eol: str
     size: int
 
 
-@dataclass(frozen=True)
-class Segment(DataClassJsonMixin):
+class Segment(NamedTuple):
     file: str
     speaker_tag: str
     text: str
@@ -56,7 +55,16 @@ class Segment(DataClassJsonMixin):
     end: int
 
 
-@dataclass(frozen=True)
-class TxDataGroup(DataClassJsonMixin):
+class TxDataGroup(NamedTuple):
     file: str
     tx_data: List[TxData]
+
+    def to_dict(self) -> dict:
+        return {"file": self.file, "tx_data": [x.to_dict() for x in self.tx_data]}
+
+
+@dataclass(frozen=True)
+class ExtractShard:
+    file: str
+    start: int
+    end: int
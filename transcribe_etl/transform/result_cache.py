@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+from loguru import logger
+
+from transcribe_etl.transform.model import TxData
+
+_DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class TranscriptResultCache:
+    def __init__(self, uri: Union[str, Path], max_bytes: Optional[int] = _DEFAULT_MAX_BYTES):
+        self.uri = Path(uri)
+        self.max_bytes = max_bytes
+        self.uri.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con, self._pid = None, None
+        with self._lock:
+            con = self._connection
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS transcript_results "
+                "(content_hash TEXT, model_version TEXT, payload TEXT, size INTEGER, last_accessed REAL, PRIMARY KEY (content_hash, model_version))"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS transcript_results_last_accessed_idx ON transcript_results (last_accessed)")
+            con.commit()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # The annotator ships the cache to its worker processes, which open their own connection instead of sharing the parent's.
+        if self._con is None or self._pid != os.getpid():
+            self._con, self._pid = sqlite3.connect(self.uri, timeout=30, check_same_thread=False), os.getpid()
+        return self._con
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.update(_lock=None, _con=None, _pid=None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str, model_version: str) -> Optional[List[TxData]]:
+        with self._lock:
+            con = self._connection
+            row = con.execute("SELECT payload FROM transcript_results WHERE content_hash = ? AND model_version = ?", (content_hash, model_version)).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE transcript_results SET last_accessed = ? WHERE content_hash = ? AND model_version = ?", (time.time(), content_hash, model_version))
+            con.commit()
+        return [TxData(*tx_data) for tx_data in json.loads(row[0])]
+
+    def put(self, content_hash: str, model_version: str, tx_data: List[TxData]):
+        payload = json.dumps([list(x) for x in tx_data])
+        with self._lock:
+            con = self._connection
+            con.execute("INSERT OR REPLACE INTO transcript_results VALUES (?, ?, ?, ?, ?)", (content_hash, model_version, payload, len(payload), time.time()))
+            self._evict(con=con)
+            con.commit()
+
+    def _evict(self, con: sqlite3.Connection):
+        cursor = con.execute(
+            "DELETE FROM transcript_results WHERE rowid IN ("
+            "SELECT rowid FROM (SELECT rowid, SUM(size) OVER (ORDER BY last_accessed DESC, rowid DESC) AS cumulative_size FROM transcript_results) "
+            "WHERE cumulative_size > ?)",
+            (self.max_bytes,),
+        )
+        if cursor.rowcount:
+            logger.debug(f"Evicted {cursor.rowcount} least recently used transcripts from {self.uri}.")
+
+    def close(self):
+        with self._lock:
+            if self._con is not None and self._pid == os.getpid():
+                self._con.close()
+            self._con, self._pid = None, None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM transcript_results").fetchone()[0]
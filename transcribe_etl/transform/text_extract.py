@@ -1,15 +1,29 @@
-import re
+import itertools
+import mmap
+import os
+import sqlite3
 from pathlib import Path
-from typing import List, Tuple, Union, Optional
+from typing import List, Tuple, Union, Optional, Iterable, Iterator
 
 from loguru import logger
 
+from transcribe_etl.log import SampledDebugLog
+from transcribe_etl.streaming import iter_micro_batches
+from transcribe_etl.telemetry import iter_span, span
 from transcribe_etl.transform.base import Processor
 from transcribe_etl.transform.helper import convert_interval_to_milliseconds
-from transcribe_etl.transform.model import TxData, ExtractedTranscription, Transcription, Segment, TxDataGroup
+from transcribe_etl.transform.tokenizer import tokenize_transcription, iter_timed_transcription_groups, convert_eol_to_millisecond
+from transcribe_etl.transform.model import TxData, ExtractedTranscription, Transcription, Segment, TxDataGroup, ExtractShard
+
+
+_QUIET_LOG = SampledDebugLog(enabled=False)
+_SPILL_BATCH_SIZE = 10_000
 
 
 class SegmentProcessor:
+    def __init__(self, verbose: Optional[bool] = False, log_every: Optional[int] = 1):
+        self.debug_log = SampledDebugLog(enabled=verbose, every=log_every)
+
     @staticmethod
     def _get_speaker_tag_field(segment: Segment, previous_segment: Segment) -> str:
         if segment.speaker_tag == "<#no-speech>":
@@ -33,18 +47,18 @@ class SegmentProcessor:
             return previous_segment, text
 
     @staticmethod
-    def _get_interval_field(segment: Segment, tx_data: List[Segment]) -> Tuple[int, int]:
-        is_within_same_audio = tx_data and tx_data[-1].file == segment.file
+    def _get_interval_field(segment: Segment, last_segment: Optional[Segment]) -> Tuple[int, int]:
+        is_within_same_audio = last_segment and last_segment.file == segment.file
 
         if segment.eol == "~":
             return 0, 0
 
         elif is_within_same_audio:
             if segment.eol == "\n":
-                start = tx_data[-1].end
+                start = last_segment.end
                 end = segment.end
             else:
-                start = tx_data[-1].end
+                start = last_segment.end
                 end = segment.start + segment.eol
             return start, end
 
@@ -56,110 +70,277 @@ class SegmentProcessor:
                 start, end = segment.start, segment.end
             return start, end
 
-    def combine_and_measure_segments(self, segments: List[Segment]) -> List[Segment]:
-        logger.info("Combining segments using tilde, and measuring the duration for each segments")
+    def combine_and_measure_segments(self, segments: Iterable[Segment]) -> List[Segment]:
+        self.debug_log.info("Combining segments using tilde, and measuring the duration for each segments")
+        with span(name="combine_and_measure_segments") as current_span:
+            tx_data = list(self.iter_combined_segments(segments=segments))
+            current_span.records_out = len(tx_data)
+        self.debug_log.info("Finished combining {} segments and measuring transcription duration", len(tx_data))
+        return tx_data
+
+    def iter_combined_segments(self, segments: Iterable[Segment]) -> Iterator[Segment]:
         previous_segment = None
-        tx_data = []
+        last_segment = None
         for segment in segments:
-            previous_segment, new_segment = self._adjust_duration_and_speaker_text_tags(previous_segment, segment, tx_data=tx_data)
+            previous_segment, new_segment = self._adjust_duration_and_speaker_text_tags(previous_segment, segment, last_segment=last_segment)
 
             if new_segment.start == new_segment.end == 0:
                 previous_segment = segment
                 continue
 
-            logger.debug(f"Parsed: {new_segment}")
-            tx_data.append(new_segment)
-
-        logger.info(f"Finished combining {len(tx_data)} segments and measuring transcription duration")
-        return tx_data
+            self.debug_log.log("Parsed: {}", new_segment)
+            last_segment = new_segment
+            yield new_segment
 
-    def _adjust_duration_and_speaker_text_tags(self, previous_segment: Segment, segment: Segment, tx_data: List[Segment]) -> Tuple[Segment, Segment]:
+    def _adjust_duration_and_speaker_text_tags(self, previous_segment: Segment, segment: Segment, last_segment: Optional[Segment]) -> Tuple[Segment, Segment]:
         speaker_tag = self._get_speaker_tag_field(segment=segment, previous_segment=previous_segment)
         previous_segment, text = self._get_text_field(segment=segment, previous_segment=previous_segment)
-        start, end = self._get_interval_field(segment=segment, tx_data=tx_data)
+        start, end = self._get_interval_field(segment=segment, last_segment=last_segment)
         new_segment = Segment(speaker_tag=speaker_tag, text=text, start=start, end=end, file=segment.file, size=segment.size, eol=segment.eol)
         return previous_segment, new_segment
 
     @staticmethod
-    def aggregate_segments(segments: List[Segment]) -> List[TxDataGroup]:
-        logger.info("Aggregating Segments based on filename.")
-        tx_group = {}
-        for s in segments:
-            if s.file not in tx_group:
-                tx_group[s.file] = {"tx_data": [], "duration": 0}
+    def aggregate_segments(segments: Iterable[Segment], debug_log: Optional[SampledDebugLog] = None) -> List[TxDataGroup]:
+        debug_log = debug_log or _QUIET_LOG
+        debug_log.info("Aggregating Segments based on filename.")
+        with span(name="aggregate_segments") as current_span:
+            tx_group = {}
+            for s in segments:
+                if s.file not in tx_group:
+                    tx_group[s.file] = {"tx_data": [], "duration": 0}
 
-            tx_data = TxData(speaker_tag=s.speaker_tag, text=s.text, start=s.start, end=s.end)
-            tx_group[s.file]["duration"] += s.end - s.start
-            tx_group[s.file]["tx_data"].append(tx_data)
-            logger.debug(f"Aggregated Segment: {tx_data}")
+                tx_data = TxData(speaker_tag=s.speaker_tag, text=s.text, start=s.start, end=s.end)
+                tx_group[s.file]["duration"] += s.end - s.start
+                tx_group[s.file]["tx_data"].append(tx_data)
+                debug_log.log("Aggregated Segment: {}", tx_data)
+                current_span.records_in += 1
+            current_span.records_out = len(tx_group)
         return [TxDataGroup(file=filepath, tx_data=tx_group[filepath]["tx_data"]) for filepath in tx_group]
 
+    @staticmethod
+    def iter_aggregated_segments(segments: Iterable[Segment]) -> Iterator[TxDataGroup]:
+        filepath, tx_data, aggregated_files = None, [], set()
+        for s in segments:
+            if s.file != filepath:
+                if s.file in aggregated_files:
+                    raise ValueError(f"Segments of {s.file} are not contiguous, aggregate them with aggregate_segments instead.")
+                if tx_data:
+                    yield TxDataGroup(file=filepath, tx_data=tx_data)
+                    tx_data = []
+                aggregated_files.add(s.file)
+
+            filepath = s.file
+            tx_data.append(TxData(speaker_tag=s.speaker_tag, text=s.text, start=s.start, end=s.end))
+
+        if tx_data:
+            yield TxDataGroup(file=filepath, tx_data=tx_data)
+
+    @staticmethod
+    def iter_regrouped_segments(segments: Iterable[Segment]) -> Iterator[TxDataGroup]:
+        # Spilled into a temporary on-disk database, so only one audio file is held in memory while the segments are grouped in the order of their first appearance.
+        con = sqlite3.connect("")
+        try:
+            con.execute(
+                'CREATE TABLE segments (file_index INTEGER, segment_index INTEGER, speaker_tag TEXT, text TEXT, start INTEGER, "end" INTEGER, '
+                "PRIMARY KEY (file_index, segment_index)) WITHOUT ROWID"
+            )
+            file_indexes = {}
+            rows = ((file_indexes.setdefault(s.file, len(file_indexes)), i, s.speaker_tag, s.text, s.start, s.end) for i, s in enumerate(segments))
+            for batch in iter_micro_batches(iterable=rows, size=_SPILL_BATCH_SIZE):
+                con.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+            files = list(file_indexes)
+            rows = con.execute('SELECT file_index, speaker_tag, text, start, "end" FROM segments ORDER BY file_index, segment_index')
+            for file_index, file_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                yield TxDataGroup(file=files[file_index], tx_data=[TxData(speaker_tag=row[1], text=row[2], start=row[3], end=row[4]) for row in file_rows])
+        finally:
+            con.close()
+
+    @staticmethod
+    def merge_tx_data_groups(tx_data_groups: Iterable[TxDataGroup]) -> List[TxDataGroup]:
+        tx_group = {}
+        for group in tx_data_groups:
+            tx_group.setdefault(group.file, []).extend(group.tx_data)
+        return [TxDataGroup(file=filepath, tx_data=tx_group[filepath]) for filepath in tx_group]
+
 
 class TextExtractParser(Processor):
-    def __init__(self, segment_processor: SegmentProcessor, verbose: Optional[bool] = False):
-        super().__init__(verbose=verbose)
+    def __init__(self, segment_processor: SegmentProcessor, verbose: Optional[bool] = False, memory_map: Optional[bool] = False, log_every: Optional[int] = 1):
+        super().__init__(verbose=verbose, log_every=log_every)
         self.segment_processor = segment_processor
-        if not self.verbose:
-            logger.disable("transform.text_extract")
+        self.memory_map = memory_map
 
     def execute(self, file: Union[str, Path]) -> List[TxDataGroup]:
-        logger.info(f"Parsing transcriptions from {file}.")
-        text = self._get_text_to_process(file=file)
-        timed_transcriptions = self.parse_timed_transcriptions(text=text)
-        segments = self.convert_to_segments(extracted_transcriptions=timed_transcriptions)
+        self.debug_log.info("Parsing transcriptions from {}.", file)
+        timed_transcriptions = self._parse_timed_transcriptions_from_file(file=file)
+        segments = self.convert_to_segments(extracted_transcriptions=timed_transcriptions, debug_log=self.debug_log)
         concatenated_segments = self.segment_processor.combine_and_measure_segments(segments=segments)
-        aggregated_tx_data = self.segment_processor.aggregate_segments(segments=concatenated_segments)
+        aggregated_tx_data = self.segment_processor.aggregate_segments(segments=concatenated_segments, debug_log=self.segment_processor.debug_log)
         return aggregated_tx_data
 
+    def stream(self, file: Union[str, Path]) -> Iterator[TxDataGroup]:
+        lines = self._iter_lines_to_process(file=file)
+        if not self.has_contiguous_audio_files(file=file):
+            logger.warning(f"The records of an audio file are interleaved in {file}, grouping them on disk before streaming its transcriptions.")
+            yield from iter_span(name="aggregate_segments", iterable=self.segment_processor.iter_regrouped_segments(segments=self._iter_combined_segments(lines=lines)))
+            return
+
+        self.debug_log.info("Streaming transcriptions from {}.", file)
+        yield from iter_span(name="aggregate_segments", iterable=self.segment_processor.iter_aggregated_segments(segments=self._iter_combined_segments(lines=lines)))
+
+    def execute_shard(self, shard: ExtractShard) -> List[TxDataGroup]:
+        self.debug_log.info("Parsing transcriptions from {} [{}:{}].", shard.file, shard.start, shard.end)
+        lines = self._iter_shard_lines_to_process(shard=shard)
+        return self.segment_processor.aggregate_segments(segments=self._iter_combined_segments(lines=lines), debug_log=self.segment_processor.debug_log)
+
+    def _iter_combined_segments(self, lines: Iterable[str]) -> Iterator[Segment]:
+        timed_transcriptions = iter_span(name="parse_timed_transcriptions", iterable=self.iter_timed_transcriptions(lines=lines))
+        segments = iter_span(name="convert_to_segments", iterable=self.iter_segments(extracted_transcriptions=timed_transcriptions, debug_log=self.debug_log))
+        return iter_span(name="combine_and_measure_segments", iterable=self.segment_processor.iter_combined_segments(segments=segments))
+
     @staticmethod
-    def _get_text_to_process(file: Union[str, Path]) -> str:
+    def has_contiguous_audio_files(file: Union[str, Path]) -> bool:
+        audio_file, seen_audio_files = None, set()
+        with open(file=file, mode="rb") as f:
+            for line in f:
+                if not line.startswith(b"FILE:"):
+                    continue
+
+                next_audio_file = line.split(b":", 1)[1].strip()
+                if next_audio_file != audio_file:
+                    if next_audio_file in seen_audio_files:
+                        return False
+                    seen_audio_files.add(next_audio_file)
+                    audio_file = next_audio_file
+        return True
+
+    @staticmethod
+    def split_into_shards(file: Union[str, Path], shard_size: int) -> List[ExtractShard]:
+        shards = []
+        shard_start, offset = 0, 0
+        audio_file, has_open_continuation = None, False
+        with open(file=file, mode="rb") as f:
+            for line in f:
+                if line.startswith(b"FILE:"):
+                    next_audio_file = line.split(b":", 1)[1].strip()
+                    is_audio_file_boundary = audio_file is not None and next_audio_file != audio_file
+                    if offset - shard_start >= shard_size and is_audio_file_boundary and not has_open_continuation:
+                        shards.append(ExtractShard(file=str(file), start=shard_start, end=offset))
+                        shard_start = offset
+                    audio_file = next_audio_file
+
+                elif line.startswith(b"TRANSCRIPTION:"):
+                    has_open_continuation = b"~" in line
+
+                offset += len(line)
+
+        shards.append(ExtractShard(file=str(file), start=shard_start, end=offset))
+        return shards
+
+    def _iter_shard_lines_to_process(self, shard: ExtractShard) -> Iterator[str]:
+        if self.memory_map:
+            yield from self._iter_memory_mapped_lines(file=shard.file, start=shard.start, end=shard.end)
+            return
+
+        with open(file=shard.file, mode="rb") as f:
+            f.seek(shard.start)
+            offset = shard.start
+            for line in f:
+                if offset >= shard.end:
+                    return
+                offset += len(line)
+                yield line.decode().replace("\r\n", "\n")
+
+    def _parse_timed_transcriptions_from_file(self, file: Union[str, Path]) -> List[ExtractedTranscription]:
+        if not self.memory_map:
+            with open(file=file) as f:
+                return self.parse_timed_transcriptions(text=f.read(), debug_log=self.debug_log)
+
+        with span(name="parse_timed_transcriptions") as current_span:
+            extracted_transcriptions = list(self.iter_timed_transcriptions(lines=self._iter_memory_mapped_lines(file=file)))
+            current_span.records_out, current_span.bytes = len(extracted_transcriptions), os.path.getsize(file)
+        self.debug_log.log("Extracted {} transcriptions.", len(extracted_transcriptions))
+        return extracted_transcriptions
+
+    def _iter_lines_to_process(self, file: Union[str, Path]) -> Iterator[str]:
+        if self.memory_map:
+            yield from self._iter_memory_mapped_lines(file=file)
+            return
+
         with open(file=file) as f:
-            return f.read()
+            yield from f
 
     @staticmethod
-    def parse_timed_transcriptions(text: str) -> List[ExtractedTranscription]:
-        pattern = r"FILE:\s?(?P<file>.+)\nINTERVAL:\s?(?P<interval>.+)\n(?P<transcription>TRANSCRIPTION:\s?.+\n)(?P<hypothesis>HYPOTHESIS:\s?.*\n)?LABELS:\s?(?P<labels>.*)?\nUSER:\s?(?P<user>.*)"  # noqa
-        extracted_transcriptions = [ExtractedTranscription.from_dict(x.groupdict()) for x in re.finditer(pattern, text)]
-        logger.debug(f"Extracted {len(extracted_transcriptions)} transcriptions.")
+    def _iter_memory_mapped_lines(file: Union[str, Path], start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        with open(file=file, mode="rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                mm.seek(start)
+                end = len(mm) if end is None else end
+                while mm.tell() < end:
+                    yield mm.readline().decode().replace("\r\n", "\n")
+
+    @classmethod
+    def parse_timed_transcriptions(cls, text: str, debug_log: Optional[SampledDebugLog] = None) -> List[ExtractedTranscription]:
+        with span(name="parse_timed_transcriptions") as current_span:
+            extracted_transcriptions = list(cls._extract_timed_transcriptions(text=text))
+            current_span.records_out, current_span.bytes = len(extracted_transcriptions), len(text)
+        (debug_log or _QUIET_LOG).log("Extracted {} transcriptions.", len(extracted_transcriptions))
         return extracted_transcriptions
 
     @classmethod
-    def convert_to_segments(cls, extracted_transcriptions: List[ExtractedTranscription]) -> List[Segment]:
-        logger.info("Parsing TX Fields from the Extracted Transcriptions.")
-        segments = []
-        for x in extracted_transcriptions:
-            transcriptions = cls.parse_and_process_transcriptions(text=x.transcription)
-            new_segments = cls.create_segments(extracted_transcription=x, segments=transcriptions)
-            segments.extend(new_segments)
-        logger.debug(f"Parsing {len(segments)} segments finished.")
+    def iter_timed_transcriptions(cls, lines: Iterable[str]) -> Iterator[ExtractedTranscription]:
+        block = []
+        for line in lines:
+            if line.startswith("FILE:") and block:
+                yield from cls._extract_timed_transcriptions(text="".join(block))
+                block = []
+            block.append(line)
+
+        if block:
+            yield from cls._extract_timed_transcriptions(text="".join(block))
+
+    @staticmethod
+    def _extract_timed_transcriptions(text: str) -> Iterator[ExtractedTranscription]:
+        return (ExtractedTranscription(**x) for x in iter_timed_transcription_groups(text=text))
+
+    @classmethod
+    def convert_to_segments(cls, extracted_transcriptions: Iterable[ExtractedTranscription], debug_log: Optional[SampledDebugLog] = None) -> List[Segment]:
+        debug_log = debug_log or _QUIET_LOG
+        debug_log.info("Parsing TX Fields from the Extracted Transcriptions.")
+        with span(name="convert_to_segments") as current_span:
+            segments = list(cls.iter_segments(extracted_transcriptions=extracted_transcriptions, debug_log=debug_log))
+            current_span.records_out = len(segments)
+        debug_log.log("Parsing {} segments finished.", len(segments))
         return segments
 
     @classmethod
-    def parse_and_process_transcriptions(cls, text: str) -> List[Transcription]:
-        pattern = r"(?P<speaker_tag>TRANSCRIPTION: (?!<\#.+>)|\<\#.+?\>)(?P<text>.+?)(?P<eol>\[\d+\.\d+\]|~|\n)"
-        transcriptions = [x.groupdict() for x in re.finditer(pattern, text)]
-        new_transcriptions = []
-        for x in transcriptions:
-            x["eol"] = cls.parse_and_convert_eol(duration=x["eol"])
-            x["size"] = len(transcriptions)
-            transcription = Transcription.from_dict(x)
-            new_transcriptions.append(transcription)
-            logger.debug(f"Parsed {transcription}...")
+    def iter_segments(cls, extracted_transcriptions: Iterable[ExtractedTranscription], debug_log: Optional[SampledDebugLog] = None) -> Iterator[Segment]:
+        for x in extracted_transcriptions:
+            transcriptions = cls.parse_and_process_transcriptions(text=x.transcription, debug_log=debug_log)
+            yield from cls.create_segments(extracted_transcription=x, segments=transcriptions, debug_log=debug_log)
+
+    @classmethod
+    def parse_and_process_transcriptions(cls, text: str, debug_log: Optional[SampledDebugLog] = None) -> List[Transcription]:
+        new_transcriptions = tokenize_transcription(text=text)
+        if debug_log is not None and debug_log.enabled:
+            for transcription in new_transcriptions:
+                debug_log.log("Parsed {}...", transcription)
         return new_transcriptions
 
     @classmethod
     def parse_and_convert_eol(cls, duration: str) -> Union[int, str]:
-        pattern = r"\[(\d+\.\d+)\]"
-        match = re.match(pattern, duration)
-        new_duration = int(float(match.groups()[0]) * 1000) if match else duration
-        return new_duration
+        return convert_eol_to_millisecond(duration=duration)
 
     @classmethod
-    def create_segments(cls, extracted_transcription: ExtractedTranscription, segments: List[Transcription]) -> List[Segment]:
+    def create_segments(cls, extracted_transcription: ExtractedTranscription, segments: List[Transcription], debug_log: Optional[SampledDebugLog] = None) -> List[Segment]:
+        debug_log = debug_log or _QUIET_LOG
         new_segments = []
         start_ms, end_ms = convert_interval_to_milliseconds(interval=extracted_transcription.interval)
+        file = extracted_transcription.file.strip()
         for s in segments:
-            s = Segment(**s.to_dict(), start=start_ms, end=end_ms, file=extracted_transcription.file.strip())
-            logger.debug(f"Segment created: {s}")
+            s = Segment(file=file, speaker_tag=s.speaker_tag, text=s.text, eol=s.eol, size=s.size, start=start_ms, end=end_ms)
+            debug_log.log("Segment created: {}", s)
             new_segments.append(s)
         return new_segments
@@ -0,0 +1,30 @@
+import re
+from typing import List, Union, Iterator
+
+from transcribe_etl.transform.helper import convert_seconds_to_millisecond
+from transcribe_etl.transform.model import Transcription
+
+TIMED_TRANSCRIPTION_PATTERN = re.compile(
+    r"FILE:\s?(?P<file>.+)\nINTERVAL:\s?(?P<interval>.+)\n(?P<transcription>TRANSCRIPTION:\s?.+\n)"
+    r"(?P<hypothesis>HYPOTHESIS:\s?.*\n)?LABELS:\s?(?P<labels>.*)?\nUSER:\s?(?P<user>.*)"
+)
+TRANSCRIPTION_PATTERN = re.compile(r"(TRANSCRIPTION: (?!<\#.+>)|\<\#.+?\>)(.+?)(?:\[(\d+)\.(\d+)\]|(~|\n))")
+DURATION_PATTERN = re.compile(r"\[(\d+)\.(\d+)\]")
+
+
+def tokenize_transcription(text: str) -> List[Transcription]:
+    tokens = [
+        (speaker_tag, token_text, eol if eol else convert_seconds_to_millisecond(seconds=seconds, fraction=fraction))
+        for speaker_tag, token_text, seconds, fraction, eol in TRANSCRIPTION_PATTERN.findall(text)
+    ]
+    size = len(tokens)
+    return [Transcription(speaker_tag=speaker_tag, text=token_text, eol=eol, size=size) for speaker_tag, token_text, eol in tokens]
+
+
+def iter_timed_transcription_groups(text: str) -> Iterator[dict]:
+    return (x.groupdict() for x in TIMED_TRANSCRIPTION_PATTERN.finditer(text))
+
+
+def convert_eol_to_millisecond(duration: str) -> Union[int, str]:
+    match = DURATION_PATTERN.match(duration)
+    return convert_seconds_to_millisecond(seconds=match.group(1), fraction=match.group(2)) if match else duration